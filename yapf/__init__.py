@@ -26,16 +26,23 @@ formatting decisions based on what's the best format for each line.
 If no filenames are specified, YAPF reads the code from stdin.
 """
 
-import argparse
-import logging
+import os
 import sys
 
 from yapf.yapflib import file_resources
 from yapf.yapflib import py3compat
+from yapf.yapflib import style
 from yapf.yapflib import yapf_api
 
+# Most runs format a file or two, and the time they take is dominated by
+# starting up. Modules that only some runs need are therefore imported where
+# they are used, rather than here.
+
 __version__ = '0.1'
 
+# The ignore file that is read if --ignore-file isn't given.
+_DEFAULT_IGNORE_FILE = '.yapfignore'
+
 
 def main(argv):
   """Main program.
@@ -46,11 +53,16 @@ def main(argv):
   Returns:
     0 if there were no errors, non-zero otherwise.
   """
-  parser = argparse.ArgumentParser(description='Formatter for Python code.')
+  import argparse  # pylint: disable=g-import-not-at-top
+
+  parser = argparse.ArgumentParser(description='Formatter for Python code.',
+                                   fromfile_prefix_chars='@')
   parser.add_argument(
-      '--style', action='store', default=None,
+      '--style', action='append', default=None,
       help=('specify formatting style: either a style name (for example "pep8" '
-            'or "google"), or the name of a file with style settings'))
+            'or "google"), or the name of a file with style settings. Give it '
+            'more than once to check or diff the code against each style, '
+            'parsing it only once'))
   diff_inplace_group = parser.add_mutually_exclusive_group()
   diff_inplace_group.add_argument(
       '-d', '--diff', action='store_true',
@@ -58,6 +70,13 @@ def main(argv):
   diff_inplace_group.add_argument(
       '-i', '--in-place', action='store_true',
       help='make changes to files in place')
+  diff_inplace_group.add_argument(
+      '--check', action='store_true',
+      help=('don\'t change anything, but list the files that aren\'t '
+            'formatted and exit with a non-zero status if there are any'))
+  parser.add_argument(
+      '--fail-fast', action='store_true',
+      help='with --check, stop at the first file that isn\'t formatted')
 
   lines_recursive_group = parser.add_mutually_exclusive_group()
   lines_recursive_group.add_argument(
@@ -66,45 +85,255 @@ def main(argv):
   lines_recursive_group.add_argument(
       '-r', '--recursive', action='store_true',
       help='run recursively over directories')
+  lines_recursive_group.add_argument(
+      '--diff-base', metavar='REV', action='store', default=None,
+      help=('reformat only the lines that changed since the git revision REV, '
+            'in the given files and directories or the whole working tree'))
+
+  parser.add_argument(
+      '-e', '--exclude', metavar='PATTERN', action='append', default=None,
+      help=('leave out files and directories matching PATTERN, which has the '
+            'syntax of a .gitignore line; excluded directories are not '
+            'searched'))
+  parser.add_argument(
+      '--ignore-file', metavar='FILE', action='store', default=None,
+      help=('read exclude patterns from FILE, which has the syntax of a '
+            '.gitignore file (default: {0}, if it exists)'.format(
+                _DEFAULT_IGNORE_FILE)))
+  parser.add_argument(
+      '--files-from', metavar='FILE', action='store', default=None,
+      help=('read the names of the files to format from FILE, one per line, '
+            'or from stdin if FILE is "-"'))
+
+  parser.add_argument(
+      '-j', '--jobs', type=int, default=1,
+      help=('number of processes to use; 0 uses one process per CPU. A single '
+            'file has its longer lines formatted in parallel'))
+
+  cache_group = parser.add_mutually_exclusive_group()
+  cache_group.add_argument(
+      '--cache-dir', action='store', default=None,
+      help=('directory to cache formatting results in (default: {0})'.format(
+          file_resources.GetDefaultCacheDirectory())))
+  cache_group.add_argument(
+      '--no-cache', action='store_true',
+      help='always format the code, without consulting the cache')
+
+  daemon_group = parser.add_mutually_exclusive_group()
+  daemon_group.add_argument(
+      '--serve', action='store_true',
+      help=('run as a daemon that keeps the formatter loaded and serves '
+            'format requests over a Unix domain socket'))
+  daemon_group.add_argument(
+      '--use-daemon', action='store_true',
+      help=('format the code read from stdin through the daemon, if one is '
+            'running'))
+  parser.add_argument(
+      '--socket', action='store', default=None,
+      help=('the Unix domain socket of the daemon (default: yapf/daemon.sock '
+            'in $XDG_RUNTIME_DIR or in the cache directory)'))
+
+  parser.add_argument(
+      '--stdin-batch', choices=file_resources.FRAMINGS, default=None,
+      help=('read any number of documents from stdin and write each one '
+            'formatted to stdout: "length" frames each document with its size '
+            'in bytes and a newline, "nul" ends each one with a NUL byte'))
 
   parser.add_argument('files', nargs=argparse.REMAINDER)
-  args = parser.parse_args()
+  args = parser.parse_args(argv[1:])
 
   if args.lines and len(args.files) > 1:
     parser.error('cannot use -l/--lines with more than one file')
+  if args.jobs < 0:
+    parser.error('-j/--jobs must not be negative')
+  if args.fail_fast and not args.check:
+    parser.error('--fail-fast only works with --check')
+  style_configs = args.style or [None]
+  if len(style_configs) > 1:
+    if not (args.diff or args.check):
+      parser.error('use --diff or --check with more than one --style')
+    if args.serve or args.use_daemon or args.stdin_batch:
+      parser.error('cannot use more than one --style with --serve, '
+                   '--use-daemon or --stdin-batch')
+  style_config = style_configs[-1]
 
   lines = _GetLines(args.lines) if args.lines is not None else None
-  files = file_resources.GetCommandLineFiles(argv[1:], args.recursive)
+  cache = None
+  if not args.no_cache:
+    cache_dir = args.cache_dir or file_resources.GetDefaultCacheDirectory()
+    from yapf.yapflib import grammar_cache  # pylint: disable=g-import-not-at-top
+    from yapf.yapflib import result_cache  # pylint: disable=g-import-not-at-top
+    grammar_cache.SetCacheDirectory(cache_dir)
+    cache = result_cache.ResultCache(os.path.join(cache_dir, 'results'),
+                                     __version__)
+
+  if args.serve:
+    from yapf.yapflib import daemon  # pylint: disable=g-import-not-at-top
+    try:
+      daemon.Serve(args.socket, cache=cache)
+    except KeyboardInterrupt:
+      pass
+    return 0
+
+  filenames = args.files
+  exclude = args.exclude or []
+  try:
+    if args.files_from:
+      filenames = filenames + file_resources.ReadFileList(args.files_from)
+    ignore_file = args.ignore_file
+    if ignore_file is None and os.path.isfile(_DEFAULT_IGNORE_FILE):
+      ignore_file = _DEFAULT_IGNORE_FILE
+
+    if args.diff_base:
+      from yapf.yapflib import git_diff  # pylint: disable=g-import-not-at-top
+      try:
+        lines = git_diff.GetChangedLines(args.diff_base, filenames)
+      except git_diff.Error as err:
+        sys.stderr.write('yapf: {0}\n'.format(err))
+        return 1
+      files = file_resources.GetCommandLineFiles(sorted(lines), False,
+                                                 exclude=exclude,
+                                                 ignore_file=ignore_file)
+      if not files:
+        return 0
+    else:
+      files = file_resources.GetCommandLineFiles(filenames, args.recursive,
+                                                 exclude=exclude,
+                                                 ignore_file=ignore_file)
+      if args.files_from and not files:
+        # Don't go on to read code from stdin.
+        return 0
+  except IOError as err:
+    sys.stderr.write('yapf: {0}\n'.format(err))
+    return 1
+  if files and args.use_daemon:
+    parser.error('--use-daemon only works when reading from stdin')
+  if files and args.stdin_batch:
+    parser.error('cannot use --stdin-batch with files')
   if not files:
     # No arguments specified. Read code from stdin.
     if args.in_place or args.diff:
       parser.error('cannot use --in_place or --diff flags when reading '
                    'from stdin')
 
-    original_source = []
-    while True:
-      try:
-        # Use 'raw_input' instead of 'sys.stdin.read', because otherwise the
-        # user will need to hit 'Ctrl-D' more than once if they're inputting
-        # the program by hand. 'raw_input' throws an EOFError exception if
-        # 'Ctrl-D' is pressed, which makes it easy to bail out of this loop.
-        original_source.append(py3compat.raw_input())
-      except EOFError:
-        break
-    sys.stdout.write(yapf_api.FormatCode(
-        py3compat.unicode('\n'.join(original_source) + '\n'),
-        filename='<stdin>',
-        style_config=args.style,
-        lines=lines))
+    if args.check:
+      if args.stdin_batch or args.use_daemon:
+        parser.error('cannot use --check with --stdin-batch or --use-daemon')
+      if len(style_configs) > 1:
+        return 0 if FormatFilesWithStyles(['-'], lines, style_configs,
+                                          check=True, cache=cache) else 1
+      if yapf_api.CheckCode(file_resources.ReadStdin(),
+                            style_config=style_config, lines=lines,
+                            cache=cache):
+        return 0
+      sys.stdout.write('<stdin>\n')
+      return 1
+
+    if args.stdin_batch:
+      if args.lines:
+        parser.error('cannot use -l/--lines with --stdin-batch')
+      return _FormatDocuments(args.stdin_batch, style_config, cache,
+                              args.socket if args.use_daemon else None)
+
+    original_source = file_resources.ReadStdin()
+    if args.use_daemon:
+      from yapf.yapflib import daemon  # pylint: disable=g-import-not-at-top
+      reformatted_source = daemon.FormatCode(original_source,
+                                             filename='<stdin>',
+                                             style_config=style_config,
+                                             lines=lines,
+                                             socket_path=args.socket)
+    else:
+      reformatted_source = yapf_api.FormatCode(original_source,
+                                               filename='<stdin>',
+                                               style_config=style_config,
+                                               lines=lines,
+                                               cache=cache)
+    sys.stdout.write(reformatted_source)
     return 0
 
-  FormatFiles(files, lines, style_config=args.style, in_place=args.in_place,
-              print_diff=args.diff)
-  return 0
+  if len(style_configs) > 1:
+    success = FormatFilesWithStyles(files, lines, style_configs,
+                                    print_diff=args.diff, check=args.check,
+                                    fail_fast=args.fail_fast, cache=cache)
+    if cache is not None:
+      cache.Prune()
+    return 0 if success else 1
+
+  index = None
+  if (cache is not None and lines is None and
+      (args.in_place or args.diff or args.check)):
+    # Files are only skipped when nothing is printed for clean files, and the
+    # files are only known to be clean when they were formatted in full.
+    from yapf.yapflib import file_index  # pylint: disable=g-import-not-at-top
+    index = file_index.FileIndex(
+        os.path.join(cache_dir, 'clean-files.index'),
+        style.CreateStyleFromConfig(style_config), __version__)
+
+  success = FormatFiles(files, lines, style_config=style_config,
+                        in_place=args.in_place, print_diff=args.diff,
+                        check=args.check, fail_fast=args.fail_fast,
+                        jobs=args.jobs, cache=cache, index=index)
+  if index is not None:
+    index.Save()
+  if cache is not None:
+    cache.Prune()
+  return 0 if success else 1
+
+
+def _FormatDocuments(framing, style_config, cache, socket_path):
+  """Format the framed documents read from stdin.
+
+  Each result is written to stdout as soon as it's ready. A document that
+  can't be formatted produces an error frame with 'length' framing. With
+  'nul' framing, it's echoed unchanged and the error is written to stderr.
+
+  Arguments:
+    framing: (string) One of file_resources.FRAMINGS.
+    style_config: (string) Style name or file path.
+    cache: (result_cache.ResultCache) A cache of formatting results, or None.
+    socket_path: (unicode) The socket of the daemon to format the documents
+      through, or None to format them in this process.
+
+  Returns:
+    0 if all documents were formatted, 1 otherwise.
+  """
+  if socket_path is None:
+    formatter = yapf_api.Formatter(style_config, cache=cache)
+  stdout = file_resources.GetBinaryStdout()
+  status = 0
+  try:
+    for number, source in enumerate(
+        file_resources.ReadDocuments(file_resources.GetBinaryStdin(),
+                                     framing)):
+      filename = '<stdin:{0}>'.format(number)
+      try:
+        if socket_path is not None:
+          from yapf.yapflib import daemon  # pylint: disable=g-import-not-at-top
+          code = daemon.FormatCode(source, filename=filename,
+                                   style_config=style_config,
+                                   socket_path=socket_path)
+        else:
+          code = formatter.FormatCode(source, filename=filename)
+      except Exception as err:  # pylint: disable=broad-except
+        status = 1
+        message = '{0}: {1}: {2}'.format(filename, type(err).__name__, err)
+        if framing == 'length':
+          file_resources.WriteDocument(stdout, message, framing, error=True)
+        else:
+          sys.stderr.write('yapf: {0}\n'.format(message))
+          file_resources.WriteDocument(stdout, source, framing)
+        continue
+      file_resources.WriteDocument(stdout, code, framing)
+  except ValueError as err:
+    sys.stderr.write('yapf: {0}\n'.format(err))
+    return 1
+  return status
 
 
 def FormatFiles(filenames, lines, style_config=None, in_place=False,
-                print_diff=False):
+                print_diff=False, check=False, fail_fast=False, jobs=1,
+                cache=None, index=None):
   """Format a list of files.
 
   Arguments:
@@ -112,18 +341,295 @@ def FormatFiles(filenames, lines, style_config=None, in_place=False,
     lines: (list of tuples of integers) A list of tuples of lines, [start, end],
       that we want to format. The lines are 1-based indexed. This argument
       overrides the 'args.lines'. It can be used by third-party code (e.g.,
-      IDEs) when reformatting a snippet of code.
+      IDEs) when reformatting a snippet of code. It may also be a dict mapping
+      each file name to the lines to format in that file.
     style_config: (string) Style name or file path.
     in_place: (bool) Modify the files in place.
     print_diff: (bool) Instead of returning the reformatted source, return a
       diff that turns the formatted source into reformatter source.
+    check: (bool) Don't change or print any code. Instead, print the names of
+      the files that aren't formatted.
+    fail_fast: (bool) With 'check', stop at the first file that isn't
+      formatted.
+    jobs: (int) The number of processes to format the files with. If 0, use
+      one process per CPU. The output is emitted in the order of 'filenames'
+      no matter how many processes are used. A single file is formatted with
+      the lines that take longest spread over the processes.
+    cache: (result_cache.ResultCache) A cache of formatting results, or None.
+    index: (file_index.FileIndex) An index of the files known to be clean.
+      These files are skipped without being read. Only use an index if clean
+      files produce no output, i.e. with 'in_place', 'print_diff', or
+      'check'. If None, every file is formatted.
+
+  Returns:
+    True if all of the files were formatted successfully, False otherwise. With
+    'check', False is also returned if any file isn't formatted. A file that
+    can't be formatted is reported on stderr, and doesn't stop the other files
+    from being formatted.
+  """
+  if index is not None:
+    filenames = [f for f in filenames if not index.IsClean(f)]
+  # Resolve the style once, rather than for every file.
+  style_config = style.CreateStyleFromConfig(style_config)
+
+  if jobs == 0:
+    import multiprocessing  # pylint: disable=g-import-not-at-top
+    jobs = multiprocessing.cpu_count()
+  if jobs > 1 and len(filenames) > 1:
+    return _FormatFilesInParallel(filenames, lines, style_config, in_place,
+                                  print_diff, check, fail_fast, jobs, cache,
+                                  index)
+
+  pool = None
+  if jobs > 1 and filenames and not check:
+    # With a single file, use the processes to format its lines instead.
+    pool = _CreatePool(jobs)
+
+  success = True
+  try:
+    for filename in filenames:
+      _LogInfo('Reformatting %s', filename)
+      reformatted_code, clean, error = _TryFormatFile(
+          filename, _GetFileLines(lines, filename), style_config, in_place,
+          print_diff, check, cache, pool)
+      if error is not None:
+        _ReportError(filename, error)
+        success = False
+        continue
+      if reformatted_code is not None:
+        file_resources.WriteReformattedCode(filename, reformatted_code,
+                                            in_place=False)
+      if clean and index is not None:
+        index.MarkClean(filename)
+      if check and not clean:
+        _ReportUnformattedFile(filename)
+        success = False
+        if fail_fast:
+          break
+  finally:
+    if pool is not None:
+      pool.terminate()
+      pool.join()
+  return success
+
+
+def FormatFilesWithStyles(filenames, lines, style_configs, print_diff=False,
+                          check=False, fail_fast=False, cache=None):
+  """Check or diff a list of files against each of several styles.
+
+  Each file is parsed only once, however many styles there are.
+
+  Arguments:
+    filenames: (list of unicode) A list of files to reformat. '-' stands for
+      stdin.
+    lines: see FormatFiles().
+    style_configs: (list of string) Style names or file paths.
+    print_diff: (bool) Print the diff for each style that would change a file.
+      The file in each diff is followed by the style in parentheses.
+    check: (bool) Instead of printing diffs, print the name of each file that
+      isn't formatted, followed by the style in parentheses.
+    fail_fast: (bool) With 'check', stop at the first file that isn't
+      formatted in some style.
+    cache: (result_cache.ResultCache) A cache of formatting results, or None.
+
+  Returns:
+    True if all of the files were formatted successfully, False otherwise. With
+    'check', False is also returned if any file isn't formatted in any style.
   """
+  success = True
   for filename in filenames:
-    logging.info('Reformatting %s', filename)
-    reformatted_code = yapf_api.FormatFile(
-        filename, style_config=style_config, lines=lines, print_diff=print_diff)
-    if reformatted_code is not None:
-      file_resources.WriteReformattedCode(filename, reformatted_code, in_place)
+    _LogInfo('Reformatting %s', filename)
+    if filename == '-':
+      filename = '<stdin>'
+      original_source = file_resources.ReadStdin()
+    else:
+      original_source = yapf_api.ReadFile(filename, _LogWarning)
+      if original_source is None:
+        continue
+    results = yapf_api.FormatCodeWithStyles(
+        original_source, style_configs, filename=filename,
+        lines=_GetFileLines(lines, filename), print_diff=print_diff or check,
+        cache=cache)
+    for style_config, diff in zip(style_configs, results):
+      if not diff:
+        continue
+      if check:
+        _ReportUnformattedFile('{0} ({1})'.format(filename, style_config))
+        success = False
+        if fail_fast:
+          return success
+      else:
+        file_resources.WriteReformattedCode(filename, diff, in_place=False)
+  return success
+
+
+def _FormatFile(filename, lines, style_config, in_place, print_diff, check,
+                cache, pool=None):
+  """Format a single file.
+
+  Arguments:
+    filename: (unicode) The file to reformat.
+    lines, style_config, in_place, print_diff, check, cache: see
+      FormatFiles().
+    pool: (multiprocessing.Pool) A pool to search for the formatting of the
+      file's lines in, or None.
+
+  Returns:
+    A tuple of the code that should be written to stdout (or None) and a
+    boolean saying whether the file was already formatted.
+  """
+  original_source = yapf_api.ReadFile(filename, _LogWarning)
+  if original_source is None:
+    return None, False
+
+  if check:
+    return None, yapf_api.CheckCode(original_source, style_config=style_config,
+                                    lines=lines, cache=cache)
+
+  formatter = yapf_api.Formatter(style_config, cache=cache, pool=pool)
+  reformatted_code = formatter.FormatCode(original_source, filename=filename,
+                                          lines=lines, print_diff=print_diff)
+  if print_diff:
+    clean = not reformatted_code
+  else:
+    clean = reformatted_code == original_source
+
+  if in_place:
+    if not clean:
+      file_resources.WriteReformattedCode(filename, reformatted_code,
+                                          in_place=True)
+    return None, clean
+  return reformatted_code, clean
+
+
+def _TryFormatFile(filename, lines, style_config, in_place, print_diff, check,
+                   cache, pool=None):
+  """Format a single file, catching the errors that formatting it raises.
+
+  Arguments:
+    filename, lines, style_config, in_place, print_diff, check, cache, pool:
+      see _FormatFile().
+
+  Returns:
+    A tuple of the code that should be written to stdout (or None), whether
+    the file was already formatted, and an error message (or None).
+  """
+  try:
+    reformatted_code, clean = _FormatFile(filename, lines, style_config,
+                                          in_place, print_diff, check, cache,
+                                          pool)
+  except Exception as err:  # pylint: disable=broad-except
+    return None, False, '{0}: {1}'.format(type(err).__name__, err)
+  return reformatted_code, clean, None
+
+
+def _LogInfo(msg, *args):
+  # If logging hasn't been imported, it can't have been set up to show info
+  # messages, so there is no need to import it.
+  logging = sys.modules.get('logging')
+  if logging is not None:
+    logging.info(msg, *args)
+
+
+def _LogWarning(msg):
+  import logging  # pylint: disable=g-import-not-at-top
+  logging.warning(msg)
+
+
+def _ReportError(filename, error):
+  sys.stderr.write('yapf: {0}: {1}\n'.format(filename, error))
+  sys.stderr.flush()
+
+
+def _ReportUnformattedFile(filename):
+  sys.stdout.write(py3compat.EncodeForStdout(filename + '\n'))
+  sys.stdout.flush()
+
+
+def _FormatFilesInParallel(filenames, lines, style_config, in_place,
+                           print_diff, check, fail_fast, jobs, cache, index):
+  """Format a list of files using a pool of worker processes.
+
+  The files are handed out to the workers in chunks. The results are collected
+  in the order of 'filenames', so that what is written to stdout doesn't depend
+  on which worker finishes first. An error in one file is reported and doesn't
+  stop the other files from being formatted.
+
+  Arguments:
+    filenames, lines, style_config, in_place, print_diff, check, fail_fast,
+      cache, index: see FormatFiles().
+    jobs: (int) The number of worker processes.
+
+  Returns:
+    True if all of the files were formatted successfully, False otherwise.
+  """
+  tasks = [(filename, _GetFileLines(lines, filename), style_config, in_place,
+            print_diff, check, cache) for filename in filenames]
+  # Small chunks keep the workers evenly loaded when file sizes vary, while
+  # still amortizing the cost of sending the tasks over to the workers.
+  chunksize = max(1, min(16, len(tasks) // (jobs * 4)))
+
+  success = True
+  pool = _CreatePool(jobs)
+  try:
+    for filename, reformatted_code, clean, error in pool.imap(
+        _FormatFileWorker, tasks, chunksize):
+      if error is not None:
+        _ReportError(filename, error)
+        success = False
+        continue
+      if reformatted_code is not None:
+        file_resources.WriteReformattedCode(filename, reformatted_code,
+                                            in_place=False)
+      if clean and index is not None:
+        index.MarkClean(filename)
+      if check and not clean:
+        _ReportUnformattedFile(filename)
+        success = False
+        if fail_fast:
+          # Don't wait for the files that are still being checked.
+          pool.terminate()
+          return success
+    pool.close()
+  except BaseException:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+  return success
+
+
+def _CreatePool(jobs):
+  """Create a pool of worker processes that parse like this process does."""
+  import multiprocessing  # pylint: disable=g-import-not-at-top
+  from yapf.yapflib import grammar_cache  # pylint: disable=g-import-not-at-top
+  # Workers that are spawned rather than forked don't inherit the setting.
+  return multiprocessing.Pool(jobs, grammar_cache.SetCacheDirectory,
+                              (grammar_cache.GetCacheDirectory(),))
+
+
+def _FormatFileWorker(task):
+  """Format a single file in a worker process.
+
+  Arguments:
+    task: (tuple) The filename, lines, style_config, in_place, print_diff,
+      check, and cache arguments of FormatFiles() for one file.
+
+  Returns:
+    A tuple of the filename, the code that should be written to stdout (or
+    None), whether the file was already formatted, and an error message (or
+    None). In-place changes are written by the worker, so that the parent
+    process doesn't have to serialize the I/O.
+  """
+  filename = task[0]
+  return (filename,) + _TryFormatFile(*task)
+
+
+def _GetFileLines(lines, filename):
+  """Return the lines to format in filename, given the 'lines' argument."""
+  if isinstance(lines, dict):
+    return lines[filename]
+  return lines
 
 
 def _GetLines(line_strings):
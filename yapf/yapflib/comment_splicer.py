@@ -21,7 +21,6 @@ making them easier to process.
   SpliceComments(): the main function exported by this module.
 """
 
-from lib2to3 import pygram
 from lib2to3 import pytree
 from lib2to3.pgen2 import token
 
@@ -171,7 +170,8 @@ def _CreateCommentsFromPrefix(comment_prefix, comment_lineno, standalone=False):
                                  value='\n'.join(comment_block).strip(),
                                  context=('', (new_lineno, 0)))
       comment_node = comment_leaf if not standalone else pytree.Node(
-          pygram.python_symbols.simple_stmt, [comment_leaf])
+          pytree_utils.GetPythonGrammar().symbol2number['simple_stmt'],
+          [comment_leaf])
       comments.append(comment_node)
 
     while index < len(lines) and not lines[index].lstrip():
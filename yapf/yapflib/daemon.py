@@ -0,0 +1,264 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A long-running formatter process and its client.
+
+Editors tend to run YAPF on every save. Most of the time of such a run goes to
+starting the interpreter, importing YAPF, and loading the grammar, rather than
+to formatting. The daemon does all of that once and then serves format
+requests over a Unix domain socket.
+
+Each message, in either direction, is a four byte big-endian length followed
+by that many bytes of UTF-8 encoded JSON. A request is an object with the
+keys:
+
+  source: (string) The code to format.
+  filename: (string) The name to use in diffs.
+  style: (string) The style name or style file, or null.
+  lines: (list of [start, end] pairs) The lines to format, or null.
+  print_diff: (bool) Return a diff instead of the reformatted code.
+
+The response is an object with either a 'code' key holding the result, or an
+'error' key holding a description of what went wrong. A connection may carry
+any number of requests.
+
+  Serve(): run the daemon.
+  FormatCode(): format code through the daemon, if one is running.
+"""
+
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+
+from yapf.yapflib import file_resources
+from yapf.yapflib import py3compat
+from yapf.yapflib import yapf_api
+
+if py3compat.PY3:
+  import socketserver  # pylint: disable=g-import-not-at-top
+else:
+  import SocketServer as socketserver  # pylint: disable=g-import-not-at-top
+
+_LENGTH = struct.Struct('>I')
+
+
+class Error(Exception):
+  """Raised when the daemon couldn't format the code."""
+  pass
+
+
+def GetDefaultSocketPath():
+  """Return the socket the daemon listens on, unless told otherwise."""
+  runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+  if runtime_dir:
+    return os.path.join(runtime_dir, 'yapf', 'daemon.sock')
+  return os.path.join(file_resources.GetDefaultCacheDirectory(), 'daemon.sock')
+
+
+def Serve(socket_path=None, cache=None):
+  """Serve format requests until interrupted.
+
+  Each connection is served in a thread of its own, so that a client that
+  keeps its connection open doesn't hold up the others. The requests are still
+  formatted one at a time: the formatter works with a global style, so they
+  can't be interleaved.
+
+  Arguments:
+    socket_path: (unicode) The Unix domain socket to listen on. If None, use
+      GetDefaultSocketPath().
+    cache: (result_cache.ResultCache) A cache of formatting results, or None.
+
+  Raises:
+    Error: if another daemon is already listening on the socket.
+  """
+  socket_path = socket_path or GetDefaultSocketPath()
+  if os.path.exists(socket_path):
+    if _Connect(socket_path) is not None:
+      raise Error('a daemon is already listening on {0}'.format(socket_path))
+    # Left behind by a daemon that didn't shut down cleanly.
+    os.remove(socket_path)
+  directory = os.path.dirname(socket_path)
+  if directory and not os.path.isdir(directory):
+    os.makedirs(directory)
+
+  # Load the grammar and warm up the formatter before accepting requests.
+  yapf_api.FormatCode(u'pass\n')
+
+  server = _Server(socket_path, _RequestHandler)
+  server.cache = cache
+  server.formatters = {}
+  server.lock = threading.Lock()
+  # Make sure the socket is removed when the daemon is killed.
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  try:
+    server.serve_forever()
+  finally:
+    server.server_close()
+    if os.path.exists(socket_path):
+      os.remove(socket_path)
+
+
+def FormatCode(unformatted_source, filename='<unknown>', style_config=None,
+               lines=None, print_diff=False, socket_path=None):
+  """Format a string of Python code through the daemon.
+
+  If no daemon is listening, the code is formatted in this process instead.
+
+  Arguments:
+    unformatted_source: (unicode) The code to format.
+    filename: (unicode) The name of the file being reformatted.
+    style_config, lines, print_diff: see yapf_api.
+    socket_path: (unicode) The socket the daemon listens on. If None, use
+      GetDefaultSocketPath().
+
+  Returns:
+    The code reformatted to conform to the desired formatting style.
+
+  Raises:
+    Error: if the daemon couldn't format the code.
+  """
+  conn = _Connect(socket_path or GetDefaultSocketPath())
+  if conn is None:
+    return yapf_api.FormatCode(unformatted_source, filename=filename,
+                               style_config=style_config, lines=lines,
+                               print_diff=print_diff)
+
+  if style_config is not None and os.path.exists(style_config):
+    # The daemon may be running in another directory.
+    style_config = os.path.abspath(style_config)
+  request = {
+      'source': unformatted_source,
+      'filename': filename,
+      'style': style_config,
+      'lines': lines,
+      'print_diff': print_diff,
+  }
+  try:
+    _SendMessage(conn, request)
+    response = _ReceiveMessage(conn)
+  finally:
+    conn.close()
+  if response is None:
+    raise Error('the daemon closed the connection')
+  if 'error' in response:
+    raise Error(response['error'])
+  return response['code']
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  """The daemon's server, which keeps a formatter for each style it has seen.
+
+  Only a thread holding 'lock' may format code or use the formatters.
+  """
+
+  # Don't wait for the clients that are still connected when shutting down.
+  daemon_threads = True
+
+  def GetFormatter(self, style_config):
+    """Return the formatter for style_config.
+
+    Style files are read again only once they are modified.
+
+    Arguments:
+      style_config: (unicode) A style name or a path to a style file, or None.
+
+    Returns:
+      A yapf_api.Formatter.
+    """
+    mtime = None
+    if style_config is not None and os.path.exists(style_config):
+      mtime = os.path.getmtime(style_config)
+    key = (style_config, mtime)
+    if key not in self.formatters:
+      self.formatters[key] = yapf_api.Formatter(style_config, cache=self.cache)
+    return self.formatters[key]
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+  """Handles all of the requests sent over one connection."""
+
+  def handle(self):
+    while True:
+      request = _ReceiveMessage(self.request)
+      if request is None:
+        return
+      try:
+        lines = request.get('lines')
+        if lines is not None:
+          lines = [tuple(line) for line in lines]
+        with self.server.lock:
+          formatter = self.server.GetFormatter(request.get('style'))
+          code = formatter.FormatCode(
+              request['source'],
+              filename=request.get('filename', '<unknown>'),
+              lines=lines,
+              print_diff=request.get('print_diff', False))
+        response = {'code': code}
+      except Exception as err:  # pylint: disable=broad-except
+        response = {'error': '{0}: {1}'.format(type(err).__name__, err)}
+      _SendMessage(self.request, response)
+
+
+def _Connect(socket_path):
+  """Connect to the daemon listening on socket_path.
+
+  Arguments:
+    socket_path: (unicode) The Unix domain socket.
+
+  Returns:
+    The connected socket, or None if no daemon is listening.
+  """
+  if not hasattr(socket, 'AF_UNIX'):
+    return None
+  conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    conn.connect(socket_path)
+  except socket.error:
+    conn.close()
+    return None
+  return conn
+
+
+def _SendMessage(conn, message):
+  data = json.dumps(message).encode('utf-8')
+  conn.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def _ReceiveMessage(conn):
+  """Receive one message from conn.
+
+  Returns:
+    The decoded message, or None if the connection was closed.
+  """
+  header = _ReceiveExactly(conn, _LENGTH.size)
+  if header is None:
+    return None
+  data = _ReceiveExactly(conn, _LENGTH.unpack(header)[0])
+  if data is None:
+    return None
+  return json.loads(data.decode('utf-8'))
+
+
+def _ReceiveExactly(conn, size):
+  chunks = []
+  while size:
+    chunk = conn.recv(min(size, 1 << 16))
+    if not chunk:
+      return None
+    chunks.append(chunk)
+    size -= len(chunk)
+  return b''.join(chunks)
@@ -0,0 +1,135 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""An index of the files that were already formatted.
+
+Looking a file up in the result cache means reading and hashing it. On a cold
+disk, doing that for every file of a large tree takes seconds. The index
+remembers the size, modification time, and inode of each file that YAPF last
+saw as clean, together with a hash of the settings it was formatted with. A
+file whose stat information and settings are unchanged is skipped without
+being opened.
+
+The whole index is kept in a single file, which is loaded once at the start of
+a run and rewritten atomically at its end.
+
+  FileIndex: the main class exported by this module.
+"""
+
+import hashlib
+import marshal
+import os
+import time
+
+from yapf.yapflib import file_resources
+from yapf.yapflib import result_cache
+
+# Bumped whenever the layout of the index file changes.
+_FORMAT_VERSION = 1
+
+# A file modified less than this many nanoseconds before it was found clean
+# isn't recorded. It could be modified again within the resolution of the
+# file system's timestamps without its stat information changing.
+_RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+
+class FileIndex(object):
+  """Maps file names to the stat information they had when they were clean."""
+
+  def __init__(self, path, style_config, version):
+    """Constructor.
+
+    Loads the index from path. A missing or unreadable index is treated as an
+    empty one.
+
+    Arguments:
+      path: (unicode) The name of the file holding the index.
+      style_config: (dict) The resolved style the files are formatted with.
+      version: (string) The version of YAPF.
+    """
+    self._path = path
+    hasher = hashlib.sha256()
+    hasher.update('{0}:{1}'.format(version,
+                                   result_cache.CodeFingerprint()).encode(
+                                       'utf-8'))
+    hasher.update(repr(sorted(style_config.items())).encode('utf-8'))
+    self._settings_hash = hasher.hexdigest()
+    self._entries = _Load(path)
+    self._modified = False
+
+  def IsClean(self, filename):
+    """Return True if filename is known to be formatted already."""
+    entry = self._entries.get(os.path.abspath(filename))
+    if entry is None:
+      return False
+    stat_info = _StatInfo(filename)
+    return (stat_info is not None and
+            entry == stat_info + (self._settings_hash,))
+
+  def MarkClean(self, filename):
+    """Record that filename is formatted.
+
+    Call this only after the file has been found to be clean, so that its
+    current stat information belongs to the clean contents.
+
+    Arguments:
+      filename: (unicode) The name of the file.
+    """
+    stat_info = _StatInfo(filename)
+    if stat_info is None:
+      return
+    if _Now() - stat_info[1] < _RACY_WINDOW_NS:
+      return
+    self._entries[os.path.abspath(filename)] = (
+        stat_info + (self._settings_hash,))
+    self._modified = True
+
+  def Save(self):
+    """Write the index back to disk, if it was changed."""
+    if not self._modified:
+      return
+    data = marshal.dumps((_FORMAT_VERSION, self._entries))
+    try:
+      file_resources.WriteFileAtomically(self._path, data)
+    except (IOError, OSError):
+      return
+    self._modified = False
+
+
+def _Load(path):
+  """Load the entries of the index file at path."""
+  try:
+    with open(path, 'rb') as fd:
+      version, entries = marshal.loads(fd.read())
+  except (IOError, OSError, EOFError, ValueError, TypeError):
+    return {}
+  if version != _FORMAT_VERSION or not isinstance(entries, dict):
+    return {}
+  return entries
+
+
+def _StatInfo(filename):
+  """Return the (size, mtime_ns, inode) of filename, or None."""
+  try:
+    stat = os.stat(filename)
+  except OSError:
+    return None
+  mtime_ns = getattr(stat, 'st_mtime_ns', None)
+  if mtime_ns is None:
+    mtime_ns = int(stat.st_mtime * 1e9)
+  return (stat.st_size, mtime_ns, stat.st_ino)
+
+
+def _Now():
+  """Return the current time in nanoseconds."""
+  return int(time.time() * 1e9)
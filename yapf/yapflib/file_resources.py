@@ -19,14 +19,103 @@ querying.
 
 import io
 import os
+import re
 import sys
 
 from yapf.yapflib import py3compat
 
+# The ways documents can be framed in a stream by ReadDocuments() and
+# WriteDocument(). 'length' prefixes each document with its size in bytes in
+# decimal followed by a newline; 'nul' ends each document with a NUL byte.
+FRAMINGS = ('length', 'nul')
 
-def GetCommandLineFiles(command_line_file_list, recursive):
-  """Return the list of files specified on the command line."""
-  return _FindFiles(command_line_file_list, recursive)
+# The size of the chunks NUL-framed streams are read in.
+_CHUNK_SIZE = 1 << 16
+
+
+def GetCommandLineFiles(command_line_file_list, recursive, exclude=None,
+                        ignore_file=None):
+  """Return the list of files specified on the command line.
+
+  Arguments:
+    command_line_file_list: (list of unicode) The files and directories given
+      on the command line.
+    recursive: (bool) Look for files in subdirectories too.
+    exclude: (list of string) Patterns of files and directories to leave out,
+      in the syntax of .gitignore files. Excluded directories aren't looked
+      into at all. Patterns with a slash in them are matched against the path
+      relative to the current directory.
+    ignore_file: (unicode) A file of more such patterns, or None. As in a
+      .gitignore file, the patterns with a slash in them are matched against
+      the path relative to the directory of the file. They come before those
+      of 'exclude'.
+
+  Returns:
+    The list of Python files.
+
+  Raises:
+    IOError: if the ignore file can't be read.
+  """
+  patterns = []
+  if ignore_file is not None:
+    patterns = _CompilePatterns(ReadPatternFile(ignore_file),
+                                os.path.dirname(os.path.abspath(ignore_file)))
+  patterns.extend(_CompilePatterns(exclude or [], os.getcwd()))
+  return _FindFiles(command_line_file_list, recursive, patterns)
+
+
+def ReadPatternFile(filename):
+  """Read the patterns of a .gitignore-style ignore file.
+
+  Arguments:
+    filename: (unicode) The name of the file.
+
+  Returns:
+    The list of patterns, without blank lines and comments.
+
+  Raises:
+    IOError: if the file can't be read.
+  """
+  with io.open(filename, mode='r', encoding='utf-8') as fd:
+    lines = [line.rstrip('\r\n') for line in fd]
+  patterns = []
+  for line in lines:
+    if not line.strip() or line.startswith('#'):
+      continue
+    # Trailing spaces are ignored, as they are by git.
+    patterns.append(line.rstrip(' '))
+  return patterns
+
+
+def ReadFileList(filename):
+  """Read a list of file names, one per line.
+
+  Arguments:
+    filename: (unicode) The name of the file, or '-' for stdin.
+
+  Returns:
+    The list of file names.
+
+  Raises:
+    IOError: if the file can't be read.
+  """
+  if filename == '-':
+    data = GetBinaryStdin().read()
+  else:
+    with io.open(filename, mode='rb') as fd:
+      data = fd.read()
+  return [line for line in data.decode('utf-8').splitlines() if line]
+
+
+def GetDefaultCacheDirectory():
+  """Return the directory YAPF keeps its caches in, unless told otherwise."""
+  cache_home = os.environ.get('XDG_CACHE_HOME')
+  if not cache_home:
+    if sys.platform.startswith('win') and os.environ.get('LOCALAPPDATA'):
+      cache_home = os.environ['LOCALAPPDATA']
+    else:
+      cache_home = os.path.join(os.path.expanduser('~'), '.cache')
+  return os.path.join(cache_home, 'yapf')
 
 
 def WriteReformattedCode(filename, reformatted_code, in_place):
@@ -49,27 +138,339 @@ def WriteReformattedCode(filename, reformatted_code, in_place):
     sys.stdout.write(py3compat.EncodeForStdout(reformatted_code))
 
 
-def _FindFiles(filenames, recursive):
+def ReadStdin():
+  """Read the code from stdin.
+
+  The whole of stdin is read at once as bytes, which is much faster for large
+  inputs than reading it line by line.
+
+  Returns:
+    The code as a unicode string, with universal newlines and ending in a
+    newline.
+  """
+  return _DecodeDocument(GetBinaryStdin().read())
+
+
+def ReadDocuments(stream, framing):
+  """Read the framed documents from a binary stream.
+
+  Documents are yielded as soon as they have been read in full, so that the
+  writer can wait for the result of each document before sending the next.
+
+  Arguments:
+    stream: A binary file object.
+    framing: (string) One of FRAMINGS.
+
+  Yields:
+    Each document, as returned by ReadStdin().
+
+  Raises:
+    ValueError: if the stream is not framed properly.
+  """
+  if framing == 'length':
+    while True:
+      header = stream.readline()
+      if not header:
+        return
+      try:
+        size = int(header)
+        if size < 0:
+          raise ValueError
+      except ValueError:
+        raise ValueError('invalid frame header: {0!r}'.format(header))
+      data = stream.read(size)
+      if len(data) != size:
+        raise ValueError('truncated document: expected {0} bytes'.format(size))
+      yield _DecodeDocument(data)
+  else:
+    pending = b''
+    while True:
+      chunk = stream.read1(_CHUNK_SIZE) if hasattr(
+          stream, 'read1') else stream.read(_CHUNK_SIZE)
+      if not chunk:
+        break
+      documents = (pending + chunk).split(b'\0')
+      pending = documents.pop()
+      for data in documents:
+        yield _DecodeDocument(data)
+    # The last document doesn't have to be terminated.
+    if pending:
+      yield _DecodeDocument(pending)
+
+
+def WriteDocument(stream, document, framing, error=False):
+  """Write a framed document to a binary stream.
+
+  Arguments:
+    stream: A binary file object.
+    document: (unicode) The document to write.
+    framing: (string) One of FRAMINGS.
+    error: (bool) The document is an error message rather than code. With
+      'length' framing, the size of an error message is prefixed with 'E'.
+      With 'nul' framing, error messages can't be told apart from code, so
+      they shouldn't be written.
+  """
+  data = document.encode('utf-8')
+  if framing == 'length':
+    header = '{0}{1}\n'.format('E' if error else '', len(data))
+    stream.write(header.encode('ascii') + data)
+  else:
+    stream.write(data + b'\0')
+  stream.flush()
+
+
+def GetBinaryStdout():
+  """Return a binary file object writing to stdout."""
+  return _BinaryStream(sys.stdout)
+
+
+def GetBinaryStdin():
+  """Return a binary file object reading from stdin."""
+  return _BinaryStream(sys.stdin)
+
+
+def _BinaryStream(stream):
+  # Python 3's standard streams are text streams wrapping binary ones.
+  return getattr(stream, 'buffer', stream)
+
+
+def _DecodeDocument(data):
+  """Decode the bytes of a document, normalizing its line endings."""
+  source = data.decode('utf-8')
+  source = source.replace(u'\r\n', u'\n').replace(u'\r', u'\n')
+  if not source.endswith(u'\n'):
+    source += u'\n'
+  return source
+
+
+def WriteFileAtomically(path, data):
+  """Write data to path so that readers never see a partial file.
+
+  The data is written to a temporary file in the same directory, which is then
+  renamed over path. The directory is created if it doesn't exist.
+
+  Arguments:
+    path: (unicode) The name of the file.
+    data: (bytes) The contents of the file.
+
+  Raises:
+    IOError, OSError: if the file couldn't be written.
+  """
+  import tempfile  # pylint: disable=g-import-not-at-top
+
+  directory = os.path.dirname(path)
+  if directory and not os.path.isdir(directory):
+    try:
+      os.makedirs(directory)
+    except OSError:
+      # Another process may have created it in the meantime.
+      if not os.path.isdir(directory):
+        raise
+  fd, temp_path = tempfile.mkstemp(dir=directory or None, prefix='.tmp')
+  try:
+    with io.open(fd, mode='wb') as temp_file:
+      temp_file.write(data)
+    os.rename(temp_path, path)
+  except (IOError, OSError):
+    if os.path.exists(temp_path):
+      os.remove(temp_path)
+    raise
+
+
+def _FindFiles(filenames, recursive, patterns):
   """Find all Python files."""
   python_files = []
   for filename in filenames:
+    if patterns and _IsExcluded(filename, os.path.isdir(filename), patterns):
+      continue
     if os.path.isdir(filename):
-      if recursive:
-        # TODO(morbo): Look into a version of os.walk that can handle recursion.
-        python_files.extend(os.path.join(dirpath, f)
-                            for dirpath, _, filelist in os.walk(filename)
-                            for f in filelist
-                            if IsPythonFile(os.path.join(dirpath, f)))
-      else:
-        python_files.extend(os.path.join(filename, f)
-                            for f in os.listdir(filename)
-                            if IsPythonFile(os.path.join(filename, f)))
+      python_files.extend(_FindPythonFilesInDirectory(filename, recursive,
+                                                      patterns))
     elif os.path.isfile(filename) and IsPythonFile(filename):
       python_files.append(filename)
 
   return python_files
 
 
+def _FindPythonFilesInDirectory(directory, recursive, patterns):
+  """Find the Python files in a directory.
+
+  The files of a directory come before the files of its subdirectories, as
+  with os.walk. Excluded subdirectories are pruned without being listed.
+
+  Arguments:
+    directory: (unicode) The directory to look in.
+    recursive: (bool) Look in subdirectories too.
+    patterns: (list of _Pattern) The compiled exclude patterns.
+
+  Returns:
+    The list of Python files.
+  """
+  python_files = []
+  directories = [directory]
+  while directories:
+    current = directories.pop()
+    subdirectories = []
+    for name, path, is_dir in _ListDirectory(current):
+      if patterns and _IsExcluded(path, is_dir, patterns):
+        continue
+      if is_dir:
+        subdirectories.append(path)
+      elif name.endswith('.py'):
+        python_files.append(path)
+    if recursive:
+      directories.extend(reversed(subdirectories))
+  return python_files
+
+
+def _ListDirectory(directory):
+  """List a directory, telling subdirectories apart from other entries.
+
+  Arguments:
+    directory: (unicode) The directory to list.
+
+  Returns:
+    A list of (name, path, is_dir) tuples. Symbolic links to directories
+    don't count as directories, so that they aren't followed.
+  """
+  if hasattr(os, 'scandir'):
+    # scandir() gets the type of each entry along with its name, saving a
+    # stat() call per entry on most systems.
+    try:
+      entries = list(os.scandir(directory))
+    except OSError:
+      return []
+    return [(entry.name, entry.path, entry.is_dir(follow_symlinks=False))
+            for entry in entries]
+
+  try:
+    names = os.listdir(directory)
+  except OSError:
+    return []
+  listing = []
+  for name in names:
+    path = os.path.join(directory, name)
+    listing.append((name, path,
+                    os.path.isdir(path) and not os.path.islink(path)))
+  return listing
+
+
+class _Pattern(object):
+  """A compiled pattern in the syntax of .gitignore files."""
+
+  def __init__(self, pattern, base):
+    """Constructor.
+
+    Arguments:
+      pattern: (string) The pattern.
+      base: (unicode) The absolute path of the directory that a pattern with a
+        slash in it is relative to.
+    """
+    self.negated = pattern.startswith('!')
+    if self.negated:
+      pattern = pattern[1:]
+    self.directories_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    # A pattern with a slash in it is matched against the path relative to
+    # 'base', a pattern without one against the name alone.
+    self.anchored = '/' in pattern
+    self.base = base
+    pattern = pattern.lstrip('/')
+    self.regex = re.compile(_TranslatePattern(pattern))
+
+
+def _CompilePatterns(patterns, base):
+  return [_Pattern(pattern, base) for pattern in patterns]
+
+
+def _TranslatePattern(pattern):
+  """Translate a pattern in the syntax of .gitignore files to a regex.
+
+  Unlike with fnmatch, '*' and '?' don't match a slash. '**/' matches any
+  number of directories, including none, and a trailing '/**' everything in a
+  directory.
+
+  Arguments:
+    pattern: (string) The pattern, without a leading or trailing slash.
+
+  Returns:
+    The regular expression, as a string.
+  """
+  parts = []
+  i = 0
+  n = len(pattern)
+  while i < n:
+    at_start = i == 0 or pattern[i - 1] == '/'
+    if at_start and pattern.startswith('**/', i):
+      parts.append('(?:.*/)?')
+      i += 3
+      continue
+    if at_start and pattern[i:] == '**':
+      parts.append('.*')
+      break
+    char = pattern[i]
+    i += 1
+    if char == '*':
+      parts.append('[^/]*')
+    elif char == '?':
+      parts.append('[^/]')
+    elif char == '\\' and i < n:
+      parts.append(re.escape(pattern[i]))
+      i += 1
+    elif char == '[':
+      end = i
+      if end < n and pattern[end] in '!^':
+        end += 1
+      if end < n and pattern[end] == ']':
+        end += 1
+      end = pattern.find(']', end)
+      if end < 0:
+        parts.append(re.escape(char))
+        continue
+      chars = pattern[i:end].replace('\\', '\\\\')
+      if chars[0] in '!^':
+        chars = '^' + chars[1:]
+      parts.append('[{0}]'.format(chars))
+      i = end + 1
+    else:
+      parts.append(re.escape(char))
+  return ''.join(parts) + r'\Z'
+
+
+def _IsExcluded(path, is_dir, patterns):
+  """Return True if the patterns exclude path.
+
+  As in .gitignore files, the last pattern matching the path decides, and
+  negated patterns include paths again.
+
+  Arguments:
+    path: (unicode) The path of the file or directory.
+    is_dir: (bool) The path is a directory.
+    patterns: (list of _Pattern) The compiled patterns.
+
+  Returns:
+    True if the path should be left out.
+  """
+  name = os.path.basename(os.path.normpath(path))
+  # The path relative to the base of each anchored pattern.
+  relative_paths = {}
+  excluded = False
+  for pattern in patterns:
+    if pattern.directories_only and not is_dir:
+      continue
+    if pattern.anchored:
+      target = relative_paths.get(pattern.base)
+      if target is None:
+        target = os.path.relpath(os.path.abspath(path), pattern.base)
+        target = target.replace(os.sep, '/')
+        relative_paths[pattern.base] = target
+    else:
+      target = name
+    if pattern.regex.match(target):
+      excluded = not pattern.negated
+  return excluded
+
+
 def IsPythonFile(filename):
   """Return True if filename is a Python file."""
   return os.path.splitext(filename)[1] == '.py'
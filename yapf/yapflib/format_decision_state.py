@@ -23,6 +23,12 @@ each decision needs to be its own unique copy.
 Once the heuristic determines the best formatting, it makes a non-dry run pass
 through the code to commit the whitespace formatting.
 
+The states of the enclosing brackets form a persistent stack: a linked list of
+_ParenStates that are never changed once another decision state can see them.
+Copying a decision state therefore copies none of them, and the copies share
+the brackets they have in common. A decision state that changes the innermost
+bracket's state copies just that one first.
+
   FormatDecisionState: main class exported by this module.
 """
 
@@ -48,8 +54,9 @@ class FormatDecisionState(object):
     newline: Indicates if a newline is added along the edge to this format
       decision state node.
     previous: The previous format decision state in the decision tree.
-    stack: A stack (of _ParenState) keeping track of properties applying to
-      parenthesis levels.
+    paren_state: The _ParenState of the innermost bracket, keeping track of
+      properties applying to its parenthesis level. The states of the
+      enclosing brackets are linked through its 'parent'.
     ignore_stack_for_comparison: Ignore the stack of _ParenState for state
       comparison.
   """
@@ -70,7 +77,9 @@ class FormatDecisionState(object):
     self.start_of_line_level = 0
     self.lowest_level_on_line = 0
     self.ignore_stack_for_comparison = False
-    self.stack = [_ParenState(first_indent, first_indent)]
+    self.paren_state = _ParenState(first_indent, first_indent)
+    # Whether 'paren_state' is seen by this state alone, and so may be changed.
+    self._owns_paren_state = True
     self.first_indent = first_indent
     self.newline = False
     self.previous = None
@@ -78,31 +87,43 @@ class FormatDecisionState(object):
 
   def Clone(self):
     new = copy.copy(self)
-    new.stack = copy.deepcopy(self.stack)
+    # Both states see the paren state now.
+    self._owns_paren_state = False
+    new._owns_paren_state = False  # pylint: disable=protected-access
     return new
 
   def __eq__(self, other):
     # Note: 'first_indent' is implicit in the stack. Also, we ignore 'previous',
     # because it shouldn't have a bearing on this comparison. (I.e., it will
     # report equal if 'next_token' does.)
-    return (self.next_token == other.next_token and self.column == other.column
-            and self.paren_level == other.paren_level and
-            self.start_of_line_level == other.start_of_line_level and
-            self.lowest_level_on_line == other.lowest_level_on_line and
+    # pylint: disable=protected-access
+    return (self._hash == other._hash and self._key == other._key and
             (self.ignore_stack_for_comparison or
-             other.ignore_stack_for_comparison or self.stack == other.stack))
+             other.ignore_stack_for_comparison or
+             self.paren_state == other.paren_state))
 
   def __ne__(self, other):
     return not self == other
 
   def __hash__(self):
-    return hash((self.next_token, self.column, self.paren_level,
-                 self.start_of_line_level, self.lowest_level_on_line))
+    # The stack is left out, because it may be ignored for comparison.
+    return self._hash
+
+  def _UpdateKey(self):
+    """Record what identifies this state, after a token is added."""
+    self._key = (self.next_token, self.column, self.paren_level,
+                 self.start_of_line_level, self.lowest_level_on_line)
+    self._hash = hash(self._key)
 
   def __repr__(self):
+    stack = []
+    paren_state = self.paren_state
+    while paren_state is not None:
+      stack.append(paren_state)
+      paren_state = paren_state.parent
     return ('column::%d, next_token::%s, paren_level::%d, stack::[\n\t%s' %
             (self.column, repr(self.next_token), self.paren_level,
-             '\n\t'.join(repr(s) for s in self.stack) + ']'))
+             '\n\t'.join(repr(s) for s in reversed(stack)) + ']'))
 
   def CanSplit(self):
     """Returns True if the line can be split before the next token."""
@@ -122,7 +143,7 @@ class FormatDecisionState(object):
     if current.must_break_before:
       return True
 
-    if (self.stack[-1].split_before_closing_bracket and
+    if (self.paren_state.split_before_closing_bracket and
         # FIXME(morbo): Use the 'matching_bracket' instead of this.
         # FIXME(morbo): Don't forget about tuples!
         current.value in ']}'):
@@ -168,11 +189,12 @@ class FormatDecisionState(object):
     Returns:
       The penalty of splitting after the current token.
     """
-    if not self.stack:
+    if self.paren_state is None:
       self.column = (
           self.next_token.spaces_required_before + len(self.next_token.value)
       )
       self.next_token = self.next_token.next_token
+      self._UpdateKey()
       return 0
 
     penalty = 0
@@ -206,11 +228,13 @@ class FormatDecisionState(object):
         #     foo = [a,
         #            b,
         #           ]
-        self.stack[-1].closing_scope_indent = previous.column
-        self.stack[-1].indent = self.column + spaces
+        paren_state = self._OwnParenState()
+        paren_state.closing_scope_indent = previous.column
+        paren_state.indent = self.column + spaces
       else:
-        self.stack[-1].closing_scope_indent = (
-            self.stack[-1].indent - style.Get('CONTINUATION_INDENT_WIDTH')
+        paren_state = self._OwnParenState()
+        paren_state.closing_scope_indent = (
+            paren_state.indent - style.Get('CONTINUATION_INDENT_WIDTH')
         )
 
     self.column += spaces
@@ -237,33 +261,32 @@ class FormatDecisionState(object):
     if not dry_run:
       current.AddWhitespacePrefix(newlines_before=1, spaces=self.column)
 
+    # Any break on this level means that the parent level has been broken and we
+    # need to avoid bin packing there.
+    self._SplitBeforeParameterOnAllLevels()
+
+    last = self._OwnParenState()
     if not current.is_comment:
-      self.stack[-1].last_space = self.column
+      last.last_space = self.column
     self.start_of_line_level = self.paren_level
     self.lowest_level_on_line = self.paren_level
 
-    # Any break on this level means that the parent level has been broken and we
-    # need to avoid bin packing there.
-    for paren_state in self.stack:
-      paren_state.split_before_parameter = True
-
     if (previous.value != ',' and not previous.is_binary_op and
         not current.is_binary_op and not previous.OpensScope()):
-      self.stack[-1].split_before_parameter = True
+      last.split_before_parameter = True
 
     if (previous.OpensScope() or
         (previous.is_comment and previous.previous_token is not None and
          previous.previous_token.OpensScope())):
-      self.stack[-1].closing_scope_indent = (
-          max(0, self.stack[-1].indent - style.Get('CONTINUATION_INDENT_WIDTH'))
+      last.closing_scope_indent = (
+          max(0, last.indent - style.Get('CONTINUATION_INDENT_WIDTH'))
       )
-      self.stack[-1].split_before_closing_bracket = True
+      last.split_before_closing_bracket = True
 
     # Calculate the split penalty.
     penalty = current.split_penalty
 
     # Add a penalty for each increasing newline we add.
-    last = self.stack[-1]
     penalty += (
         style.Get('SPLIT_PENALTY_FOR_ADDED_LINE_SPLIT') * last.num_line_splits
     )
@@ -274,10 +297,45 @@ class FormatDecisionState(object):
 
     return penalty + 10
 
+  def _OwnParenState(self):
+    """Return the innermost paren state, copying it first if it's shared."""
+    if not self._owns_paren_state:
+      self.paren_state = self.paren_state.Copy()
+      self._owns_paren_state = True
+    return self.paren_state
+
+  def _SplitBeforeParameterOnAllLevels(self):
+    """Set 'split_before_parameter' in the paren state of every level."""
+    # The flag is only ever cleared in a new paren state, and then set on all
+    # levels at once. So the levels that don't have it set are the innermost
+    # ones, and only they need to be copied.
+    unset = []
+    paren_state = self.paren_state
+    while paren_state is not None and not paren_state.split_before_parameter:
+      unset.append(paren_state)
+      paren_state = paren_state.parent
+    if not unset:
+      return
+    innermost = None
+    if self._owns_paren_state:
+      # The innermost state can be changed in place.
+      innermost = unset.pop(0)
+    for old in reversed(unset):
+      new = old.Copy()
+      new.parent = paren_state
+      new.split_before_parameter = True
+      paren_state = new
+    if innermost is not None:
+      innermost.parent = paren_state
+      innermost.split_before_parameter = True
+      paren_state = innermost
+    self.paren_state = paren_state
+    self._owns_paren_state = True
+
   def _GetNewlineColumn(self):
     """Return the new column on the newline."""
     current = self.next_token
-    top_of_stack = self.stack[-1]
+    top_of_stack = self.paren_state
 
     if current.OpensScope():
       return self.first_indent if not self.paren_level else top_of_stack.indent
@@ -305,17 +363,18 @@ class FormatDecisionState(object):
     # If we encounter an opening bracket, we add a level to our stack to prepare
     # for the subsequent tokens.
     if current.OpensScope():
-      last = self.stack[-1]
+      last = self.paren_state
       new_indent = style.Get('CONTINUATION_INDENT_WIDTH') + last.last_space
 
-      self.stack.append(_ParenState(new_indent, self.stack[-1].last_space))
-      self.stack[-1].break_before_paremeter = False
+      self.paren_state = _ParenState(new_indent, last.last_space, last)
+      self._owns_paren_state = True
       self.paren_level += 1
 
     # If we encounter a closing bracket, we can remove a level from our
     # parenthesis stack.
-    if len(self.stack) > 1 and current.ClosesScope():
-      self.stack.pop()
+    if self.paren_state.parent is not None and current.ClosesScope():
+      self.paren_state = self.paren_state.parent
+      self._owns_paren_state = False
       self.paren_level -= 1
 
     is_multiline_string = current.is_string and '\n' in current.value
@@ -338,6 +397,7 @@ class FormatDecisionState(object):
       # end of the last line in the string.
       self.column = len(current.value.split('\n')[-1])
 
+    self._UpdateKey()
     return penalty
 
 
@@ -363,7 +423,10 @@ class _ParenState(object):
   """Maintains the state of the bracket enclosures.
 
   A stack of _ParenState objects are kept so that we know how to indent relative
-  to the brackets.
+  to the brackets. The stack is a linked list, from the innermost bracket out,
+  that is shared between format decision states. A paren state that may be
+  seen by more than one decision state must not be changed; change a Copy()
+  instead.
 
   Attributes:
     indent: The column position to which a specified parenthesis level needs to
@@ -375,17 +438,60 @@ class _ParenState(object):
     split_before_parameter: Split the line after the next comma.
     num_line_splits: Number of line splits this _ParenState contains already.
       Each subsequent line split gets an increasing penalty.
+    parent: The _ParenState of the enclosing bracket, or None for the bottom
+      of the stack.
   """
 
   # TODO(morbo): This doesn't track "bin packing."
 
-  def __init__(self, indent, last_space):
+  __slots__ = ('indent', 'last_space', 'closing_scope_indent',
+               'split_before_closing_bracket', 'split_before_parameter',
+               'num_line_splits', 'parent')
+
+  def __init__(self, indent, last_space, parent=None):
     self.indent = indent
     self.last_space = last_space
     self.closing_scope_indent = 0
     self.split_before_closing_bracket = False
     self.split_before_parameter = False
     self.num_line_splits = 0
+    self.parent = parent
+
+  def __eq__(self, other):
+    # Stacks share their outer levels, so the walk usually stops early.
+    paren_state = self
+    while paren_state is not other:
+      if (paren_state is None or other is None or
+          paren_state.indent != other.indent or
+          paren_state.last_space != other.last_space or
+          paren_state.closing_scope_indent != other.closing_scope_indent or
+          paren_state.split_before_closing_bracket !=
+          other.split_before_closing_bracket or
+          paren_state.split_before_parameter != other.split_before_parameter or
+          paren_state.num_line_splits != other.num_line_splits):
+        return False
+      paren_state = paren_state.parent
+      other = other.parent
+    return True
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    return hash((self.indent, self.last_space, self.closing_scope_indent,
+                 self.num_line_splits))
+
+  def Copy(self):
+    """Return a copy of this paren state, with the same parent."""
+    new = _ParenState.__new__(_ParenState)
+    new.indent = self.indent
+    new.last_space = self.last_space
+    new.closing_scope_indent = self.closing_scope_indent
+    new.split_before_closing_bracket = self.split_before_closing_bracket
+    new.split_before_parameter = self.split_before_parameter
+    new.num_line_splits = self.num_line_splits
+    new.parent = self.parent
+    return new
 
   def __repr__(self):
     return '[indent::%d, last_space::%d, closing_scope_indent::%d]' % (
@@ -0,0 +1,151 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Find the lines changed since a git revision.
+
+Formatting only the lines a change touches keeps the time YAPF takes
+proportional to the size of the change, rather than to the size of the files
+it touches. The lines are found by running 'git diff' once for the whole
+working tree, without context lines, and parsing the hunk headers.
+
+  GetChangedLines(): the main function exported by this module.
+"""
+
+import codecs
+import os
+import re
+import subprocess
+
+# Git ends the name with a tab if it contains spaces.
+_FILE_HEADER = re.compile(r'^\+\+\+ (.*?)\t?$')
+_HUNK_HEADER = re.compile(r'^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+class Error(Exception):
+  """Raised when git fails."""
+  pass
+
+
+def GetChangedLines(revision, paths=None):
+  """Return the lines of the working tree that differ from a revision.
+
+  Arguments:
+    revision: (string) The git revision to compare the working tree with.
+    paths: (list of unicode) Only look at changes to these files and
+      directories. If None or empty, look at the whole working tree.
+
+  Returns:
+    A dict mapping the absolute names of the changed files to lists of
+    (start, end) tuples of the changed lines. The lines are 1-based and the
+    ranges inclusive. Deleted files, and files with only deleted lines, are
+    left out.
+
+  Raises:
+    Error: if git fails, e.g. because the revision doesn't exist.
+  """
+  toplevel = _RunGit(['rev-parse', '--show-toplevel']).strip()
+  # The names in the diff are relative to the top of the working tree, which
+  # also covers the paths outside of the current directory.
+  command = ['-c', 'core.quotePath=false', 'diff', '-U0', '--no-color',
+             '--no-ext-diff', '--no-prefix', '--diff-filter=d', revision, '--']
+  command.extend(paths or [])
+  changed_lines = ParseDiff(_RunGit(command))
+  return dict((os.path.normpath(os.path.join(toplevel, filename)), lines)
+              for filename, lines in changed_lines.items())
+
+
+def _RunGit(args):
+  """Run git in the current directory and return its output.
+
+  Arguments:
+    args: (list of string) The arguments to git.
+
+  Returns:
+    The output of git, as unicode.
+
+  Raises:
+    Error: if git fails.
+  """
+  try:
+    process = subprocess.Popen(['git'] + args, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+  except OSError as err:
+    raise Error('cannot run git: {0}'.format(err))
+  output, errors = process.communicate()
+  if process.returncode != 0:
+    raise Error(errors.decode('utf-8', 'replace').strip() or
+                'git failed with status {0}'.format(process.returncode))
+  return output.decode('utf-8', 'replace')
+
+
+def ParseDiff(diff):
+  """Parse the output of 'git diff -U0 --no-prefix'.
+
+  Arguments:
+    diff: (unicode) The diff.
+
+  Returns:
+    A dict mapping the names of the changed files, as they are in the diff,
+    to lists of (start, end) tuples of the changed lines, as in
+    GetChangedLines().
+  """
+  changed_lines = {}
+  filename = None
+  # The old and new lines of the current hunk that are still to come. An
+  # added line that starts with '++ ' looks like a file header, so the lines
+  # of a hunk are skipped by their count.
+  old_count = new_count = 0
+  previous_line = None
+  for line in diff.splitlines():
+    if old_count or new_count:
+      if line.startswith('-'):
+        old_count -= 1
+      elif line.startswith('+'):
+        new_count -= 1
+      elif not line.startswith('\\'):
+        # A context line. A line starting with a backslash notes a missing
+        # newline.
+        old_count -= 1
+        new_count -= 1
+      previous_line = None
+      continue
+
+    match = _FILE_HEADER.match(line)
+    if match and previous_line is not None and previous_line.startswith('--- '):
+      filename = _Unquote(match.group(1))
+      if filename == '/dev/null':
+        filename = None
+    else:
+      match = _HUNK_HEADER.match(line)
+      if match:
+        old_count = _HunkCount(match.group(1))
+        start = int(match.group(2))
+        new_count = _HunkCount(match.group(3))
+        if new_count and filename is not None:
+          changed_lines.setdefault(filename, []).append(
+              (start, start + new_count - 1))
+    previous_line = line
+  return changed_lines
+
+
+def _HunkCount(count):
+  """Return the number of lines in a hunk header, which git leaves out if 1."""
+  return int(count) if count is not None else 1
+
+
+def _Unquote(filename):
+  """Undo git's quoting of file names with unusual characters."""
+  if not (filename.startswith('"') and filename.endswith('"')):
+    return filename
+  data = codecs.escape_decode(filename[1:-1].encode('utf-8'))[0]
+  return data.decode('utf-8')
@@ -0,0 +1,118 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A cache of the parser's grammar tables.
+
+Importing lib2to3.pygram loads two grammars and copies one of them twice. If
+lib2to3 was installed without its pickled tables, or into a directory that
+can't be written to, it even regenerates the tables from Grammar.txt in every
+process. YAPF only needs the Python grammar, so it keeps a pickle of just that
+in the directory set with SetCacheDirectory(). The command line sets it to its
+cache directory, unless it is run with --no-cache. Otherwise, the grammar isn't
+pickled.
+
+The pickle starts with a header naming the Python version and the grammar
+source it was made for. A pickle that doesn't match is ignored and replaced.
+
+  LoadGrammar(): the main function exported by this module.
+  SetCacheDirectory(): set the directory to keep the pickle in.
+"""
+
+import os
+import sys
+
+from yapf.yapflib import file_resources
+
+# lib2to3 and pickle are imported where they are needed, so that setting the
+# cache directory doesn't import them.
+
+_MAGIC = b'yapf-grammar'
+
+# The directory to keep the pickled grammar in, or None to not pickle it.
+_cache_dir = None
+
+
+def SetCacheDirectory(cache_dir):
+  """Set the directory LoadGrammar() keeps the pickled grammar in.
+
+  Arguments:
+    cache_dir: (unicode) The directory, or None to not pickle the grammar.
+  """
+  global _cache_dir
+  _cache_dir = cache_dir
+
+
+def GetCacheDirectory():
+  """Return the directory set with SetCacheDirectory(), or None."""
+  return _cache_dir
+
+
+def LoadGrammar(cache_dir=None):
+  """Return lib2to3's Python grammar, which has the print statement.
+
+  Arguments:
+    cache_dir: (unicode) The directory to keep the pickled grammar in. If
+      None, use the one set with SetCacheDirectory(). If that is None as well,
+      the grammar isn't pickled.
+
+  Returns:
+    A lib2to3.pgen2.grammar.Grammar.
+  """
+  cache_dir = cache_dir or _cache_dir
+  if cache_dir is None:
+    from lib2to3 import pygram  # pylint: disable=g-import-not-at-top
+    return pygram.python_grammar
+
+  import pickle  # pylint: disable=g-import-not-at-top
+  from lib2to3.pgen2 import grammar  # pylint: disable=g-import-not-at-top
+
+  path = os.path.join(cache_dir, 'Grammar{0}.pickle'.format('.'.join(
+      map(str, sys.version_info))))
+  header = _MAGIC + b' ' + _Key().encode('utf-8') + b'\n'
+
+  try:
+    with open(path, 'rb') as fd:
+      data = fd.read()
+  except (IOError, OSError):
+    data = b''
+  if data.startswith(header):
+    python_grammar = grammar.Grammar()
+    try:
+      python_grammar.loads(data[len(header):])
+      return python_grammar
+    except Exception:  # pylint: disable=broad-except
+      # A corrupt pickle can raise almost anything.
+      pass
+
+  from lib2to3 import pygram  # pylint: disable=g-import-not-at-top
+  python_grammar = pygram.python_grammar
+  try:
+    file_resources.WriteFileAtomically(
+        path, header + pickle.dumps(python_grammar.__dict__, 2))
+  except (IOError, OSError):
+    pass
+  return python_grammar
+
+
+def _Key():
+  """Identify the Python version and the grammar source."""
+  import lib2to3  # pylint: disable=g-import-not-at-top
+
+  source = os.path.join(os.path.dirname(lib2to3.__file__), 'Grammar.txt')
+  try:
+    stat = os.stat(source)
+    source_id = '{0}:{1}:{2}'.format(source, stat.st_size, stat.st_mtime)
+  except OSError:
+    # The grammar is only available as packaged tables.
+    source_id = os.path.dirname(lib2to3.__file__)
+  return '{0}|{1}'.format(sys.version, source_id).replace('\n', ' ')
@@ -0,0 +1,109 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Serialize unwrapped lines, so that they needn't be parsed again.
+
+Parsing the code and running the passes over the parse tree take longer than
+reformatting most files. None of it depends on the style, so the unwrapped
+lines it produces can be kept, e.g. in the result cache, and reformatted with
+any style or range of lines later.
+
+Only what the reformatter looks at is kept: the depth of each line and, for
+each token, its type, value, position, annotations, and matching bracket. The
+lines must be serialized before their formatting information is calculated.
+That part depends on the style.
+
+The serialized form starts with a header naming the version of the format. A
+different version is rejected.
+
+  Serialize(): turn unwrapped lines into bytes.
+  Deserialize(): turn the bytes back into unwrapped lines.
+"""
+
+import json
+
+from lib2to3 import pytree
+
+from yapf.yapflib import format_token
+from yapf.yapflib import pytree_utils
+from yapf.yapflib import unwrapped_line
+
+# Change the version whenever the format changes.
+_HEADER = b'yapf-lines 1\n'
+
+
+def Serialize(uwlines):
+  """Serialize unwrapped lines.
+
+  Arguments:
+    uwlines: (list of unwrapped_line.UnwrappedLine) The lines, as produced by
+      pytree_unwrapper.UnwrapPyTree().
+
+  Returns:
+    The serialized lines as bytes.
+  """
+  lines = []
+  for uwline in uwlines:
+    index = dict((id(tok), i) for i, tok in enumerate(uwline.tokens))
+    tokens = []
+    for tok in uwline.tokens:
+      node = tok.node
+      tokens.append([
+          node.type, node.value, node.lineno, node.column,
+          pytree_utils.GetNodeAnnotation(node, pytree_utils.Annotation.SUBTYPE),
+          pytree_utils.GetNodeAnnotation(node,
+                                         pytree_utils.Annotation.SPLIT_PENALTY),
+          pytree_utils.GetNodeAnnotation(node, pytree_utils.Annotation.NEWLINES),
+          index.get(id(tok.matching_bracket))
+      ])
+    lines.append([uwline.depth, tokens])
+  return _HEADER + json.dumps(lines, separators=(',', ':')).encode('utf-8')
+
+
+def Deserialize(data):
+  """Turn serialized lines back into unwrapped lines.
+
+  Arguments:
+    data: (bytes) The lines as returned by Serialize().
+
+  Returns:
+    A list of unwrapped_line.UnwrappedLine. Their formatting information isn't
+    calculated yet.
+
+  Raises:
+    ValueError: if the data isn't lines serialized by this version of the
+      format.
+  """
+  if not data.startswith(_HEADER):
+    raise ValueError('not serialized lines of version {0!r}'.format(_HEADER))
+  uwlines = []
+  for depth, descriptions in json.loads(data[len(_HEADER):].decode('utf-8')):
+    tokens = []
+    for (token_type, value, lineno, column, subtype, split_penalty, newlines,
+         _) in descriptions:
+      node = pytree.Leaf(token_type, value, context=('', (lineno, column)))
+      _Annotate(node, pytree_utils.Annotation.SUBTYPE, subtype)
+      _Annotate(node, pytree_utils.Annotation.SPLIT_PENALTY, split_penalty)
+      _Annotate(node, pytree_utils.Annotation.NEWLINES, newlines)
+      tokens.append(format_token.FormatToken(node))
+    for tok, description in zip(tokens, descriptions):
+      if description[-1] is not None:
+        tok.matching_bracket = tokens[description[-1]]
+    uwlines.append(unwrapped_line.UnwrappedLine(depth, tokens))
+  return uwlines
+
+
+def _Annotate(node, annotation, value):
+  # A missing annotation reads as None, so there is no need to set one.
+  if value is not None:
+    pytree_utils.SetNodeAnnotation(node, annotation, value)
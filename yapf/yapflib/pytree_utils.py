@@ -17,18 +17,25 @@ This module collects various utilities related to the parse trees produced by
 the lib2to3 library.
 
   NodeName(): produces a string name for pytree nodes.
+  GetPythonGrammar(): the grammar YAPF parses with.
   ParseCodeToTree(): convenience wrapper around lib2to3 interfaces to parse
                      a given string with code to a pytree.
+  HasPrintStatement(): tell whether code uses 'print' as a statement.
   InsertNodeBefore(): insert a node before another in a pytree.
   InsertNodeAfter(): insert a node after another in a pytree.
   {Get,Set}NodeAnnotation(): manage custom annotations on pytree nodes.
 """
 
-from lib2to3 import pygram
+import keyword
+import re
+
 from lib2to3 import pytree
 from lib2to3.pgen2 import driver
 from lib2to3.pgen2 import parse
 from lib2to3.pgen2 import token
+from lib2to3.pgen2 import tokenize
+
+from yapf.yapflib import grammar_cache
 
 # TODO(eliben): We may want to get rid of this filtering at some point once we
 # have a better understanding of what information we need from the tree. Then,
@@ -63,34 +70,113 @@ def NodeName(node):
   if node.type < 256:
     return token.tok_name[node.type]
   else:
-    return pygram.python_grammar.number2symbol[node.type]
+    return GetPythonGrammar().number2symbol[node.type]
 
 
-def ParseCodeToTree(code):
+def ParseCodeToTree(code, print_statement=None):
   """Parse the given code to a lib2to3 pytree.
 
   Arguments:
     code: a string with the code to parse.
+    print_statement: (bool) Whether to try parsing 'print' as a statement
+      first. If None, decide with HasPrintStatement(code). Useful when the
+      code is part of a larger file, where the decision depends on the rest
+      of the file.
 
   Returns:
     The root node of the parsed tree.
   """
   # This function is tiny, but the incantation for invoking the parser correctly
   # is sufficiently magical to be worth abstracting away.
+  #
+  # Try to parse the code treating 'print' as a function call (3.0 behavior).
+  # If that fails, try again treating it as a statement (pre-3.0 behavior). If
+  # that fails as well, there's something else wrong with the code. Code that
+  # evidently uses the print statement is parsed with the second grammar
+  # straight away, since the first is bound to fail on it, possibly only after
+  # parsing most of the file.
+  grammars = [GetPythonGrammar(print_statement=False), GetPythonGrammar()]
+  if print_statement is None:
+    print_statement = HasPrintStatement(code)
+  if print_statement:
+    grammars.reverse()
   try:
-    # Try to parse the code treating 'print' as a function call (3.0 behavior).
-    parser_driver = driver.Driver(pygram.python_grammar_no_print_statement,
-                                  convert=pytree.convert)
-    tree = parser_driver.parse_string(code, debug=False)
+    tree = _GetDriver(grammars[0]).parse_string(code, debug=False)
   except parse.ParseError:
-    # Treating 'print' as a function call failed. Now try to parse the code
-    # with 'print' as a statement (pre-3.0 behavior). If this fails, then
-    # there's something else wrong with the code.
-    parser_driver = driver.Driver(pygram.python_grammar, convert=pytree.convert)
-    tree = parser_driver.parse_string(code, debug=False)
+    tree = _GetDriver(grammars[1]).parse_string(code, debug=False)
   return tree
 
 
+# A quick test for code that might use the print statement. Only code that
+# matches is tokenized to make sure.
+_PRINT_STATEMENT_CANDIDATE = re.compile(r'\bprint[ \t]+[\w\'"]')
+
+
+def HasPrintStatement(code):
+  """Return True if code uses 'print' as a statement.
+
+  The test is conservative: it only looks for 'print' followed by an operand
+  that can't follow it in an expression, e.g. 'print x' or 'print "x"'. Code
+  like 'print >>f, x' is valid in both grammars and is left to the parser.
+  """
+  if not _PRINT_STATEMENT_CANDIDATE.search(code):
+    return False
+  lines = iter(code.splitlines(True))
+  previous = None
+  try:
+    for tok_type, value, _, _, _ in tokenize.generate_tokens(
+        lambda: next(lines, '')):
+      if tok_type in (token.COMMENT, token.NL):
+        continue
+      if (previous == 'print' and
+          (tok_type in (token.NUMBER, token.STRING) or
+           (tok_type == token.NAME and not keyword.iskeyword(value)))):
+        return True
+      previous = value if tok_type == token.NAME else None
+  except (tokenize.TokenError, IndentationError):
+    pass
+  return False
+
+
+# The grammars are loaded on first use from the grammar cache, which is cheaper
+# than importing lib2to3.pygram. They are keyed by whether 'print' is a
+# statement.
+_GRAMMARS = {}
+
+
+def GetPythonGrammar(print_statement=True):
+  """Return the grammar YAPF parses Python code with.
+
+  Arguments:
+    print_statement: (bool) If True, 'print' is a statement, as in Python 2.
+      Otherwise it is a function call, as in Python 3.
+
+  Returns:
+    A lib2to3.pgen2.grammar.Grammar. Its symbol numbers are the same as in
+    lib2to3.pygram.python_symbols.
+  """
+  if not _GRAMMARS:
+    python_grammar = grammar_cache.LoadGrammar()
+    python_grammar_no_print_statement = python_grammar.copy()
+    del python_grammar_no_print_statement.keywords['print']
+    _GRAMMARS[True] = python_grammar
+    _GRAMMARS[False] = python_grammar_no_print_statement
+  return _GRAMMARS[print_statement]
+
+
+# Drivers keep no state between parses, so one is created per grammar and
+# reused for every parse.
+_DRIVERS = {}
+
+
+def _GetDriver(grammar):
+  parser_driver = _DRIVERS.get(id(grammar))
+  if parser_driver is None:
+    parser_driver = driver.Driver(grammar, convert=pytree.convert)
+    _DRIVERS[id(grammar)] = parser_driver
+  return parser_driver
+
+
 def InsertNodesBefore(new_nodes, target):
   """Insert new_nodes before the given target location in the tree.
 
@@ -18,6 +18,9 @@ UnwrappedLines that can be merged together are. The best formatting is returned
 as a string.
 
   Reformat(): the main function exported by this module.
+  ReformatFrom(): reformat lines in the context of the lines before them.
+  ReformatByLine(): reformat lines, telling which code came from which line.
+  IsFormatted(): check whether reformatting would change the code.
 """
 
 import collections
@@ -25,27 +28,113 @@ import heapq
 import re
 
 from yapf.yapflib import format_decision_state
+from yapf.yapflib import format_token
 from yapf.yapflib import line_joiner
 from yapf.yapflib import pytree_utils
 from yapf.yapflib import style
 from yapf.yapflib import verifier
 
 
-def Reformat(uwlines):
+def Reformat(uwlines, pool=None):
   """Reformat the unwrapped lines.
 
   Arguments:
     uwlines: (list of unwrapped_line.UnwrappedLine) Lines we want to format.
+    pool: (multiprocessing.Pool) If not None, search for the best formatting
+      of the longer lines in this pool's worker processes. Anything with a
+      'map' method like that of multiprocessing.Pool will do.
 
   Returns:
     A string representing the reformatted code.
   """
-  final_lines = []
+  return ''.join(code for _, code in _ReformatLines(uwlines, pool)) + '\n'
+
+
+def ReformatFrom(uwlines, lineno):
+  """Reformat the unwrapped lines, leaving out those before a line number.
+
+  The lines before 'lineno' are formatted all the same: the blank lines before
+  a line, and hence its code, depend on the line before it.
+
+  Arguments:
+    uwlines: (list of unwrapped_line.UnwrappedLine) Lines we want to format.
+    lineno: (int) The number of the first line to return.
+
+  Yields:
+    The reformatted code of each line starting at or after 'lineno', preceded
+    by the newlines that separate it from the previous line. There is no
+    newline after the last line.
+  """
+  for uwline_lineno, code in ReformatByLine(uwlines):
+    if uwline_lineno >= lineno:
+      yield code
+
+
+def ReformatByLine(uwlines, pool=None):
+  """Reformat the unwrapped lines, telling where each came from.
+
+  Arguments:
+    uwlines: (list of unwrapped_line.UnwrappedLine) Lines we want to format.
+    pool: (multiprocessing.Pool) See Reformat().
+
+  Yields:
+    Tuples of the original line number of each line, or of lines merged into
+    one, and its reformatted code, preceded by the newlines that separate it
+    from the previous line. There is no newline after the last line.
+  """
+  for uwline, code in _ReformatLines(uwlines, pool):
+    yield uwline.lineno, code
+
+
+def IsFormatted(uwlines, source):
+  """Return True if reformatting the unwrapped lines wouldn't change source.
+
+  The lines are formatted one at a time and compared with the source as they
+  are emitted. The work stops at the first line that differs, and the
+  reformatted code is never put together.
+
+  Arguments:
+    uwlines: (list of unwrapped_line.UnwrappedLine) Lines we want to format.
+    source: (unicode) The code the lines were unwrapped from.
+
+  Returns:
+    True if Reformat(uwlines) would return source.
+  """
+  position = 0
+  for _, formatted_line in _ReformatLines(uwlines):
+    if not source.startswith(formatted_line, position):
+      return False
+    position += len(formatted_line)
+  return source[position:] == '\n'
+
+
+def _ReformatLines(uwlines, pool=None):
+  """Reformat the unwrapped lines one at a time.
+
+  Arguments:
+    uwlines: (list of unwrapped_line.UnwrappedLine) Lines we want to format.
+    pool: (multiprocessing.Pool) See Reformat().
+
+  Yields:
+    Tuples of each line, or of lines merged into one, and its reformatted
+    code, preceded by the newlines that separate it from the previous line.
+  """
   prev_last_uwline = None  # The previous line.
 
-  for uwline in _SingleOrMergedLines(uwlines):
+  solutions = {}
+  if pool is not None:
+    uwlines = list(_SingleOrMergedLines(uwlines))
+    solutions = _SearchInParallel(uwlines, pool)
+  else:
+    uwlines = _SingleOrMergedLines(uwlines)
+
+  for uwline in uwlines:
     first_token = uwline.first
     _FormatFirstToken(first_token, uwline.depth, prev_last_uwline)
+    # Placing the first token may change the newlines before a comment ending
+    # the previous line, so that line is only emitted now.
+    if prev_last_uwline is not None:
+      yield prev_last_uwline, _FormattedLine(prev_last_uwline)
 
     indent_amt = style.Get('INDENT_WIDTH') * uwline.depth
     state = format_decision_state.FormatDecisionState(uwline, indent_amt)
@@ -55,24 +144,28 @@ def Reformat(uwlines):
       # The unwrapped line fits on one line.
       while state.next_token:
         state.AddTokenToState(newline=False, dry_run=False)
+    elif id(uwline) in solutions:
+      _ApplySolution(state, solutions[id(uwline)])
     else:
       _AnalyzeSolutionSpace(state, dry_run=False)
 
-    final_lines.append(uwline)
     prev_last_uwline = uwline
 
-  formatted_code = []
-  for line in final_lines:
-    formatted_line = []
-    for token in line.tokens:
-      if token.name in pytree_utils.NONSEMANTIC_TOKENS:
-        continue
-      formatted_line.append(token.whitespace_prefix)
-      formatted_line.append(token.value)
-    formatted_code.append(''.join(formatted_line))
-    verifier.VerifyCode(formatted_code[-1])
+  if prev_last_uwline is not None:
+    yield prev_last_uwline, _FormattedLine(prev_last_uwline)
+
 
-  return ''.join(formatted_code) + '\n'
+def _FormattedLine(uwline):
+  """Return the verified code of a formatted unwrapped line."""
+  formatted_line = []
+  for token in uwline.tokens:
+    if token.name in pytree_utils.NONSEMANTIC_TOKENS:
+      continue
+    formatted_line.append(token.whitespace_prefix)
+    formatted_line.append(token.value)
+  formatted_line = ''.join(formatted_line)
+  verifier.VerifyCode(formatted_line)
+  return formatted_line
 
 
 def _EmitLineUnformatted(state):
@@ -148,6 +241,7 @@ class _StateNode(object):
     newline: If True, then on the edge from 'previous.state' to 'state' a
       newline is inserted.
     previous: (_StateNode) The previous state node in the graph.
+    penalty: (int) The penalty of the path up to 'state'.
   """
 
   # TODO(morbo): Add a '__cmp__' method.
@@ -156,15 +250,17 @@ class _StateNode(object):
     self.state = state.Clone()
     self.newline = newline
     self.previous = previous
+    self.penalty = 0
 
   def __repr__(self):
     return 'StateNode(state=[\n{0}\n], newline={1})'.format(self.state,
                                                             self.newline)
 
-# A tuple of (penalty, count) that is used to prioritize the BFS. In case of
-# equal penalties, we prefer states that were inserted first. During state
-# generation, we make sure that we insert states first that break the line as
-# late as possible.
+# A tuple of (penalty, count) that is used to prioritize the BFS. The penalty is
+# that of the path so far plus a lower bound on the penalty of the rest of the
+# line. In case of equal penalties, we prefer states that were inserted first.
+# During state generation, we make sure that we insert states first that break
+# the line as late as possible.
 _OrderedPenalty = collections.namedtuple('OrderedPenalty', ['penalty', 'count'])
 
 # An item in the prioritized BFS search queue. The 'StateNode's 'state' has
@@ -172,23 +268,70 @@ _OrderedPenalty = collections.namedtuple('OrderedPenalty', ['penalty', 'count'])
 _QueueItem = collections.namedtuple('QueueItem', ['ordered_penalty',
                                                   'state_node'])
 
+# Stands in the search queue for a copy of 'state_node' reached with 'offset'
+# more penalty, which isn't expanded. See _FindSolution().
+_DuplicateNode = collections.namedtuple('DuplicateNode', ['state_node',
+                                                          'offset'])
+
 
 def _AnalyzeSolutionSpace(initial_state, dry_run=False):
   """Analyze the entire solution space starting from initial_state.
 
+  Arguments:
+    initial_state: (format_decision_state.FormatDecisionState) The initial state
+      to start the search from.
+    dry_run: (bool) Don't commit changes if True.
+  """
+  solution = _FindSolution(initial_state)
+  if solution is not None and not dry_run:
+    _ApplySolution(initial_state, solution)
+
+
+def _FindSolution(initial_state):
+  """Find the best formatting of the line, starting from initial_state.
+
   This implements a variant of Dijkstra's algorithm on the graph that spans
   the solution space (LineStates are the nodes). The algorithm tries to find
   the shortest path (the one with the lowest penalty) from 'initial_state' to
-  the state where all tokens are placed.
+  the state where all tokens are placed. The states are explored in the order
+  of their penalty plus a lower bound on the penalty still to come (A*), so
+  that states that are bound to end up expensive are explored late, if at
+  all. States bound to end up more expensive than a greedily found formatting
+  aren't queued at all.
+
+  A state equal to one that was already expanded isn't expanded again. Once
+  more than 10000 states have been queued, the search gives up on telling
+  states apart by their paren stacks, which decides the formatting it finds.
+  So that it gives up at the same point as a search that expands every state
+  it reaches, a duplicate state popped before then queues _DuplicateNodes for
+  the states that expanding it would have queued. They are only counted, and
+  queue the same in turn when they're popped.
 
   Arguments:
     initial_state: (format_decision_state.FormatDecisionState) The initial state
-      to start the search from.
-    dry_run: (bool) Don't commit changes if True.
+      to start the search from. It isn't changed.
+
+  Returns:
+    A list of booleans, one for each token after the first, telling whether to
+    put a newline before it. None if no solution was found.
   """
+  if style.Get('SEARCH_STRATEGY') == 'beam':
+    solution = _FindSolutionInBeam(initial_state, style.Get('BEAM_WIDTH'))
+    if solution is not None:
+      return solution
+    # All the states kept lead nowhere. Search the whole solution space.
+
   count = 0
-  seen = set()
+  # The expanded nodes, by their states.
+  seen = {}
+  # The penalties and the nodes that expanding each node reached.
+  successors = {}
+  # The expanded node that each duplicate node is equal to, and how much more
+  # penalty the duplicate has.
+  duplicates = {}
   p_queue = []
+  lower_bound = _PenaltyLowerBound(initial_state.next_token)
+  upper_bound = _GreedyPenalty(initial_state)
 
   # Insert start element.
   node = _StateNode(initial_state, False, None)
@@ -200,6 +343,13 @@ def _AnalyzeSolutionSpace(initial_state, dry_run=False):
     item = p_queue[0]
     penalty = item.ordered_penalty.penalty
     node = item.state_node
+    if isinstance(node, _DuplicateNode):
+      heapq.heappop(p_queue)
+      if count <= 10000:
+        count = _AddDuplicatesToQueue(node.state_node, node.offset, count,
+                                      p_queue, upper_bound, successors,
+                                      duplicates)
+      continue
     if not node.state.next_token:
       break
     heapq.heappop(p_queue)
@@ -208,49 +358,301 @@ def _AnalyzeSolutionSpace(initial_state, dry_run=False):
       node.state.ignore_stack_for_comparison = True
 
     if node.state in seen:
+      if not node.state.ignore_stack_for_comparison:
+        original = seen[node.state]
+        duplicates[node] = (original, node.penalty - original.penalty)
+        count = _AddDuplicatesToQueue(node, 0, count, p_queue, upper_bound,
+                                      successors, duplicates)
       continue
 
     assert penalty >= prev_penalty
     prev_penalty = penalty
 
-    seen.add(node.state)
+    seen[node.state] = node
+    successors[node] = []
 
     # FIXME(morbo): Add a 'decision' element?
 
-    count = _AddNextStateToQueue(penalty, node, False, count, p_queue)
-    count = _AddNextStateToQueue(penalty, node, True, count, p_queue)
+    count = _AddNextStateToQueue(node, False, count, p_queue, lower_bound,
+                                 upper_bound, successors[node])
+    count = _AddNextStateToQueue(node, True, count, p_queue, lower_bound,
+                                 upper_bound, successors[node])
 
   if not p_queue:
-    # We weren't able to find a solution. Do nothing.
-    return
+    # We weren't able to find a solution.
+    return None
+
+  return _Solution(heapq.heappop(p_queue).state_node)
+
+
+def _FindSolutionInBeam(initial_state, beam_width):
+  """Find a good formatting of the line, starting from initial_state.
+
+  The tokens are placed one at a time. After each token, only the
+  'beam_width' states with the least penalty plus lower bound on the penalty
+  still to come are kept, so the work is linear in the number of tokens. The
+  formatting found isn't always the one with the least penalty.
+
+  Arguments:
+    initial_state: (format_decision_state.FormatDecisionState) The initial state
+      to start the search from. It isn't changed.
+    beam_width: (int) The number of states to keep after each token.
+
+  Returns:
+    A solution, as returned by _FindSolution(). None if no solution was found.
+  """
+  lower_bound = _PenaltyLowerBound(initial_state.next_token)
+  beam = [_StateNode(initial_state, False, None)]
+  while beam and beam[0].state.next_token:
+    # Of the nodes with equal states, keep the first one with the least
+    # penalty.
+    nodes = collections.OrderedDict()
+    for node in beam:
+      for newline in (False, True):
+        next_node = _NextStateNode(node, newline)
+        if next_node is None:
+          continue
+        other_node = nodes.get(next_node.state)
+        if other_node is None or next_node.penalty < other_node.penalty:
+          nodes[next_node.state] = next_node
+    beam = heapq.nsmallest(
+        beam_width, nodes.values(),
+        key=lambda node: node.penalty + lower_bound(node.state))
+
+  if not beam:
+    # We weren't able to find a solution.
+    return None
+
+  return _Solution(min(beam, key=lambda node: node.penalty))
+
+
+def _Solution(node):
+  """Return the newline decisions on the path to a node, from the start."""
+  solution = collections.deque()
+  while node.previous:
+    solution.appendleft(node.newline)
+    node = node.previous
+  return list(solution)
+
+
+def _ApplySolution(initial_state, solution):
+  """Commit the formatting found by _FindSolution().
+
+  Arguments:
+    initial_state: (format_decision_state.FormatDecisionState) The initial state
+      the solution was found from.
+    solution: (list of bool) The newline decisions, as returned by
+      _FindSolution().
+  """
+  for newline in solution:
+    initial_state.AddTokenToState(newline=newline, dry_run=False)
+
+
+# Lines with fewer tokens than this are searched in the main process. Their
+# search is cheaper than sending them to a worker process and back.
+_MIN_TOKENS_TO_SEARCH_IN_PARALLEL = 30
 
-  if not dry_run:
-    _ReconstructPath(initial_state, heapq.heappop(p_queue).state_node)
 
+def _SearchInParallel(uwlines, pool):
+  """Find the best formatting of the longer lines in worker processes.
+
+  The lines are sent to the workers as lists of the token attributes that the
+  search looks at. Only the newline decisions come back.
+
+  Arguments:
+    uwlines: (list of unwrapped_line.UnwrappedLine) The lines to format, after
+      merging.
+    pool: (multiprocessing.Pool) The pool to run the search in.
+
+  Returns:
+    A dict mapping the id() of each line searched to its solution, as returned
+    by _FindSolution(). Lines without a solution are left out.
+  """
+  lines = [uwline for uwline in uwlines
+           if (len(uwline.tokens) >= _MIN_TOKENS_TO_SEARCH_IN_PARALLEL and
+               not _LineContainsI18n(uwline) and
+               not _CanPlaceOnSingleLine(uwline))]
+  if not lines:
+    return {}
+
+  # Each line is sent with the style to use. multiprocessing.Pool.map() sends
+  # the lines in chunks, each pickled as a whole, so the style is only sent
+  # once per chunk.
+  global_style = style.GetGlobalStyle()
+  tasks = [(global_style, _DescribeLine(uwline)) for uwline in lines]
+  solutions = {}
+  for uwline, solution in zip(lines, pool.map(_SearchLine, tasks)):
+    if solution is not None:
+      solutions[id(uwline)] = solution
+  return solutions
+
+
+def _DescribeLine(uwline):
+  """Describe a line with the token attributes that the search looks at."""
+  index = dict((id(token), i) for i, token in enumerate(uwline.tokens))
+  tokens = [(token.value, token.is_comment, token.is_string, token.column,
+             token.can_break_before, token.must_break_before,
+             token.spaces_required_before, token.split_penalty,
+             token.node_split_penalty, token.subtype, token.total_length,
+             index.get(id(token.matching_bracket)))
+            for token in uwline.tokens]
+  return style.Get('INDENT_WIDTH') * uwline.depth, tokens
+
+
+def _SearchLine(task):
+  """Find the best formatting of a line in a worker process.
+
+  Arguments:
+    task: (tuple) The style to use, and the line as described by
+      _DescribeLine().
 
-def _AddNextStateToQueue(penalty, previous_node, newline, count, p_queue):
+  Returns:
+    The solution, as returned by _FindSolution().
+  """
+  global_style, (indent_amt, token_descriptions) = task
+  style.SetGlobalStyle(global_style)
+  tokens = [_SearchToken(*description) for description in token_descriptions]
+  for previous, token in zip(tokens, tokens[1:]):
+    previous.next_token = token
+    token.previous_token = previous
+  for token in tokens:
+    if token.matching_bracket is not None:
+      token.matching_bracket = tokens[token.matching_bracket]
+  uwline = _SearchUnwrappedLine(tokens)
+  return _FindSolution(format_decision_state.FormatDecisionState(uwline,
+                                                                 indent_amt))
+
+
+class _SearchUnwrappedLine(object):
+  """Stands in for an UnwrappedLine in a worker process."""
+
+  def __init__(self, tokens):
+    self.first = tokens[0]
+
+
+class _SearchToken(object):
+  """Stands in for a FormatToken in a worker process.
+
+  It has the attributes of a FormatToken that the search looks at, without the
+  parse tree they are normally computed from.
+  """
+
+  __slots__ = ('value', 'is_comment', 'is_string', 'column',
+               'can_break_before', 'must_break_before',
+               'spaces_required_before', 'split_penalty', 'node_split_penalty',
+               'subtype', 'total_length', 'matching_bracket', 'next_token',
+               'previous_token')
+
+  def __init__(self, value, is_comment, is_string, column, can_break_before,
+               must_break_before, spaces_required_before, split_penalty,
+               node_split_penalty, subtype, total_length, matching_bracket):
+    self.value = value
+    self.is_comment = is_comment
+    self.is_string = is_string
+    self.column = column
+    self.can_break_before = can_break_before
+    self.must_break_before = must_break_before
+    self.spaces_required_before = spaces_required_before
+    self.split_penalty = split_penalty
+    self.node_split_penalty = node_split_penalty
+    self.subtype = subtype
+    self.total_length = total_length
+    self.matching_bracket = matching_bracket
+    self.next_token = None
+    self.previous_token = None
+
+  @property
+  def is_binary_op(self):
+    return self.subtype == format_token.Subtype.BINARY_OPERATOR
+
+  def OpensScope(self):
+    return self.value in pytree_utils.OPENING_BRACKETS
+
+  def ClosesScope(self):
+    return self.value in pytree_utils.CLOSING_BRACKETS
+
+
+def _AddNextStateToQueue(previous_node, newline, count, p_queue,
+                         lower_bound, upper_bound=None, successors=None):
   """Add the following state to the analysis queue.
 
-  Assume the current state is 'previous_node' and has been reached with a
-  penalty of 'penalty'. Insert a line break if 'newline' is True.
+  Assume the current state is 'previous_node'. Insert a line break if
+  'newline' is True.
 
   Arguments:
-    penalty: (int) The penalty associated with the path up to this point.
     previous_node: (_StateNode) The last _StateNode inserted into the priority
       queue.
     newline: (bool) Add a newline if True.
     count: (int) The number of elements in the queue.
     p_queue: (heapq) The priority queue representing the solution space.
+    lower_bound: (_PenaltyLowerBound) The bound on the penalty of the rest of
+      the line.
+    upper_bound: (int) If not None, the penalty of a formatting of the line.
+      States bound to end up with a higher penalty aren't queued.
+    successors: (list) If not None, the penalty the state is queued with and
+      its node are appended to it, whether or not it's queued.
 
   Returns:
     The updated number of elements in the queue.
   """
+  node = _NextStateNode(previous_node, newline)
+  if node is None:
+    return count
+
+  penalty = node.penalty + lower_bound(node.state)
+  if successors is not None:
+    successors.append((penalty, node))
+  if upper_bound is None or penalty <= upper_bound:
+    heapq.heappush(p_queue, _QueueItem(_OrderedPenalty(penalty, count), node))
+  # A state that isn't queued is still counted, so that the order of the
+  # others, and when the search gives up on telling them apart, stays the same.
+  return count + 1
+
+
+def _AddDuplicatesToQueue(node, offset, count, p_queue, upper_bound,
+                          successors, duplicates):
+  """Count the states expanding a copy of a node would add to the queue.
+
+  Arguments:
+    node: (_StateNode) The node that was popped from the queue.
+    offset: (int) How much more penalty the copy has than 'node'.
+    count: (int) The number of elements in the queue.
+    p_queue: (heapq) The priority queue representing the solution space.
+    upper_bound: see _AddNextStateToQueue().
+    successors, duplicates: see _FindSolution().
+
+  Returns:
+    The updated number of elements in the queue.
+  """
+  if node in duplicates:
+    node, extra_offset = duplicates[node]
+    offset += extra_offset
+  for penalty, next_node in successors[node]:
+    penalty += offset
+    if upper_bound is None or penalty <= upper_bound:
+      heapq.heappush(p_queue, _QueueItem(_OrderedPenalty(penalty, count),
+                                         _DuplicateNode(next_node, offset)))
+    count += 1
+  return count
+
+
+def _NextStateNode(previous_node, newline):
+  """Return the node reached by placing the next token.
+
+  Arguments:
+    previous_node: (_StateNode) The node to place the token after.
+    newline: (bool) Add a newline if True.
+
+  Returns:
+    The new _StateNode, or None if the token can't be placed that way.
+  """
+  penalty = previous_node.penalty
   if newline and not previous_node.state.CanSplit():
     # Don't add a newline if the token cannot be split.
-    return count
+    return None
   if not newline and previous_node.state.MustSplit():
     # Don't add a token we must split but where we aren't splitting.
-    return count
+    return None
 
   if previous_node.state.next_token.value in pytree_utils.CLOSING_BRACKETS:
     if _MatchingParenSplitDecision(previous_node) != newline:
@@ -258,27 +660,102 @@ def _AddNextStateToQueue(penalty, previous_node, newline, count, p_queue):
 
   node = _StateNode(previous_node.state, newline, previous_node)
   penalty += node.state.AddTokenToState(newline=newline, dry_run=True)
-  heapq.heappush(p_queue, _QueueItem(_OrderedPenalty(penalty, count), node))
-  return count + 1
+  node.penalty = penalty
+  return node
 
 
-def _ReconstructPath(initial_state, current):
-  """Reconstruct the path through the queue with lowest penalty.
+def _GreedyPenalty(initial_state):
+  """Return the penalty of formatting the line greedily.
+
+  The line is split only before the tokens it must be split before and before
+  those that would go past the column limit.
 
   Arguments:
     initial_state: (format_decision_state.FormatDecisionState) The initial state
-      to start the search from.
-    current: (_StateNode) The node in the decision graph that is the end point
-      of the path with the least penalty.
-  """
-  path = collections.deque()
+      to start from. It isn't changed.
 
-  while current.previous:
-    path.appendleft(current)
-    current = current.previous
+  Returns:
+    The penalty of the formatting, or None if there is no formatting that way.
+  """
+  column_limit = style.Get('COLUMN_LIMIT')
+  node = _StateNode(initial_state, False, None)
+  while node is not None and node.state.next_token:
+    state = node.state
+    token = state.next_token
+    length = token.total_length - token.previous_token.total_length
+    newline = state.column + length > column_limit and state.CanSplit()
+    node = (_NextStateNode(node, newline) or
+            _NextStateNode(node, not newline))
+  return node and node.penalty
+
+
+class _PenaltyLowerBound(object):
+  """A lower bound on the penalty of placing the rest of a line's tokens.
+
+  The bound is the sum of two parts, neither of which any way of placing the
+  tokens can avoid:
+
+    - The tokens up to the next one that the line can be split before go on
+      the current line, and the penalty for the characters they put past the
+      column limit follows from the current column.
+    - Each token that the line must be split before costs at least its split
+      penalty plus the penalty of 10 that any newline costs.
+
+  The bound never decreases by more than the penalty of adding a token, so
+  the search still finds the formatting with the least penalty.
+  """
 
-  for node in path:
-    initial_state.AddTokenToState(newline=node.newline, dry_run=False)
+  def __init__(self, first_token):
+    """Constructor.
+
+    Arguments:
+      first_token: (format_token.FormatToken) The first token that the search
+        places.
+    """
+    tokens = []
+    token = first_token
+    while token:
+      tokens.append(token)
+      token = token.next_token
+
+    # The penalty of the newlines that must come before each token and the
+    # tokens after it.
+    self._must_split_penalty = {}
+    # The lengths that the tokens that must go on the current line with each
+    # token add to the line, from the token on, longest first.
+    self._run_lengths = {}
+    must_split_penalty = 0
+    run_ends = []  # The total lengths of the tokens of the current run.
+    for token in reversed(tokens):
+      if token.must_break_before:
+        must_split_penalty += token.split_penalty + 10
+      self._must_split_penalty[token] = must_split_penalty
+
+      if token.can_break_before or (token.is_string and '\n' in token.value):
+        # The column after a multiline string doesn't follow from its length,
+        # so the string ends the run.
+        run_ends = []
+      else:
+        run_ends.append(token.total_length)
+        start = token.previous_token.total_length
+        self._run_lengths[token] = [end - start for end in run_ends]
+
+    self._column_limit = style.Get('COLUMN_LIMIT')
+    self._excess_character_penalty = style.Get('SPLIT_PENALTY_EXCESS_CHARACTER')
+
+  def __call__(self, state):
+    """Return the lower bound for the tokens the state has yet to place."""
+    token = state.next_token
+    if token is None:
+      return 0
+    penalty = self._must_split_penalty[token]
+    excess = 0
+    room = self._column_limit - state.column
+    for length in self._run_lengths.get(token, ()):
+      if length <= room:
+        break
+      excess += length - room
+    return penalty + excess * self._excess_character_penalty
 
 
 def _MatchingParenSplitDecision(current):
@@ -0,0 +1,383 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A content-addressed, on-disk cache of formatting results.
+
+Most of the files that YAPF is asked to format haven't changed since the last
+time it saw them. Reformatting such a file requires a full parse and a search
+through the solution space, yet the result is a pure function of the source
+code, the style, the lines to format, and the version of YAPF doing the work.
+The cache keys the result on a hash of all of these, so that an unchanged file
+costs only a hash and a lookup.
+
+Each entry is stored in its own file. An entry either holds the reformatted
+code or a marker saying that the code was already formatted. Entries are
+written atomically, and the least recently used ones are evicted once the
+cache grows past its size limit. Finding them means walking the whole cache,
+so the cache keeps a running total of its size, and is only walked once the
+total passes the limit.
+
+A file that has changed since it was last formatted usually differs in only a
+few of its top-level statements. So the cache also keeps, for each file, the
+formatted code of each of its top-level statements, keyed by a hash of the
+statement and the statement before it. The statements that are unchanged need
+not be formatted again.
+
+Formatting with another style, or only some of the lines, can't use either of
+those. Parsing the source does not depend on them, though, so the cache also
+keeps the unwrapped lines of the sources formatted with several styles or
+only in part, as serialized by line_serializer.
+
+The cache is best-effort: an I/O error never makes formatting fail. It just
+turns a lookup into a miss.
+
+  ResultCache: the main class exported by this module.
+"""
+
+import hashlib
+import json
+import os
+
+from yapf.yapflib import file_resources
+
+# The default upper limit on the size of the cache, in bytes.
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# The first byte of an entry's file says what kind of entry it is.
+_CLEAN_MARKER = b'C'
+_FORMATTED_MARKER = b'F'
+_STATEMENTS_MARKER = b'S'
+_UNWRAPPED_LINES_MARKER = b'U'
+
+# The file holding the size of the cache found by the last walk, followed by
+# the size of each entry written since, one per line. The sizes of the entries
+# start with '+'.
+_PRUNE_STAMP = 'prune-stamp'
+
+# The fraction of its size limit the cache is pruned to, which leaves room for
+# the entries of the next runs before the cache has to be walked again.
+_PRUNED_FRACTION = 0.9
+
+
+class ResultCache(object):
+  """An on-disk cache mapping source code to its reformatted version.
+
+  The object only holds the location and limits of the cache, so it can be
+  pickled and handed over to worker processes.
+
+  Attributes:
+    directory: (unicode) The directory holding the cache entries.
+    max_size: (int) The size in bytes above which entries are evicted.
+  """
+
+  def __init__(self, directory, version, max_size=DEFAULT_MAX_SIZE):
+    """Constructor.
+
+    Arguments:
+      directory: (unicode) The directory to keep the entries in. It's created
+        if it doesn't exist.
+      version: (string) The version of YAPF. Results from a different version
+        never match.
+      max_size: (int) The size in bytes above which entries are evicted.
+    """
+    self.directory = directory
+    self.max_size = max_size
+    self._salt = '{0}:{1}'.format(version, CodeFingerprint())
+
+  def Key(self, source, style_config, lines):
+    """Compute the key for formatting source with the given settings.
+
+    Arguments:
+      source: (unicode) The unformatted code.
+      style_config: (dict) The resolved style, as returned by
+        style.CreateStyleFromConfig().
+      lines: (list of tuples of integers) The lines to format, or None.
+
+    Returns:
+      The key as a hex string.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(self._salt.encode('utf-8'))
+    hasher.update(repr(sorted(style_config.items())).encode('utf-8'))
+    hasher.update(repr(lines).encode('utf-8'))
+    hasher.update(b'\0')
+    hasher.update(source.encode('utf-8'))
+    return hasher.hexdigest()
+
+  def StatementsKey(self, filename, style_config):
+    """Compute the key for the formatted statements of a file.
+
+    Arguments:
+      filename: (unicode) The name of the file.
+      style_config: (dict) The resolved style, as returned by
+        style.CreateStyleFromConfig().
+
+    Returns:
+      The key as a hex string.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(self._salt.encode('utf-8'))
+    hasher.update(repr(sorted(style_config.items())).encode('utf-8'))
+    hasher.update(b'\0statements\0')
+    hasher.update(os.path.abspath(filename).encode('utf-8'))
+    return hasher.hexdigest()
+
+  def StatementKey(self, context, statement, print_statement):
+    """Compute the key for a top-level statement.
+
+    Arguments:
+      context: (unicode) The statement before, or '' for the first statement.
+        It decides the blank lines before the statement.
+      statement: (unicode) The unformatted statement.
+      print_statement: (bool) Whether 'print' is a statement in the file.
+
+    Returns:
+      The key as a hex string.
+    """
+    hasher = hashlib.sha256()
+    hasher.update('{0}:{1}:'.format(print_statement,
+                                    len(context)).encode('utf-8'))
+    hasher.update(context.encode('utf-8'))
+    hasher.update(statement.encode('utf-8'))
+    return hasher.hexdigest()
+
+  def UnwrappedLinesKey(self, source, print_statement):
+    """Compute the key for the unwrapped lines of source.
+
+    Arguments:
+      source: (unicode) The unformatted code.
+      print_statement: (bool) See pytree_utils.ParseCodeToTree().
+
+    Returns:
+      The key as a hex string.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(self._salt.encode('utf-8'))
+    hasher.update('\0unwrapped:{0}\0'.format(print_statement).encode('utf-8'))
+    hasher.update(source.encode('utf-8'))
+    return hasher.hexdigest()
+
+  def Get(self, key, source):
+    """Look up the reformatted version of source.
+
+    Arguments:
+      key: (string) The key returned by Key() for source.
+      source: (unicode) The unformatted code.
+
+    Returns:
+      The reformatted code, or None if it isn't in the cache.
+    """
+    path = self._EntryPath(key)
+    try:
+      with open(path, 'rb') as fd:
+        data = fd.read()
+      # Mark the entry as recently used.
+      os.utime(path, None)
+    except (IOError, OSError):
+      return None
+    if data[:1] == _CLEAN_MARKER:
+      return source
+    if data[:1] == _FORMATTED_MARKER:
+      return data[1:].decode('utf-8')
+    return None
+
+  def Put(self, key, source, reformatted_source):
+    """Record the reformatted version of source.
+
+    Arguments:
+      key: (string) The key returned by Key() for source.
+      source: (unicode) The unformatted code.
+      reformatted_source: (unicode) The result of formatting source.
+    """
+    if source == reformatted_source:
+      data = _CLEAN_MARKER
+    else:
+      data = _FORMATTED_MARKER + reformatted_source.encode('utf-8')
+    self._WriteEntry(key, data)
+
+  def GetStatements(self, key):
+    """Look up the formatted statements of a file.
+
+    Arguments:
+      key: (string) The key returned by StatementsKey() for the file.
+
+    Returns:
+      A dict mapping the keys returned by StatementKey() to the formatted code
+      of the statements. Empty if there is no entry.
+    """
+    path = self._EntryPath(key)
+    try:
+      with open(path, 'rb') as fd:
+        data = fd.read()
+      os.utime(path, None)
+    except (IOError, OSError):
+      return {}
+    if data[:1] != _STATEMENTS_MARKER:
+      return {}
+    try:
+      return json.loads(data[1:].decode('utf-8'))
+    except ValueError:
+      return {}
+
+  def PutStatements(self, key, statements):
+    """Record the formatted statements of a file.
+
+    The entry replaces the one recorded for the file before, so it holds only
+    the statements the file has now.
+
+    Arguments:
+      key: (string) The key returned by StatementsKey() for the file.
+      statements: (dict) Maps the keys returned by StatementKey() to the
+        formatted code of the statements.
+    """
+    self._WriteEntry(key,
+                     _STATEMENTS_MARKER + json.dumps(statements).encode('utf-8'))
+
+  def GetUnwrappedLines(self, key):
+    """Look up the unwrapped lines of a source.
+
+    Arguments:
+      key: (string) The key returned by UnwrappedLinesKey() for the source.
+
+    Returns:
+      The lines as serialized by line_serializer.Serialize(), or None if they
+      aren't in the cache.
+    """
+    path = self._EntryPath(key)
+    try:
+      with open(path, 'rb') as fd:
+        data = fd.read()
+      os.utime(path, None)
+    except (IOError, OSError):
+      return None
+    if data[:1] != _UNWRAPPED_LINES_MARKER:
+      return None
+    return data[1:]
+
+  def PutUnwrappedLines(self, key, data):
+    """Record the unwrapped lines of a source.
+
+    Arguments:
+      key: (string) The key returned by UnwrappedLinesKey() for the source.
+      data: (bytes) The lines as serialized by line_serializer.Serialize().
+    """
+    self._WriteEntry(key, _UNWRAPPED_LINES_MARKER + data)
+
+  def Prune(self, force=False):
+    """Evict the least recently used entries if the cache is past its limit.
+
+    Walking the cache takes time in proportion to its size, which would
+    dwarf the time a run that finds all its results in the cache takes. So
+    the cache is only walked when the size of the cache at the last walk, plus
+    the sizes of the entries written since, as recorded in a stamp file, is
+    past the limit. It's then pruned to _PRUNED_FRACTION of the limit.
+
+    Arguments:
+      force: (bool) Walk the cache whatever the recorded size.
+    """
+    stamp_path = os.path.join(self.directory, _PRUNE_STAMP)
+    if not force:
+      recorded_size = _RecordedSize(stamp_path)
+      if recorded_size is not None and recorded_size <= self.max_size:
+        return
+
+    entries = []
+    total_size = 0
+    for dirpath, _, filenames in os.walk(self.directory):
+      for filename in filenames:
+        path = os.path.join(dirpath, filename)
+        if path == stamp_path:
+          continue
+        try:
+          stat = os.stat(path)
+        except OSError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total_size += stat.st_size
+
+    if total_size > self.max_size:
+      pruned_size = int(self.max_size * _PRUNED_FRACTION)
+      for _, size, path in sorted(entries):
+        try:
+          os.remove(path)
+        except OSError:
+          continue
+        total_size -= size
+        if total_size <= pruned_size:
+          break
+
+    try:
+      file_resources.WriteFileAtomically(
+          stamp_path, '{0}\n'.format(total_size).encode('ascii'))
+    except (IOError, OSError):
+      pass
+
+  def _WriteEntry(self, key, data):
+    """Write an entry, adding its size to the size recorded for the cache."""
+    try:
+      file_resources.WriteFileAtomically(self._EntryPath(key), data)
+    except (IOError, OSError):
+      return
+    try:
+      # The size is appended rather than added to a total, so that processes
+      # writing entries at the same time don't lose each other's.
+      with open(os.path.join(self.directory, _PRUNE_STAMP), 'ab') as fd:
+        fd.write('+{0}\n'.format(len(data)).encode('ascii'))
+    except (IOError, OSError):
+      pass
+
+  def _EntryPath(self, key):
+    # Fan the entries out over subdirectories to keep directories small.
+    return os.path.join(self.directory, key[:2], key[2:])
+
+
+def _RecordedSize(stamp_path):
+  """Return the size of the cache recorded in the stamp file.
+
+  Arguments:
+    stamp_path: (unicode) The name of the stamp file.
+
+  Returns:
+    The size in bytes, or None if it isn't known because the cache hasn't been
+    walked since the stamp file was last removed.
+  """
+  try:
+    with open(stamp_path, 'rb') as fd:
+      sizes = fd.read().split()
+  except (IOError, OSError):
+    return None
+  if not sizes or sizes[0].startswith(b'+'):
+    return None
+  try:
+    return sum(int(size) for size in sizes)
+  except ValueError:
+    return None
+
+
+def CodeFingerprint():
+  """Return a fingerprint of the YAPF code that is running.
+
+  The version number alone doesn't change while YAPF is being worked on, so
+  the sizes and modification times of the modules are folded into the keys as
+  well.
+
+  Returns:
+    The fingerprint as a string.
+  """
+  package_dir = os.path.dirname(os.path.abspath(file_resources.__file__))
+  parts = []
+  for filename in sorted(os.listdir(package_dir)):
+    if filename.endswith('.py'):
+      stat = os.stat(os.path.join(package_dir, filename))
+      parts.append('{0}:{1}:{2}'.format(filename, stat.st_size, stat.st_mtime))
+  return hashlib.sha256(';'.join(parts).encode('utf-8')).hexdigest()
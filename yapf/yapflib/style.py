@@ -32,6 +32,11 @@ def Get(setting_name):
   return _style[setting_name]
 
 
+def GetGlobalStyle():
+  """Get the style dict set with SetGlobalStyle()."""
+  return _style
+
+
 def SetGlobalStyle(style):
   """Set a style dict."""
   global _style
@@ -103,6 +108,15 @@ def CreatePEP8Style():
       # more line splits added the higher the penalty.
       SPLIT_PENALTY_FOR_ADDED_LINE_SPLIT=30,
 
+      # How to search for the formatting of a line with the least penalty.
+      # 'dijkstra' looks at as many formattings as it takes to find it. 'beam'
+      # keeps only the BEAM_WIDTH best formattings of the tokens so far, which
+      # bounds the work on very long lines but may miss the best formatting.
+      SEARCH_STRATEGY='dijkstra',
+
+      # The number of formattings the 'beam' search strategy keeps.
+      BEAM_WIDTH=20,
+
       # Use tabs in the resulting file.
       USE_TAB=False,
 
@@ -126,12 +140,30 @@ _STYLE_NAME_TO_FACTORY = dict(
     google=CreateGoogleStyle,
 )
 
+_SEARCH_STRATEGIES = ('dijkstra', 'beam')
+
 
 def _StringListConverter(s):
   """Option value converter for a comma-separated list of strings."""
   return [part.strip() for part in s.split(',')]
 
 
+def _SearchStrategyConverter(s):
+  """Option value converter for a search strategy."""
+  strategy = s.strip().lower()
+  if strategy not in _SEARCH_STRATEGIES:
+    raise StyleConfigError('Unknown search strategy "{0}"'.format(s))
+  return strategy
+
+
+def _PositiveIntConverter(s):
+  """Option value converter for a positive integer."""
+  value = int(s)
+  if value < 1:
+    raise StyleConfigError('Expected a positive number, got "{0}"'.format(s))
+  return value
+
+
 def _BoolConverter(s):
   """Option value converter for a boolean."""
   # borrowed from configparser.
@@ -163,6 +195,8 @@ _STYLE_OPTION_VALUE_CONVERTER = dict(
     SPLIT_PENALTY_MATCHING_BRACKET=int,
     SPLIT_PENALTY_AFTER_OPENING_BRACKET=int,
     SPLIT_PENALTY_FOR_ADDED_LINE_SPLIT=int,
+    SEARCH_STRATEGY=_SearchStrategyConverter,
+    BEAM_WIDTH=_PositiveIntConverter,
     USE_TAB=_BoolConverter,
     TAB_WIDTH=int,
 )
@@ -176,7 +210,8 @@ def CreateStyleFromConfig(style_config):
       contain settings. It can have a special BASED_ON_STYLE setting naming the
       style which it derives from. If no such setting is found, it derives from
       the default style. When style_config is None, the DEFAULT_STYLE_FACTORY
-      config is created.
+      config is created. A style dict that was already created is returned as
+      is.
 
   Returns:
     A style dict.
@@ -186,6 +221,8 @@ def CreateStyleFromConfig(style_config):
   """
   if style_config is None:
     return DEFAULT_STYLE_FACTORY()
+  if isinstance(style_config, dict):
+    return style_config
   style_factory = _STYLE_NAME_TO_FACTORY.get(style_config.lower())
   if style_factory is not None:
     return style_factory()
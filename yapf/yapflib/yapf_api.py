@@ -17,6 +17,12 @@ The main APIs that YAPF exposes to drive the reformatting.
 
   FormatFile(): reformat a file.
   FormatCode(): reformat a string of code.
+  FormatCodeWithStyles(): reformat a string of code with each of several
+    styles, parsing it only once.
+  CheckCode(): check whether a string of code is already formatted.
+  FormatCodeInChunks(): reformat a string of code a few statements at a time.
+  IncrementalFormatter: reformat a document as it is edited.
+  Formatter: reformat any number of files or strings of code with one style.
 
 These APIs have some common arguments:
 
@@ -29,50 +35,51 @@ These APIs have some common arguments:
     than a whole file.
   print_diff: (bool) Instead of returning the reformatted source, return a
     diff that turns the formatted source into reformatter source.
+  cache: (result_cache.ResultCache) A cache of formatting results. If the
+    source was formatted before with the same settings, the result is taken
+    from the cache instead of being recomputed. When the source is formatted
+    with several styles, or only some of its lines are, the parsed source is
+    kept in the cache as well, so that formatting it with another style, or
+    other lines, needn't parse it again. If None, no cache is used.
 """
 
-import difflib
+import bisect
 import io
-import logging
+import itertools
 import re
 
-from yapf.yapflib import blank_line_calculator
-from yapf.yapflib import comment_splicer
-from yapf.yapflib import line_joiner
-from yapf.yapflib import pytree_unwrapper
-from yapf.yapflib import pytree_utils
-from yapf.yapflib import reformatter
-from yapf.yapflib import split_penalty
+from yapf.yapflib import py3compat
 from yapf.yapflib import style
-from yapf.yapflib import subtype_assigner
 
+# The parser, the passes over the parse tree, and the reformatter are imported
+# only once code is parsed, and difflib only once a diff is made. Loading the
+# grammar alone takes a good part of YAPF's startup time, and a run that gets
+# all of its results from the cache never needs it.
 
-def FormatFile(filename, style_config=None, lines=None, print_diff=False):
+
+def FormatFile(filename, style_config=None, lines=None, print_diff=False,
+               cache=None):
   """Format a single Python file and return the formatted code.
 
   Arguments:
     filename: (unicode) The file to reformat.
-    style_config, lines, print_diff: see comment at the top of this module.
+    style_config, lines, print_diff, cache: see comment at the top of this
+      module.
 
   Returns:
     The reformatted code or None if the file doesn't exist.
   """
-  original_source = ReadFile(filename, logging.warning)
-  if original_source is None:
-    return None
-
-  return FormatCode(original_source,
-                    style_config=style_config,
-                    filename=filename,
-                    lines=lines,
-                    print_diff=print_diff)
+  return Formatter(style_config, cache=cache).FormatFile(filename,
+                                                         lines=lines,
+                                                         print_diff=print_diff)
 
 
 def FormatCode(unformatted_source,
                filename='<unknown>',
                style_config=None,
                lines=None,
-               print_diff=False):
+               print_diff=False,
+               cache=None):
   """Format a string of Python code.
 
   This provides an alternative entry point to YAPF.
@@ -80,13 +87,592 @@ def FormatCode(unformatted_source,
   Arguments:
     unformatted_source: (unicode) The code to format.
     filename: (unicode) The name of the file being reformatted.
-    style_config, lines, print_diff: see comment at the top of this module.
+    style_config, lines, print_diff, cache: see comment at the top of this
+      module.
 
   Returns:
     The code reformatted to conform to the desired formatting style.
   """
-  style.SetGlobalStyle(style.CreateStyleFromConfig(style_config))
-  tree = pytree_utils.ParseCodeToTree(unformatted_source)
+  return Formatter(style_config, cache=cache).FormatCode(unformatted_source,
+                                                         filename=filename,
+                                                         lines=lines,
+                                                         print_diff=print_diff)
+
+
+def FormatCodeWithStyles(unformatted_source,
+                         style_configs,
+                         filename='<unknown>',
+                         lines=None,
+                         print_diff=False,
+                         cache=None):
+  """Format a string of Python code with each of several styles.
+
+  Parsing the code and the passes over the parse tree don't depend on the
+  style, so they are run only once. Only the reformatting is done for each
+  style.
+
+  Arguments:
+    unformatted_source: (unicode) The code to format.
+    style_configs: (list) The styles, each as the 'style_config' argument of
+      FormatCode(), or a dict as returned by style.CreateStyleFromConfig().
+    filename: (unicode) The name of the file being reformatted. In diffs, it
+      is followed by the style in parentheses, or by the position of the style
+      in 'style_configs' if it is a dict.
+    lines, print_diff, cache: see comment at the top of this module.
+
+  Returns:
+    A list of the code reformatted with each style, in the order of the
+    styles.
+  """
+  from yapf.yapflib import line_serializer  # pylint: disable=g-import-not-at-top
+
+  serialized_lines = None
+  results = []
+  for i, style_config in enumerate(style_configs):
+    formatter = Formatter(style_config, cache=cache)
+    reformatted_source = None
+    if cache is not None:
+      cache_key = cache.Key(unformatted_source, formatter.style, lines)
+      reformatted_source = cache.Get(cache_key, unformatted_source)
+    if reformatted_source is None:
+      if serialized_lines is None:
+        serialized_lines = _SerializedUnwrappedLines(unformatted_source, cache)
+      # The reformatter changes the lines, so each style gets its own copy.
+      style.SetGlobalStyle(formatter.style)
+      uwlines = _CalculateFormattingInformation(
+          line_serializer.Deserialize(serialized_lines))
+      reformatted_source = _ReformatUnwrapped(unformatted_source, uwlines,
+                                              lines)
+      if cache is not None:
+        cache.Put(cache_key, unformatted_source, reformatted_source)
+    label = i if isinstance(style_config, dict) else style_config
+    results.append(_FormatResult(unformatted_source, reformatted_source,
+                                 '{0} ({1})'.format(filename, label),
+                                 print_diff))
+  return results
+
+
+def CheckCode(unformatted_source, style_config=None, lines=None, cache=None):
+  """Check whether a string of Python code is formatted.
+
+  This is cheaper than comparing the code with the result of FormatCode(): the
+  work stops at the first line that would change.
+
+  Arguments:
+    unformatted_source: (unicode) The code to check.
+    style_config, lines, cache: see comment at the top of this module.
+
+  Returns:
+    True if formatting the code wouldn't change it.
+  """
+  return Formatter(style_config, cache=cache).CheckCode(unformatted_source,
+                                                        lines=lines)
+
+
+def FormatCodeInChunks(unformatted_source, style_config=None):
+  """Format a string of Python code a few statements at a time.
+
+  Only the statements being formatted are held in memory, so this can format
+  modules too large for FormatCode(). The result is the same.
+
+  Arguments:
+    unformatted_source: (unicode) The code to format.
+    style_config: see comment at the top of this module.
+
+  Yields:
+    The pieces of the reformatted code, in order.
+  """
+  return Formatter(style_config).FormatCodeInChunks(unformatted_source)
+
+
+class Formatter(object):
+  """Formats code with a single style.
+
+  The style is resolved once, when the formatter is created, instead of on
+  every call. Use a formatter when formatting many files or snippets with the
+  same style.
+
+  Attributes:
+    style: (dict) The resolved style.
+  """
+
+  def __init__(self, style_config=None, cache=None, pool=None):
+    """Constructor.
+
+    Arguments:
+      style_config, cache: see comment at the top of this module. The style
+        may also be a dict, as returned by style.CreateStyleFromConfig().
+      pool: (multiprocessing.Pool) If not None, search for the best formatting
+        of the longer lines of each file in this pool's worker processes. This
+        lets a single large file use more than one CPU. It doesn't apply to
+        checking code, or to formatting only some lines.
+    """
+    self.style = style.CreateStyleFromConfig(style_config)
+    self._cache = cache
+    self._pool = pool
+
+  def FormatFile(self, filename, lines=None, print_diff=False):
+    """Format a single Python file and return the formatted code.
+
+    Arguments:
+      filename: (unicode) The file to reformat.
+      lines, print_diff: see comment at the top of this module.
+
+    Returns:
+      The reformatted code or None if the file doesn't exist.
+    """
+    original_source = ReadFile(filename, _LogWarning)
+    if original_source is None:
+      return None
+
+    return self.FormatCode(original_source, filename=filename, lines=lines,
+                           print_diff=print_diff)
+
+  def FormatCode(self, unformatted_source, filename='<unknown>', lines=None,
+                 print_diff=False):
+    """Format a string of Python code.
+
+    Arguments:
+      unformatted_source: (unicode) The code to format.
+      filename: (unicode) The name of the file being reformatted.
+      lines, print_diff: see comment at the top of this module.
+
+    Returns:
+      The code reformatted to conform to the desired formatting style.
+    """
+    reformatted_source = None
+    if self._cache is not None:
+      cache_key = self._cache.Key(unformatted_source, self.style, lines)
+      reformatted_source = self._cache.Get(cache_key, unformatted_source)
+    if reformatted_source is None:
+      style.SetGlobalStyle(self.style)
+      if (self._cache is not None and lines is None and
+          filename != '<unknown>'):
+        reformatted_source = self._ReformatChangedStatements(unformatted_source,
+                                                             filename)
+      else:
+        reformatted_source = _Reformat(unformatted_source, lines, self._pool,
+                                       self._cache)
+      if self._cache is not None:
+        self._cache.Put(cache_key, unformatted_source, reformatted_source)
+
+    return _FormatResult(unformatted_source, reformatted_source, filename,
+                         print_diff)
+
+  def _ReformatChangedStatements(self, unformatted_source, filename):
+    """Reformat the source, reusing what the cache knows about the file.
+
+    The top-level statements that are the same as when the file was last
+    formatted, and follow the same statement, are taken from the cache.
+
+    Arguments:
+      unformatted_source: (unicode) The code to format.
+      filename: (unicode) The name of the file the code is from.
+
+    Returns:
+      The same as _Reformat(unformatted_source, None).
+    """
+    # pylint: disable=g-import-not-at-top
+    from lib2to3.pgen2 import tokenize
+    from yapf.yapflib import pytree_utils
+    # pylint: enable=g-import-not-at-top
+
+    if _DISABLE_OR_ENABLE.search(unformatted_source):
+      return _Reformat(unformatted_source, None, self._pool, self._cache)
+    try:
+      statements = [''.join(statement) for statement in
+                    _SplitStatements(_IterLines(unformatted_source))]
+    except (tokenize.TokenError, IndentationError):
+      # Let the parser report the error.
+      return _Reformat(unformatted_source, None, self._pool, self._cache)
+    print_statement = pytree_utils.HasPrintStatement(unformatted_source)
+
+    statements_key = self._cache.StatementsKey(filename, self.style)
+    known = self._cache.GetStatements(statements_key)
+    keys = [self._cache.StatementKey(context, statement, print_statement)
+            for context, statement in zip([''] + statements, statements)]
+    pieces = _ReformatStatements(unformatted_source, statements,
+                                 print_statement,
+                                 [known.get(key) for key in keys], self._pool,
+                                 self._cache)
+    self._cache.PutStatements(statements_key, dict(zip(keys, pieces)))
+
+    reformatted_source = ''.join(pieces)
+    return reformatted_source + '\n' if reformatted_source else ''
+
+  def CheckCode(self, unformatted_source, lines=None):
+    """Check whether a string of Python code is formatted.
+
+    Arguments:
+      unformatted_source: (unicode) The code to check.
+      lines: see comment at the top of this module.
+
+    Returns:
+      True if formatting the code wouldn't change it.
+    """
+    if self._cache is not None:
+      cache_key = self._cache.Key(unformatted_source, self.style, lines)
+      reformatted_source = self._cache.Get(cache_key, unformatted_source)
+      if reformatted_source is not None:
+        return (not reformatted_source or
+                reformatted_source == unformatted_source)
+
+    style.SetGlobalStyle(self.style)
+    clean = _IsFormatted(unformatted_source, lines, self._cache)
+    if clean and self._cache is not None:
+      # Only the clean result is known in full.
+      self._cache.Put(cache_key, unformatted_source, unformatted_source)
+    return clean
+
+  def FormatCodeInChunks(self, unformatted_source):
+    """Format a string of Python code a few statements at a time.
+
+    Arguments:
+      unformatted_source: (unicode) The code to format.
+
+    Yields:
+      The pieces of the reformatted code, in order. They add up to what
+      FormatCode() would return.
+    """
+    chunks = _ReformatInChunks(unformatted_source)
+    while True:
+      # Other formatters may have run while this one was suspended.
+      style.SetGlobalStyle(self.style)
+      try:
+        chunk = next(chunks)
+      except StopIteration:
+        return
+      yield chunk
+
+  def FormatMany(self, unformatted_sources):
+    """Format strings of Python code.
+
+    Arguments:
+      unformatted_sources: (iterable of unicode) The code to format.
+
+    Yields:
+      The reformatted version of each string, in order.
+    """
+    for unformatted_source in unformatted_sources:
+      yield self.FormatCode(unformatted_source)
+
+
+class IncrementalFormatter(object):
+  """Formats a document that is edited a little at a time.
+
+  Editors send the same buffer over and over with small changes. This keeps
+  the document split into its top-level statements, along with the formatted
+  code of each. After an edit, only the statements the edit touches, and the
+  statement after them, are parsed and formatted again. The result is the same
+  as that of FormatCode().
+
+  Attributes:
+    source: (unicode) The text of the document.
+    style: (dict) The resolved style.
+  """
+
+  def __init__(self, source=u'', style_config=None):
+    """Constructor.
+
+    Arguments:
+      source: (unicode) The initial text of the document.
+      style_config: see comment at the top of this module.
+    """
+    self.style = style.CreateStyleFromConfig(style_config)
+    self.source = source
+    # The text of each top-level statement, or None if the document has to be
+    # split again.
+    self._statements = None
+    # Maps a statement, the statement before it, and whether 'print' is a
+    # statement, to the formatted code of the statement.
+    self._formatted = {}
+
+  def Edit(self, start, end, text):
+    """Replace part of the document.
+
+    Arguments:
+      start: (int) The offset of the first character to replace.
+      end: (int) The offset after the last character to replace. If equal to
+        'start', the text is inserted.
+      text: (unicode) The replacement text.
+
+    Raises:
+      ValueError: if the offsets are out of range.
+    """
+    if not 0 <= start <= end <= len(self.source):
+      raise ValueError('edit range {0}-{1} outside of document of length '
+                       '{2}'.format(start, end, len(self.source)))
+    self.source = self.source[:start] + text + self.source[end:]
+    if self._statements is not None:
+      self._statements = self._SplitStatementsAfterEdit(start, end, len(text))
+
+  def FormatCode(self):
+    """Format the document.
+
+    Returns:
+      The same as FormatCode(self.source).
+    """
+    from yapf.yapflib import pytree_utils  # pylint: disable=g-import-not-at-top
+
+    style.SetGlobalStyle(self.style)
+    if _DISABLE_OR_ENABLE.search(self.source):
+      return _Reformat(self.source, None)
+
+    if self._statements is None:
+      self._statements = [''.join(statement) for statement in
+                          _SplitStatements(_IterLines(self.source))]
+    print_statement = pytree_utils.HasPrintStatement(self.source)
+
+    keys = [(context, statement, print_statement) for context, statement in
+            zip([''] + self._statements, self._statements)]
+    pieces = _ReformatStatements(self.source, self._statements,
+                                 print_statement,
+                                 [self._formatted.get(key) for key in keys])
+    # Forget the statements that are gone.
+    self._formatted = dict(zip(keys, pieces))
+
+    reformatted_source = ''.join(pieces)
+    return reformatted_source + '\n' if reformatted_source else ''
+
+  def _SplitStatementsAfterEdit(self, start, end, length):
+    """Split the document into statements again after an edit.
+
+    Only the statements from the one before the edit up to the first one after
+    it that starts where it did before are split again.
+
+    Arguments:
+      start, end: (int) The offsets of the replaced text in the old document.
+      length: (int) The length of the replacement text.
+
+    Returns:
+      The new list of statements, or None if the document can't be split.
+    """
+    from lib2to3.pgen2 import tokenize  # pylint: disable=g-import-not-at-top
+
+    statements = self._statements
+    index = 0
+    offset = 0
+    while (index < len(statements) and
+           offset + len(statements[index]) <= start):
+      offset += len(statements[index])
+      index += 1
+    if index:
+      # The edit may join the statement to the one before, e.g. by indenting
+      # it or turning it into an 'else' clause.
+      index -= 1
+      offset -= len(statements[index])
+
+    # Where the statements after the edit start in the new document.
+    unchanged_starts = {}
+    old_offset = offset
+    for i in py3compat.range(index, len(statements)):
+      if old_offset >= end:
+        unchanged_starts[old_offset + length - (end - start)] = i
+      old_offset += len(statements[i])
+
+    new_statements = statements[:index]
+    try:
+      for statement in _SplitStatements(_IterLines(self.source[offset:])):
+        if offset in unchanged_starts:
+          # The rest of the document splits as before.
+          new_statements.extend(statements[unchanged_starts[offset]:])
+          break
+        statement = ''.join(statement)
+        new_statements.append(statement)
+        offset += len(statement)
+    except (tokenize.TokenError, IndentationError):
+      return None
+    return new_statements
+
+
+def _Reformat(unformatted_source, lines, pool=None, cache=None):
+  """Reformat the source with the global style.
+
+  Arguments:
+    unformatted_source: (unicode) The code to format.
+    lines: (list of tuples of integers) The lines to format, or None.
+    pool: (multiprocessing.Pool) See reformatter.Reformat().
+    cache: (result_cache.ResultCache) See _Unwrap().
+
+  Returns:
+    The reformatted code, or the empty string if there is no code to format.
+  """
+  if lines is not None:
+    uwlines = _UnwrapLines(unformatted_source, lines, cache)
+  else:
+    uwlines = _Unwrap(unformatted_source, cache=cache)
+  return _ReformatUnwrapped(unformatted_source, uwlines, lines, pool)
+
+
+def _ReformatUnwrapped(unformatted_source, uwlines, lines, pool=None):
+  """Reformat the unwrapped lines of the source with the global style.
+
+  Arguments:
+    unformatted_source: (unicode) The code to format.
+    uwlines: (list of unwrapped_line.UnwrappedLine) The lines of the code, with
+      their formatting information calculated for the global style.
+    lines: (list of tuples of integers) The lines to format, or None.
+    pool: (multiprocessing.Pool) See reformatter.Reformat().
+
+  Returns:
+    The same as _Reformat().
+  """
+  from yapf.yapflib import reformatter  # pylint: disable=g-import-not-at-top
+
+  if not uwlines:
+    return ''
+  if lines is None:
+    lines = _LinesToFormat(uwlines)
+    if not lines:
+      return reformatter.Reformat(uwlines, pool)
+  return _FormatLineSnippets(unformatted_source, uwlines, lines)
+
+
+def _FormatResult(unformatted_source, reformatted_source, filename,
+                  print_diff):
+  """Return what FormatCode() returns, given the reformatted source."""
+  if not reformatted_source:
+    return ''
+
+  if unformatted_source == reformatted_source:
+    return '' if print_diff else reformatted_source
+
+  if print_diff:
+    return _GetUnifiedDiff(unformatted_source, reformatted_source,
+                           filename=filename)
+
+  return reformatted_source
+
+
+def _IsFormatted(unformatted_source, lines, cache=None):
+  """Check the source against the global style.
+
+  Arguments:
+    unformatted_source: (unicode) The code to check.
+    lines: (list of tuples of integers) The lines to format, or None.
+    cache: (result_cache.ResultCache) See _Unwrap().
+
+  Returns:
+    True if _Reformat() would return the source unchanged, or nothing at all.
+  """
+  from yapf.yapflib import reformatter  # pylint: disable=g-import-not-at-top
+
+  if lines is not None:
+    uwlines = _UnwrapLines(unformatted_source, lines, cache)
+  else:
+    uwlines = _Unwrap(unformatted_source, cache=cache)
+  if not uwlines:
+    return True
+
+  if lines is None:
+    lines = _LinesToFormat(uwlines)
+    if not lines:
+      return reformatter.IsFormatted(uwlines, unformatted_source)
+  return (_FormatLineSnippets(unformatted_source, uwlines, lines) ==
+          unformatted_source)
+
+
+def _Unwrap(unformatted_source, print_statement=None, cache=None,
+            keep=False):
+  """Parse the source into unwrapped lines ready to be reformatted.
+
+  Arguments:
+    unformatted_source: (unicode) The code to parse.
+    print_statement: (bool) See pytree_utils.ParseCodeToTree().
+    cache: (result_cache.ResultCache) If not None, take the unwrapped lines
+      from this cache if they are in it.
+    keep: (bool) Put the unwrapped lines in the cache if they aren't in it.
+      They take several times the size of the source, so they are only kept
+      when they are likely to be used again: when the source is formatted with
+      several styles, or only some of its lines are.
+
+  Returns:
+    A list of unwrapped_line.UnwrappedLine.
+  """
+  from yapf.yapflib import line_serializer  # pylint: disable=g-import-not-at-top
+
+  uwlines = None
+  if cache is not None:
+    uwlines = _CachedUnwrappedLines(unformatted_source, print_statement, cache)
+  if uwlines is None:
+    uwlines = _ParseAndUnwrap(unformatted_source, print_statement)
+    if cache is not None and keep:
+      cache.PutUnwrappedLines(
+          cache.UnwrappedLinesKey(unformatted_source, print_statement),
+          line_serializer.Serialize(uwlines))
+  return _CalculateFormattingInformation(uwlines)
+
+
+def _CachedUnwrappedLines(unformatted_source, print_statement, cache):
+  """Return the unwrapped lines of the source from the cache, or None."""
+  from yapf.yapflib import line_serializer  # pylint: disable=g-import-not-at-top
+
+  data = cache.GetUnwrappedLines(cache.UnwrappedLinesKey(unformatted_source,
+                                                         print_statement))
+  if data is None:
+    return None
+  try:
+    return line_serializer.Deserialize(data)
+  except ValueError:
+    return None
+
+
+def _SerializedUnwrappedLines(unformatted_source, cache):
+  """Return the serialized unwrapped lines of the source.
+
+  Arguments:
+    unformatted_source: (unicode) The code to parse.
+    cache: (result_cache.ResultCache) See _Unwrap(). May be None.
+
+  Returns:
+    The lines as serialized by line_serializer.Serialize().
+  """
+  from yapf.yapflib import line_serializer  # pylint: disable=g-import-not-at-top
+
+  if cache is not None:
+    cache_key = cache.UnwrappedLinesKey(unformatted_source, None)
+    data = cache.GetUnwrappedLines(cache_key)
+    if data is not None:
+      return data
+  data = line_serializer.Serialize(_ParseAndUnwrap(unformatted_source, None))
+  if cache is not None:
+    cache.PutUnwrappedLines(cache_key, data)
+  return data
+
+
+def _CalculateFormattingInformation(uwlines):
+  """Prepare unwrapped lines for the reformatter with the global style."""
+  from yapf.yapflib import line_joiner  # pylint: disable=g-import-not-at-top
+
+  if not uwlines:
+    return uwlines
+  for uwl in uwlines:
+    uwl.CalculateFormattingInformation()
+
+  line_joiner.CanMergeMultipleLines(uwlines)
+  return uwlines
+
+
+def _ParseAndUnwrap(unformatted_source, print_statement):
+  """Parse the source and run the passes that don't depend on the style.
+
+  Arguments:
+    unformatted_source: (unicode) The code to parse.
+    print_statement: (bool) See pytree_utils.ParseCodeToTree().
+
+  Returns:
+    A list of unwrapped_line.UnwrappedLine, without formatting information.
+  """
+  # pylint: disable=g-import-not-at-top
+  from yapf.yapflib import blank_line_calculator
+  from yapf.yapflib import comment_splicer
+  from yapf.yapflib import pytree_unwrapper
+  from yapf.yapflib import pytree_utils
+  from yapf.yapflib import split_penalty
+  from yapf.yapflib import subtype_assigner
+  # pylint: enable=g-import-not-at-top
+
+  tree = pytree_utils.ParseCodeToTree(unformatted_source, print_statement)
 
   # Run passes on the tree, modifying it in place.
   comment_splicer.SpliceComments(tree)
@@ -94,34 +680,316 @@ def FormatCode(unformatted_source,
   split_penalty.ComputeSplitPenalties(tree)
   blank_line_calculator.CalculateBlankLines(tree)
 
-  uwlines = pytree_unwrapper.UnwrapPyTree(tree)
+  return pytree_unwrapper.UnwrapPyTree(tree)
+
+
+def _UnwrapLines(unformatted_source, lines, cache=None):
+  """Parse just enough of the source to format the given lines.
+
+  Each range of lines is widened to the top-level statements it touches, and
+  only those statements are parsed. They are parsed in place, after as many
+  empty lines as precede them, so that the unwrapped lines have the same line
+  numbers as they would have if the whole source were parsed.
+
+  If the unwrapped lines of the whole source are in the cache, they are used
+  instead. When the whole source has to be parsed, its unwrapped lines are put
+  in the cache. The regions aren't: other lines would make other regions.
+
+  Arguments:
+    unformatted_source: (unicode) The code to format.
+    lines: (list of tuples of integers) The lines to format.
+    cache: (result_cache.ResultCache) See _Unwrap().
+
+  Returns:
+    The unwrapped lines of the parsed statements, in order.
+  """
+  if cache is not None:
+    uwlines = _CachedUnwrappedLines(unformatted_source, None, cache)
+    if uwlines is not None:
+      return _CalculateFormattingInformation(uwlines)
+
+  regions = _EnclosingStatements(unformatted_source, lines)
+  if regions is None:
+    return _Unwrap(unformatted_source, cache=cache, keep=True)
+
+  source_lines = unformatted_source.splitlines(True)
+  region_sources = []
+  for start, end in regions:
+    region_source = ''.join(source_lines[start - 1:end - 1])
+    if (re.search(r'\bprint\b', region_source) and
+        _MayNeedPrintStatementGrammar(unformatted_source, region_source)):
+      # Whether 'print' is a statement in this region depends on the rest of
+      # the file.
+      return _Unwrap(unformatted_source, cache=cache, keep=True)
+    region_sources.append('\n' * (start - 1) + region_source)
+
+  uwlines = []
+  for region_source in region_sources:
+    uwlines.extend(_Unwrap(region_source))
   if not uwlines:
-    return ''
-  for uwl in uwlines:
-    uwl.CalculateFormattingInformation()
+    # Whether there is any code at all depends on the rest of the file.
+    return _Unwrap(unformatted_source, cache=cache, keep=True)
+  return uwlines
 
-  line_joiner.CanMergeMultipleLines(uwlines)
 
-  if lines is not None:
-    reformatted_source = _FormatLineSnippets(unformatted_source, uwlines, lines)
-  else:
-    lines = _LinesToFormat(uwlines)
-    if lines:
-      reformatted_source = _FormatLineSnippets(unformatted_source, uwlines,
-                                               lines)
+def _MayNeedPrintStatementGrammar(unformatted_source, region_source):
+  """Check if parsing the region alone could get 'print' wrong."""
+  from yapf.yapflib import pytree_utils  # pylint: disable=g-import-not-at-top
+
+  if pytree_utils.HasPrintStatement(region_source):
+    return False
+  return pytree_utils.HasPrintStatement(unformatted_source)
+
+
+# Matches a line with just an indented comment.
+_INDENTED_COMMENT = re.compile(r'[ \t\f]+#')
+
+
+def _EnclosingStatements(unformatted_source, lines):
+  """Find the top-level statements that contain the given lines.
+
+  The source is tokenized up to the end of the last statement needed, which is
+  much cheaper than parsing it.
+
+  Arguments:
+    unformatted_source: (unicode) The code to format.
+    lines: (list of tuples of integers) The lines to format.
+
+  Returns:
+    A sorted list of (start, end) tuples of non-overlapping regions of lines,
+    with 'start' the first line and 'end' one past the last line of each.
+    None if there are no lines or the source can't be tokenized.
+  """
+  from lib2to3.pgen2 import tokenize  # pylint: disable=g-import-not-at-top
+
+  ranges = sorted(lines)
+  if not ranges:
+    return None
+  last_line = max(end for _, end in ranges)
+
+  # The first line of each top-level statement, and one past the last line of
+  # the last one.
+  boundaries = [1]
+  # Whether each statement starts with an indented comment.
+  indented_comments = []
+  try:
+    for statement in _SplitStatements(_IterLines(unformatted_source)):
+      boundaries.append(boundaries[-1] + len(statement))
+      indented_comments.append(_INDENTED_COMMENT.match(statement[0]))
+      if boundaries[-1] > last_line:
+        break
+  except (tokenize.TokenError, IndentationError):
+    return None
+
+  regions = []
+  for start, end in ranges:
+    # Lines past the end of the source belong to the last statement.
+    index = max(0, min(bisect.bisect_right(boundaries, start),
+                       len(indented_comments)) - 1)
+    while index > 0 and indented_comments[index]:
+      # Whether the comment goes with the block before it depends on what that
+      # block is.
+      index -= 1
+    region_start = boundaries[index]
+    region_end = boundaries[min(
+        bisect.bisect_right(boundaries, end), len(boundaries) - 1)]
+    if regions and region_start < regions[-1][1]:
+      regions[-1] = (regions[-1][0], max(regions[-1][1], region_end))
     else:
-      reformatted_source = reformatter.Reformat(uwlines)
+      regions.append((region_start, region_end))
+  return regions
 
-  if unformatted_source == reformatted_source:
-    return '' if print_diff else reformatted_source
 
-  code_diff = _GetUnifiedDiff(unformatted_source, reformatted_source,
-                              filename=filename)
+# The number of lines FormatCodeInChunks() formats at a time, give or take a
+# statement.
+_CHUNK_LINES = 1000
 
-  if print_diff:
-    return code_diff
 
-  return reformatted_source
+def _ReformatInChunks(unformatted_source):
+  """Reformat the source with the global style, a few statements at a time.
+
+  Each chunk is parsed together with the statement before it, so that the
+  blank lines between chunks come out as they would if the whole source were
+  parsed.
+
+  Arguments:
+    unformatted_source: (unicode) The code to format.
+
+  Yields:
+    The pieces of the reformatted code. Nothing if there is no code to format.
+  """
+  from yapf.yapflib import pytree_utils  # pylint: disable=g-import-not-at-top
+
+  if _DISABLE_OR_ENABLE.search(unformatted_source):
+    # Which lines to format is only known once the whole source is parsed.
+    reformatted_source = _Reformat(unformatted_source, None)
+    if reformatted_source:
+      yield reformatted_source
+    return
+
+  # Whether the whole source would be parsed with 'print' as a statement.
+  print_statement = pytree_utils.HasPrintStatement(unformatted_source)
+
+  emitted = False
+  context = []
+  chunk = []
+  statements = _SplitStatements(_IterLines(unformatted_source))
+  for statement in itertools.chain(statements, [None]):
+    if statement is not None:
+      chunk.extend(statement)
+      if len(chunk) < _CHUNK_LINES:
+        continue
+    for code in _ReformatAfter(''.join(context), ''.join(chunk),
+                               print_statement):
+      emitted = True
+      yield code
+    context = statement
+    chunk = []
+  if emitted:
+    yield '\n'
+
+
+# Matches the comments that turn formatting off and on again.
+_DISABLE_OR_ENABLE = re.compile(r'yapf: *(dis|en)able', re.IGNORECASE)
+
+
+def _ReformatAfter(context, unformatted_source, print_statement):
+  """Reformat code in the context of the code before it.
+
+  Arguments:
+    context: (unicode) The code before, as whole lines. Only the statement
+      right before is needed to get the blank lines in between right.
+    unformatted_source: (unicode) The code to format.
+    print_statement: (bool) See pytree_utils.ParseCodeToTree().
+
+  Returns:
+    An iterator over the pieces of the reformatted code, as returned by
+    reformatter.ReformatFrom(). There is no newline after the last piece.
+  """
+  from yapf.yapflib import reformatter  # pylint: disable=g-import-not-at-top
+
+  uwlines = _Unwrap(context + unformatted_source, print_statement)
+  return reformatter.ReformatFrom(uwlines, context.count('\n') + 1)
+
+
+def _ReformatStatements(unformatted_source, statements, print_statement,
+                        pieces, pool=None, cache=None):
+  """Reformat the source one top-level statement at a time.
+
+  Arguments:
+    unformatted_source: (unicode) The code to format.
+    statements: (list of unicode) The top-level statements of the source, as
+      split by _SplitStatements().
+    print_statement: (bool) See pytree_utils.ParseCodeToTree().
+    pieces: (list) The formatted code of each statement if it is known, or
+      None if it isn't.
+    pool: (multiprocessing.Pool) See reformatter.Reformat().
+    cache: (result_cache.ResultCache) See _Unwrap(). It is used when the whole
+      source is parsed.
+
+  Returns:
+    The list of the formatted code of each statement.
+  """
+  from yapf.yapflib import reformatter  # pylint: disable=g-import-not-at-top
+
+  missing = [i for i, piece in enumerate(pieces) if piece is None]
+  if len(missing) <= len(statements) // 2:
+    pieces = list(pieces)
+    for i in missing:
+      context = statements[i - 1] if i else ''
+      pieces[i] = ''.join(_ReformatAfter(context, statements[i],
+                                         print_statement))
+    return pieces
+
+  # Parsing every statement along with the one before it would take longer
+  # than parsing the whole source.
+  starts = [1]  # The number of the first line of each statement.
+  for statement in statements:
+    starts.append(starts[-1] + statement.count('\n'))
+  pieces = [[] for _ in statements]
+  uwlines = _Unwrap(unformatted_source, print_statement, cache)
+  for lineno, code in reformatter.ReformatByLine(uwlines, pool):
+    pieces[bisect.bisect_right(starts, lineno) - 1].append(code)
+  return [''.join(piece) for piece in pieces]
+
+
+def _IterLines(source):
+  """Yield the lines of source, with their line endings, one at a time."""
+  start = 0
+  while start < len(source):
+    end = source.find('\n', start) + 1 or len(source)
+    yield source[start:end]
+    start = end
+
+
+# Lines starting with these keywords continue the statement before them.
+_CONTINUATION_KEYWORDS = frozenset(['elif', 'else', 'except', 'finally'])
+
+
+def _SplitStatements(lines):
+  """Split code into its top-level statements.
+
+  The comments on their own lines between two statements, indented or not, are
+  counted as part of the statement after them: parsed after the statement
+  before them, with nothing following, they would be formatted as trailing
+  comments of that statement. Blank lines after a statement are counted as
+  part of it.
+
+  Arguments:
+    lines: (iterable of unicode) The lines of the code, with line endings.
+
+  Yields:
+    The lines of each statement, as soon as they are known.
+
+  Raises:
+    tokenize.TokenError, IndentationError: if the code can't be tokenized.
+  """
+  # pylint: disable=g-import-not-at-top
+  from lib2to3.pgen2 import token
+  from lib2to3.pgen2 import tokenize
+  # pylint: enable=g-import-not-at-top
+
+  lines = iter(lines)
+  buffered_lines = []  # The lines read since the last statement started.
+
+  def _ReadLine():
+    line = next(lines, '')
+    if line:
+      buffered_lines.append(line)
+    return line
+
+  statement_start = 1
+  depth = 0
+  at_line_start = True
+  after_decorator = False
+  comment_start = None
+  for tok_type, value, (row, _), _, _ in tokenize.generate_tokens(
+      _ReadLine):
+    if tok_type == token.INDENT:
+      depth += 1
+    elif tok_type == token.DEDENT:
+      depth -= 1
+    elif tok_type == token.COMMENT:
+      if at_line_start and comment_start is None:
+        comment_start = row
+    elif tok_type == token.NEWLINE:
+      at_line_start = True
+    elif tok_type == token.ENDMARKER:
+      break
+    elif tok_type != token.NL and at_line_start:
+      at_line_start = False
+      if (depth == 0 and not after_decorator and
+          value not in _CONTINUATION_KEYWORDS):
+        start = comment_start or row
+        if start > statement_start:
+          yield buffered_lines[:start - statement_start]
+          del buffered_lines[:start - statement_start]
+          statement_start = start
+      after_decorator = depth == 0 and value == '@'
+      comment_start = None
+  buffered_lines.extend(lines)
+  if buffered_lines:
+    yield buffered_lines
 
 
 def ReadFile(filename, logger=None):
@@ -190,6 +1058,8 @@ def _FormatLineSnippets(unformatted_source, uwlines, lines):
   Returns:
     The code reformatted to conform to the desired formatting style.
   """
+  from yapf.yapflib import reformatter  # pylint: disable=g-import-not-at-top
+
   # First we reformat only those lines that we want to reformat.
   index = 0
   reformatted_sources = dict()
@@ -234,6 +1104,11 @@ def _FormatLineSnippets(unformatted_source, uwlines, lines):
   return '\n'.join(finalized_lines).rstrip() + '\n'
 
 
+def _LogWarning(msg):
+  import logging  # pylint: disable=g-import-not-at-top
+  logging.warning(msg)
+
+
 def _GetUnifiedDiff(before, after, filename='code'):
   """Get a unified diff of the changes.
 
@@ -245,6 +1120,8 @@ def _GetUnifiedDiff(before, after, filename='code'):
   Returns:
     The unified diff text.
   """
+  import difflib  # pylint: disable=g-import-not-at-top
+
   before = before.splitlines()
   after = after.splitlines()
   return '\n'.join(difflib.unified_diff(before, after, filename, filename,
@@ -0,0 +1,210 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""asyncio entry points for YAPF.
+
+These APIs let programs built on asyncio format code without blocking their
+event loop. Files are read and written in the loop's default executor, and the
+formatting itself runs in a separate executor, a shared process pool by
+default.
+
+This module requires Python 3.6 or later. It isn't imported by the rest of
+YAPF.
+
+  FormatFile(): reformat a file.
+  FormatFiles(): reformat a list of files, returning the results in order.
+  FormatFilesAsCompleted(): reformat a list of files, yielding each result as
+    soon as it is ready.
+  Shutdown(): shut down the shared process pool.
+
+Besides the arguments described in yapf_api, these APIs take:
+
+  executor: (concurrent.futures.Executor) The executor to format the code in.
+    If None, a process pool shared by all calls is used. The pool is shut down
+    when the interpreter exits, or earlier by calling Shutdown(). YAPF keeps
+    its style in a global variable, so a thread pool must not have more than
+    one worker.
+  max_concurrency: (int) The largest number of files being worked on at once.
+    If None, the number of CPUs is used.
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import io
+import logging
+import os
+
+from yapf.yapflib import style
+from yapf.yapflib import yapf_api
+
+_default_executor = None
+
+
+async def FormatFile(filename, style_config=None, lines=None, print_diff=False,
+                     in_place=False, cache=None, executor=None):
+  """Format a single Python file and return the formatted code.
+
+  Arguments:
+    filename: (unicode) The file to reformat.
+    in_place: (bool) Write the reformatted code back to the file, if it
+      changed. Can't be combined with print_diff.
+    style_config, lines, print_diff, cache, executor: see comment at the top
+      of this module.
+
+  Returns:
+    The reformatted code or None if the file doesn't exist.
+
+  Raises:
+    ValueError: if both in_place and print_diff are set.
+  """
+  _CheckArguments(in_place, print_diff)
+  loop = asyncio.get_event_loop()
+  style_config = await loop.run_in_executor(None, style.CreateStyleFromConfig,
+                                            style_config)
+  return await _FormatFile(loop, filename, style_config, lines, print_diff,
+                           in_place, cache, executor or _GetDefaultExecutor())
+
+
+async def FormatFiles(filenames, style_config=None, print_diff=False,
+                      in_place=False, cache=None, executor=None,
+                      max_concurrency=None):
+  """Format a list of files.
+
+  Arguments:
+    filenames: (list of unicode) The files to reformat.
+    style_config, print_diff, in_place, cache, executor, max_concurrency: see
+      FormatFilesAsCompleted().
+
+  Returns:
+    A list of the reformatted code of each file, in the order of 'filenames'.
+    The code is None for files that don't exist.
+  """
+  results = {}
+  async for filename, reformatted_code in FormatFilesAsCompleted(
+      filenames, style_config=style_config, print_diff=print_diff,
+      in_place=in_place, cache=cache, executor=executor,
+      max_concurrency=max_concurrency):
+    results[filename] = reformatted_code
+  return [results[filename] for filename in filenames]
+
+
+async def FormatFilesAsCompleted(filenames, style_config=None, print_diff=False,
+                                 in_place=False, cache=None, executor=None,
+                                 max_concurrency=None):
+  """Format files, yielding the results in the order they complete.
+
+  At most 'max_concurrency' files are worked on at once, so that the files are
+  read only as they are about to be formatted. If formatting a file raises an
+  exception, the files still being worked on are abandoned and the exception
+  is raised to the caller.
+
+  Arguments:
+    filenames: (iterable of unicode) The files to reformat.
+    in_place: (bool) Write the reformatted code back to the files that
+      changed. Can't be combined with print_diff.
+    style_config, print_diff, cache, executor, max_concurrency: see comment at
+      the top of this module.
+
+  Yields:
+    Tuples of a filename and its reformatted code, or None if the file doesn't
+    exist.
+
+  Raises:
+    ValueError: if both in_place and print_diff are set.
+  """
+  _CheckArguments(in_place, print_diff)
+  loop = asyncio.get_event_loop()
+  style_config = await loop.run_in_executor(None, style.CreateStyleFromConfig,
+                                            style_config)
+  executor = executor or _GetDefaultExecutor()
+  max_concurrency = max_concurrency or os.cpu_count() or 1
+
+  filenames = iter(filenames)
+  pending = {}
+  try:
+    while True:
+      for filename in filenames:
+        task = loop.create_task(
+            _FormatFile(loop, filename, style_config, None, print_diff,
+                        in_place, cache, executor))
+        pending[task] = filename
+        if len(pending) >= max_concurrency:
+          break
+      if not pending:
+        return
+      done, _ = await asyncio.wait(pending,
+                                   return_when=asyncio.FIRST_COMPLETED)
+      for task in done:
+        yield pending.pop(task), task.result()
+  finally:
+    for task in pending:
+      task.cancel()
+
+
+async def _FormatFile(loop, filename, style_config, lines, print_diff,
+                      in_place, cache, executor):
+  """Format a file, with the style already resolved."""
+  original_source = await loop.run_in_executor(None, yapf_api.ReadFile,
+                                               filename, logging.warning)
+  if original_source is None:
+    return None
+
+  reformatted_code = await loop.run_in_executor(
+      executor, _FormatCode, original_source, filename, style_config, lines,
+      print_diff, cache)
+  if (in_place and reformatted_code.strip() and
+      reformatted_code != original_source):
+    await loop.run_in_executor(None, _WriteFile, filename, reformatted_code)
+  return reformatted_code
+
+
+@atexit.register
+def Shutdown(wait=True):
+  """Shut down the process pool shared by calls that don't pass an executor.
+
+  A later call that doesn't pass an executor starts a new pool.
+
+  Arguments:
+    wait: (bool) Wait for the files being formatted in the pool to finish.
+  """
+  global _default_executor
+  executor, _default_executor = _default_executor, None
+  if executor is not None:
+    executor.shutdown(wait=wait)
+
+
+def _CheckArguments(in_place, print_diff):
+  if in_place and print_diff:
+    raise ValueError('cannot use in_place and print_diff at the same time')
+
+
+def _FormatCode(unformatted_source, filename, style_config, lines, print_diff,
+                cache):
+  # Runs in the executor, which may be in another process.
+  return yapf_api.FormatCode(unformatted_source, filename=filename,
+                             style_config=style_config, lines=lines,
+                             print_diff=print_diff, cache=cache)
+
+
+def _WriteFile(filename, code):
+  with io.open(filename, mode='w', newline='') as fd:
+    fd.write(code)
+
+
+def _GetDefaultExecutor():
+  """Return the process pool shared by calls that don't pass an executor."""
+  global _default_executor
+  if _default_executor is None:
+    _default_executor = concurrent.futures.ProcessPoolExecutor()
+  return _default_executor
@@ -0,0 +1,128 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for yapf.daemon."""
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+
+from yapf.yapflib import daemon
+
+YAPF_BINARY = [sys.executable, '-m', 'yapf']
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'requires Unix sockets')
+class DaemonTest(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.test_tmpdir = tempfile.mkdtemp()
+    # Keep the caches of the yapf processes out of the user's cache directory.
+    cls.cache_home = os.environ.get('XDG_CACHE_HOME')
+    os.environ['XDG_CACHE_HOME'] = os.path.join(cls.test_tmpdir, 'cache')
+    cls.socket_path = os.path.join(cls.test_tmpdir, 'yapf.sock')
+    cls.server = subprocess.Popen(YAPF_BINARY + ['--serve', '--no-cache',
+                                                 '--socket', cls.socket_path])
+    deadline = time.time() + 30
+    while not os.path.exists(cls.socket_path):
+      if time.time() > deadline or cls.server.poll() is not None:
+        raise RuntimeError('the daemon failed to start')
+      time.sleep(0.05)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.terminate()
+    cls.server.wait()
+    if cls.cache_home is None:
+      del os.environ['XDG_CACHE_HOME']
+    else:
+      os.environ['XDG_CACHE_HOME'] = cls.cache_home
+    shutil.rmtree(cls.test_tmpdir)
+
+  def testFormatCode(self):
+    unformatted_code = textwrap.dedent(u"""\
+        def foo():
+          x = 37
+        """)
+    expected_formatted_code = textwrap.dedent(u"""\
+        def foo():
+            x = 37
+        """)
+    self.assertEqual(expected_formatted_code,
+                     daemon.FormatCode(unformatted_code,
+                                       socket_path=self.socket_path))
+
+  def testStyleAndLines(self):
+    unformatted_code = textwrap.dedent(u"""\
+        def foo():
+            x = 37
+        def bar():
+            y = 42
+        """)
+    expected_formatted_code = textwrap.dedent(u"""\
+        def foo():
+          x = 37
+        def bar():
+            y = 42
+        """)
+    self.assertEqual(expected_formatted_code,
+                     daemon.FormatCode(unformatted_code, style_config='google',
+                                       lines=[(1, 2)],
+                                       socket_path=self.socket_path))
+
+  def testOpenConnectionDoesNotBlock(self):
+    idle_conn = daemon._Connect(self.socket_path)
+    try:
+      conn = daemon._Connect(self.socket_path)
+      # Fail rather than hang if the daemon waits for the idle connection.
+      conn.settimeout(10)
+      try:
+        daemon._SendMessage(conn, {'source': u'x  =  1\n'})
+        self.assertEqual({'code': u'x = 1\n'}, daemon._ReceiveMessage(conn))
+      finally:
+        conn.close()
+    finally:
+      idle_conn.close()
+
+  def testError(self):
+    with self.assertRaises(daemon.Error):
+      daemon.FormatCode(u'def f(:\n', socket_path=self.socket_path)
+
+  def testCommandLineClient(self):
+    p = subprocess.Popen(YAPF_BINARY + ['--use-daemon',
+                                        '--socket', self.socket_path],
+                         stdout=subprocess.PIPE,
+                         stdin=subprocess.PIPE,
+                         stderr=subprocess.STDOUT)
+    reformatted_code, stderrdata = p.communicate(u'x  =  1\n'.encode('utf-8'))
+    self.assertIsNone(stderrdata)
+    self.assertEqual(reformatted_code.decode('utf-8'), u'x = 1\n')
+
+
+class FallbackTest(unittest.TestCase):
+
+  def testNoDaemonRunning(self):
+    socket_path = os.path.join(tempfile.gettempdir(), 'no-such-yapf.sock')
+    self.assertEqual(u'x = 1\n',
+                     daemon.FormatCode(u'x  =  1\n', socket_path=socket_path))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,85 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for yapf.file_index."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from yapf.yapflib import file_index
+from yapf.yapflib import style
+
+
+class FileIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.test_tmpdir = tempfile.mkdtemp()
+    self.index_path = os.path.join(self.test_tmpdir, 'index')
+    self.filename = os.path.join(self.test_tmpdir, 'foo.py')
+    self._WriteFile(u'x = 1\n')
+
+  def tearDown(self):
+    shutil.rmtree(self.test_tmpdir)
+
+  def _WriteFile(self, contents, age=100):
+    with open(self.filename, 'w') as fd:
+      fd.write(contents)
+    # Pretend the file was written a while ago, so it isn't racily clean.
+    then = time.time() - age
+    os.utime(self.filename, (then, then))
+
+  def _NewIndex(self, style_config=None):
+    return file_index.FileIndex(self.index_path,
+                                style_config or style.CreatePEP8Style(), '1.0')
+
+  def testUnknownFileIsNotClean(self):
+    self.assertFalse(self._NewIndex().IsClean(self.filename))
+
+  def testCleanFileSurvivesSave(self):
+    index = self._NewIndex()
+    index.MarkClean(self.filename)
+    self.assertTrue(index.IsClean(self.filename))
+    index.Save()
+
+    self.assertTrue(self._NewIndex().IsClean(self.filename))
+
+  def testModifiedFileIsNotClean(self):
+    index = self._NewIndex()
+    index.MarkClean(self.filename)
+    self._WriteFile(u'x = 12\n', age=50)
+    self.assertFalse(index.IsClean(self.filename))
+
+  def testDifferentStyleIsNotClean(self):
+    index = self._NewIndex()
+    index.MarkClean(self.filename)
+    index.Save()
+    self.assertFalse(
+        self._NewIndex(style.CreateGoogleStyle()).IsClean(self.filename))
+
+  def testRecentlyModifiedFileIsNotRecorded(self):
+    self._WriteFile(u'x = 1\n', age=0)
+    index = self._NewIndex()
+    index.MarkClean(self.filename)
+    self.assertFalse(index.IsClean(self.filename))
+
+  def testCorruptIndexIsIgnored(self):
+    with open(self.index_path, 'wb') as fd:
+      fd.write(b'garbage')
+    self.assertFalse(self._NewIndex().IsClean(self.filename))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -35,6 +35,111 @@ def stdout_redirector(stream):
     sys.stdout = old_stdout
 
 
+class GetCommandLineFilesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.old_cwd = os.getcwd()
+    self.test_tmpdir = tempfile.mkdtemp()
+    os.chdir(self.test_tmpdir)
+    for filename in ['a.py', 'b.txt', 'pkg/c.py', 'pkg/sub/d.py',
+                     'pkg/build/e.py', 'build/f.py', 'node_modules/g.py',
+                     'build.py']:
+      if os.path.dirname(filename) and not os.path.isdir(
+          os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+      with open(filename, 'w') as fd:
+        fd.write('pass\n')
+
+  def tearDown(self):
+    os.chdir(self.old_cwd)
+    shutil.rmtree(self.test_tmpdir)
+
+  def _Find(self, filenames, recursive=True, exclude=None, ignore_file=None):
+    return sorted(
+        os.path.relpath(f).replace(os.sep, '/')
+        for f in file_resources.GetCommandLineFiles(filenames, recursive,
+                                                    exclude=exclude,
+                                                    ignore_file=ignore_file))
+
+  def testRecursive(self):
+    self.assertEqual(['a.py', 'build.py', 'build/f.py', 'node_modules/g.py',
+                      'pkg/build/e.py', 'pkg/c.py', 'pkg/sub/d.py'],
+                     self._Find(['.']))
+
+  def testNotRecursive(self):
+    self.assertEqual(['pkg/c.py'], self._Find(['pkg'], recursive=False))
+
+  def testFilesOfDirectoryComeFirst(self):
+    files = file_resources.GetCommandLineFiles(['pkg'], True)
+    self.assertEqual(os.path.join('pkg', 'c.py'), files[0])
+
+  def testExcludeByName(self):
+    self.assertEqual(['a.py', 'build.py', 'pkg/c.py', 'pkg/sub/d.py'],
+                     self._Find(['.'], exclude=['build', 'node_modules']))
+
+  def testExcludeDirectoriesOnly(self):
+    self.assertEqual(['a.py', 'build.py', 'pkg/c.py', 'pkg/sub/d.py'],
+                     self._Find(['.'], exclude=['build*/', 'node_modules/']))
+
+  def testExcludeAnchored(self):
+    self.assertEqual(['a.py', 'build.py', 'node_modules/g.py', 'pkg/build/e.py',
+                      'pkg/c.py'],
+                     self._Find(['.'], exclude=['/build', 'pkg/sub']))
+
+  def testStarDoesNotMatchSlash(self):
+    self.assertEqual(['a.py', 'build.py', 'build/f.py', 'node_modules/g.py',
+                      'pkg/build/e.py', 'pkg/sub/d.py'],
+                     self._Find(['.'], exclude=['pkg/*.py']))
+
+  def testDoubleStar(self):
+    self.assertEqual(['a.py', 'build.py', 'node_modules/g.py', 'pkg/c.py',
+                      'pkg/sub/d.py'],
+                     self._Find(['.'], exclude=['**/build']))
+    self.assertEqual(['a.py', 'build.py', 'build/f.py', 'node_modules/g.py',
+                      'pkg/c.py'],
+                     self._Find(['.'], exclude=['pkg/**/*.py', '!pkg/c.py']))
+
+  def testIgnoreFileAnchoredAtItsDirectory(self):
+    with open(os.path.join('pkg', '.yapfignore'), 'w') as fd:
+      fd.write('/build\nsub/d.py\n')
+    self.assertEqual(['a.py', 'build.py', 'build/f.py', 'node_modules/g.py',
+                      'pkg/c.py'],
+                     self._Find(['.'], ignore_file='pkg/.yapfignore'))
+
+    with open('.yapfignore', 'w') as fd:
+      fd.write('/pkg/build\n')
+    os.chdir('pkg')
+    self.assertEqual(['c.py', 'sub/d.py'],
+                     self._Find(['.'], ignore_file='../.yapfignore'))
+
+  def testIgnoreFileComesBeforeExclude(self):
+    with open('.yapfignore', 'w') as fd:
+      fd.write('*.py\n')
+    self.assertEqual(['a.py'], self._Find(['.'], exclude=['!a.py'],
+                                          ignore_file='.yapfignore'))
+
+  def testNegatedPattern(self):
+    self.assertEqual(['a.py', 'build/f.py', 'node_modules/g.py',
+                      'pkg/build/e.py', 'pkg/c.py', 'pkg/sub/d.py'],
+                     self._Find(['.'], exclude=['build*', '!build/']))
+
+  def testExcludeExplicitFile(self):
+    self.assertEqual(['pkg/c.py'],
+                     self._Find(['a.py', 'pkg/c.py'], exclude=['a.py']))
+
+  def testReadPatternFile(self):
+    with open('.yapfignore', 'w') as fd:
+      fd.write('# Build output.\nbuild/  \n\n!keep.py\n')
+    self.assertEqual(['build/', '!keep.py'],
+                     file_resources.ReadPatternFile('.yapfignore'))
+
+  def testReadFileList(self):
+    with open('files.txt', 'w') as fd:
+      fd.write('a.py\npkg/c.py\n\n')
+    self.assertEqual(['a.py', 'pkg/c.py'],
+                     file_resources.ReadFileList('files.txt'))
+
+
 class WriteReformattedCodeTest(unittest.TestCase):
 
   @classmethod
@@ -62,5 +167,39 @@ class WriteReformattedCodeTest(unittest.TestCase):
     self.assertEqual(stream.getvalue(), s)
 
 
+class FramedDocumentsTest(unittest.TestCase):
+
+  def testReadLengthFramed(self):
+    stream = py3compat.BytesIO(b'6\nx = 1\n7\r\ny = 2\r\n0\n')
+    self.assertEqual([u'x = 1\n', u'y = 2\n', u'\n'],
+                     list(file_resources.ReadDocuments(stream, 'length')))
+
+  def testReadNulFramed(self):
+    stream = py3compat.BytesIO(b'x = 1\n\0y = 2')
+    self.assertEqual([u'x = 1\n', u'y = 2\n'],
+                     list(file_resources.ReadDocuments(stream, 'nul')))
+
+  def testReadTruncatedDocument(self):
+    stream = py3compat.BytesIO(b'10\nx = 1\n')
+    with self.assertRaises(ValueError):
+      list(file_resources.ReadDocuments(stream, 'length'))
+
+  def testReadInvalidHeader(self):
+    stream = py3compat.BytesIO(b'x = 1\n')
+    with self.assertRaises(ValueError):
+      list(file_resources.ReadDocuments(stream, 'length'))
+
+  def testWriteLengthFramed(self):
+    stream = py3compat.BytesIO()
+    file_resources.WriteDocument(stream, u'x = 1\n', 'length')
+    file_resources.WriteDocument(stream, u'oops', 'length', error=True)
+    self.assertEqual(b'6\nx = 1\nE4\noops', stream.getvalue())
+
+  def testWriteNulFramed(self):
+    stream = py3compat.BytesIO()
+    file_resources.WriteDocument(stream, u'x = 1\n', 'nul')
+    self.assertEqual(b'x = 1\n\0', stream.getvalue())
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -158,6 +158,61 @@ class FormatDecisionStateTest(unittest.TestCase):
     clone = state.Clone()
     self.assertEqual(repr(state), repr(clone))
 
+  def testCloneSharesParenStates(self):
+    code = textwrap.dedent(r"""
+      f(a, g(b, c))
+      """)
+    uwlines = self._ParseAndUnwrap(code)
+    uwline = unwrapped_line.UnwrappedLine(0, self._FilterLine(uwlines[0]))
+    uwline.CalculateFormattingInformation()
+
+    state = format_decision_state.FormatDecisionState(uwline, 0)
+    # Add: '(', 'a', ',', 'g', '('
+    for _ in range(5):
+      state.AddTokenToState(False, True)
+    self.assertEqual('b', state.next_token.value)
+
+    clone = state.Clone()
+    self.assertIs(state.paren_state, clone.paren_state)
+    before = repr(state)
+
+    # Splitting in the clone changes its paren states, but not the original's.
+    clone.AddTokenToState(True, True)
+    self.assertEqual(before, repr(state))
+    self.assertNotEqual(before, repr(clone))
+    self.assertIsNot(state.paren_state, clone.paren_state)
+    self.assertTrue(clone.paren_state.split_before_parameter)
+    self.assertTrue(clone.paren_state.parent.split_before_parameter)
+    self.assertFalse(state.paren_state.split_before_parameter)
+    self.assertFalse(state.paren_state.parent.split_before_parameter)
+
+  def testEqualStatesCompareEqual(self):
+    code = textwrap.dedent(r"""
+      f(a, g(b, c))
+      """)
+    uwlines = self._ParseAndUnwrap(code)
+    uwline = unwrapped_line.UnwrappedLine(0, self._FilterLine(uwlines[0]))
+    uwline.CalculateFormattingInformation()
+
+    state = format_decision_state.FormatDecisionState(uwline, 0)
+    for _ in range(5):
+      state.AddTokenToState(False, True)
+
+    # The same decision in two copies gives equal states, each with its own
+    # paren states.
+    first = state.Clone()
+    first.AddTokenToState(True, True)
+    second = state.Clone()
+    second.AddTokenToState(True, True)
+    self.assertIsNot(first.paren_state, second.paren_state)
+    self.assertEqual(first, second)
+    self.assertEqual(hash(first), hash(second))
+    self.assertEqual(1, len(set([first, second])))
+
+    third = state.Clone()
+    third.AddTokenToState(False, True)
+    self.assertNotEqual(first, third)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,181 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for yapf.git_diff."""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import textwrap
+import unittest
+
+from yapf.yapflib import git_diff
+
+
+def _HaveGit():
+  try:
+    subprocess.check_output(['git', '--version'])
+  except (OSError, subprocess.CalledProcessError):
+    return False
+  return True
+
+
+class ParseDiffTest(unittest.TestCase):
+
+  def testHunks(self):
+    diff = textwrap.dedent(u"""\
+        diff --git foo.py foo.py
+        index 7d4290a..a5d6ad5 100644
+        --- foo.py
+        +++ foo.py
+        @@ -1 +1 @@
+        -x=1
+        +x=2
+        @@ -5,0 +6,3 @@ def f():
+        +a
+        +b
+        +c
+        @@ -9,2 +11,0 @@
+        -d
+        -e
+        diff --git bar.py bar.py
+        new file mode 100644
+        --- /dev/null
+        +++ bar.py
+        @@ -0,0 +1,2 @@
+        +y = 1
+        +z = 2
+        """)
+    self.assertEqual({
+        u'foo.py': [(1, 1), (6, 8)],
+        u'bar.py': [(1, 2)],
+    }, git_diff.ParseDiff(diff))
+
+  def testOnlyDeletions(self):
+    diff = textwrap.dedent(u"""\
+        --- foo.py
+        +++ foo.py
+        @@ -3,2 +2,0 @@
+        -d
+        -e
+        """)
+    self.assertEqual({}, git_diff.ParseDiff(diff))
+
+  def testLinesLikeHeaders(self):
+    # A deleted line starting with '-- ' and an added one starting with '++ '
+    # look like file headers.
+    diff = textwrap.dedent(u"""\
+        diff --git foo.py foo.py
+        --- foo.py
+        +++ foo.py
+        @@ -2,2 +2,3 @@
+        --- y
+        -x
+        +++ x
+        +y
+        +z
+        \\ No newline at end of file
+        @@ -7 +8 @@
+        --- z
+        +++ z
+        diff --git bar.py bar.py
+        --- bar.py
+        +++ bar.py
+        @@ -1,0 +2 @@
+        +++ w
+        """)
+    self.assertEqual({
+        u'foo.py': [(2, 4), (8, 8)],
+        u'bar.py': [(2, 2)],
+    }, git_diff.ParseDiff(diff))
+
+  def testUnusualNames(self):
+    diff = textwrap.dedent(u"""\
+        --- a b.py\t
+        +++ a b.py\t
+        @@ -1 +1 @@
+        -x=1
+        +x=2
+        --- "tab\\there.py"
+        +++ "tab\\there.py"
+        @@ -1 +1 @@
+        -x=1
+        +x=2
+        """)
+    self.assertEqual({
+        u'a b.py': [(1, 1)],
+        u'tab\there.py': [(1, 1)],
+    }, git_diff.ParseDiff(diff))
+
+
+@unittest.skipUnless(_HaveGit(), 'requires git')
+class GetChangedLinesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.old_cwd = os.getcwd()
+    self.test_tmpdir = tempfile.mkdtemp()
+    os.chdir(self.test_tmpdir)
+    self._Git('init', '-q')
+    self._WriteFile('foo.py', u'x = 1\ny = 2\n')
+    self._WriteFile('bar.py', u'z = 3\n')
+    self._Git('add', '.')
+    self._Git('-c', 'user.name=yapf', '-c', 'user.email=yapf@example.com',
+              'commit', '-q', '-m', 'initial')
+
+  def tearDown(self):
+    os.chdir(self.old_cwd)
+    shutil.rmtree(self.test_tmpdir)
+
+  def _Git(self, *args):
+    subprocess.check_call(('git',) + args)
+
+  def _Path(self, *names):
+    # Git names the files under the real path of the working tree.
+    return os.path.join(os.path.realpath(self.test_tmpdir), *names)
+
+  def _WriteFile(self, filename, contents):
+    with open(filename, 'w') as fd:
+      fd.write(contents)
+
+  def testChangedLines(self):
+    self._WriteFile('foo.py', u'x = 1\ny = 3\nw = 4\n')
+    self._WriteFile('new.py', u'v = 5\n')
+    self._Git('add', 'new.py')
+    self.assertEqual({
+        self._Path('foo.py'): [(2, 3)],
+        self._Path('new.py'): [(1, 1)],
+    }, git_diff.GetChangedLines('HEAD'))
+    self.assertEqual({self._Path('new.py'): [(1, 1)]},
+                     git_diff.GetChangedLines('HEAD', ['new.py']))
+
+  def testFromSubdirectory(self):
+    self._WriteFile('foo.py', u'x = 1\ny = 3\n')
+    os.mkdir('sub')
+    self._WriteFile(os.path.join('sub', 'baz.py'), u'u = 6\n')
+    self._Git('add', os.path.join('sub', 'baz.py'))
+    os.chdir('sub')
+    self.assertEqual({
+        self._Path('foo.py'): [(2, 2)],
+        self._Path('sub', 'baz.py'): [(1, 1)],
+    }, git_diff.GetChangedLines('HEAD', ['..']))
+    self.assertEqual({self._Path('sub', 'baz.py'): [(1, 1)]},
+                     git_diff.GetChangedLines('HEAD', ['.']))
+
+  def testBadRevision(self):
+    with self.assertRaises(git_diff.Error):
+      git_diff.GetChangedLines('no-such-revision')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,102 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for yapf.grammar_cache."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib2to3 import pygram
+
+from yapf.yapflib import grammar_cache
+
+
+class GrammarCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+    self.saved_cache_dir = grammar_cache.GetCacheDirectory()
+
+  def tearDown(self):
+    grammar_cache.SetCacheDirectory(self.saved_cache_dir)
+    shutil.rmtree(self.cache_dir)
+
+  def _CacheFile(self):
+    names = os.listdir(self.cache_dir)
+    self.assertEqual(1, len(names))
+    return os.path.join(self.cache_dir, names[0])
+
+  def _AssertSameGrammar(self, expected, actual):
+    self.assertEqual(expected.symbol2number, actual.symbol2number)
+    self.assertEqual(expected.number2symbol, actual.number2symbol)
+    self.assertEqual(expected.keywords, actual.keywords)
+    self.assertEqual(expected.labels, actual.labels)
+    self.assertEqual(expected.start, actual.start)
+
+  def testMissWritesCache(self):
+    python_grammar = grammar_cache.LoadGrammar(self.cache_dir)
+    self.assertIs(pygram.python_grammar, python_grammar)
+    self.assertTrue(os.path.getsize(self._CacheFile()))
+
+  def testSetCacheDirectory(self):
+    grammar_cache.SetCacheDirectory(self.cache_dir)
+    grammar_cache.LoadGrammar()
+    self.assertTrue(os.path.getsize(self._CacheFile()))
+
+  def testNoCacheDirectory(self):
+    grammar_cache.SetCacheDirectory(None)
+    self.assertIs(pygram.python_grammar, grammar_cache.LoadGrammar())
+    self.assertEqual([], os.listdir(self.cache_dir))
+
+  def testHit(self):
+    grammar_cache.LoadGrammar(self.cache_dir)
+    python_grammar = grammar_cache.LoadGrammar(self.cache_dir)
+    self.assertIsNot(pygram.python_grammar, python_grammar)
+    self._AssertSameGrammar(pygram.python_grammar, python_grammar)
+
+  def testOtherVersionIsIgnored(self):
+    grammar_cache.LoadGrammar(self.cache_dir)
+    path = self._CacheFile()
+    with open(path, 'rb') as fd:
+      data = fd.read()
+    with open(path, 'wb') as fd:
+      fd.write(data.replace(b'|', b'+|', 1))
+    self.assertIs(pygram.python_grammar,
+                  grammar_cache.LoadGrammar(self.cache_dir))
+    with open(path, 'rb') as fd:
+      self.assertEqual(data, fd.read())
+
+  def testCorruptCacheIsReplaced(self):
+    grammar_cache.LoadGrammar(self.cache_dir)
+    path = self._CacheFile()
+    with open(path, 'rb') as fd:
+      data = fd.read()
+    with open(path, 'wb') as fd:
+      fd.write(data[:data.index(b'\n') + 10])
+    self.assertIs(pygram.python_grammar,
+                  grammar_cache.LoadGrammar(self.cache_dir))
+    with open(path, 'rb') as fd:
+      self.assertEqual(data, fd.read())
+
+  def testUnwritableCacheDirectory(self):
+    cache_file = os.path.join(self.cache_dir, 'file')
+    with open(cache_file, 'w'):
+      pass
+    self.assertIs(pygram.python_grammar,
+                  grammar_cache.LoadGrammar(os.path.join(cache_file, 'sub')))
+
+
+if __name__ == '__main__':
+  unittest.main()
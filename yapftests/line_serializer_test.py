@@ -0,0 +1,91 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for yapf.line_serializer."""
+
+import textwrap
+import unittest
+
+from yapf.yapflib import blank_line_calculator
+from yapf.yapflib import comment_splicer
+from yapf.yapflib import line_serializer
+from yapf.yapflib import pytree_unwrapper
+from yapf.yapflib import pytree_utils
+from yapf.yapflib import reformatter
+from yapf.yapflib import split_penalty
+from yapf.yapflib import style
+from yapf.yapflib import subtype_assigner
+
+
+class LineSerializerTest(unittest.TestCase):
+
+  CODE = textwrap.dedent(u"""\
+      # A comment.
+      import os
+      @decorator(a, b = 1)
+      def f(a, *args, **kwargs):
+        '''Docstring.'''
+        x = {'key': [1, 2, 3], 'other': (a or not b)}  # Trailing comment.
+        return some_function_with_a_long_name(x, another_argument_with_a_long_name, -a)
+      class C(object):
+        def g(self): return self[1:2]
+      """)
+
+  def testRoundTrip(self):
+    for style_factory in (style.CreateGoogleStyle, style.CreatePEP8Style):
+      style.SetGlobalStyle(style_factory())
+      expected = reformatter.Reformat(
+          _CalculateFormattingInformation(_ParseAndUnwrap(self.CODE)))
+      data = line_serializer.Serialize(_ParseAndUnwrap(self.CODE))
+      uwlines = line_serializer.Deserialize(data)
+      self.assertEqual(expected, reformatter.Reformat(
+          _CalculateFormattingInformation(uwlines)))
+
+  def testBracketsAreMatched(self):
+    uwlines = line_serializer.Deserialize(line_serializer.Serialize(
+        _ParseAndUnwrap(u'f(a[1], {2: 3})\n')))
+    tokens = uwlines[0].tokens
+    pairs = [(tok.value, tok.matching_bracket.value) for tok in tokens
+             if tok.matching_bracket is not None]
+    self.assertEqual([('(', ')'), ('[', ']'), (']', '['), ('{', '}'),
+                      ('}', '{'), (')', '(')], pairs)
+
+  def testNoLines(self):
+    self.assertEqual([], line_serializer.Deserialize(
+        line_serializer.Serialize([])))
+
+  def testOtherVersionIsRejected(self):
+    data = line_serializer.Serialize(_ParseAndUnwrap(u'x = 1\n'))
+    with self.assertRaises(ValueError):
+      line_serializer.Deserialize(data.replace(b' 1\n', b' 0\n', 1))
+    with self.assertRaises(ValueError):
+      line_serializer.Deserialize(b'')
+
+
+def _ParseAndUnwrap(code):
+  tree = pytree_utils.ParseCodeToTree(code)
+  comment_splicer.SpliceComments(tree)
+  subtype_assigner.AssignSubtypes(tree)
+  split_penalty.ComputeSplitPenalties(tree)
+  blank_line_calculator.CalculateBlankLines(tree)
+  return pytree_unwrapper.UnwrapPyTree(tree)
+
+
+def _CalculateFormattingInformation(uwlines):
+  for uwl in uwlines:
+    uwl.CalculateFormattingInformation()
+  return uwlines
+
+
+if __name__ == '__main__':
+  unittest.main()
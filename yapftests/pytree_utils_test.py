@@ -68,6 +68,37 @@ class ParseCodeToTreeTest(unittest.TestCase):
     self.assertEqual(2, len(tree.children))
     self.assertEqual('simple_stmt', pytree_utils.NodeName(tree.children[0]))
 
+  def _ParseWithGrammars(self, code):
+    """Parse code, returning the grammars in the order they were tried."""
+    get_driver = pytree_utils._GetDriver
+    grammars = []
+
+    def _GetDriver(grammar):
+      grammars.append(grammar)
+      return get_driver(grammar)
+
+    pytree_utils._GetDriver = _GetDriver
+    try:
+      tree = pytree_utils.ParseCodeToTree(code)
+    finally:
+      pytree_utils._GetDriver = get_driver
+    return tree, grammars
+
+  def testPrintStatementParsedOnce(self):
+    tree, grammars = self._ParseWithGrammars(
+        'x = 1\nif x:\n  print x, "hello"\n')
+    self.assertEqual([pytree_utils.GetPythonGrammar()], grammars)
+    self.assertEqual('print_stmt',
+                     pytree_utils.NodeName(tree.children[1].children[3]
+                                           .children[2].children[0]))
+
+  def testPrintFunctionParsedOnce(self):
+    for code in ('print("print x")\n', '# print x\nprint(x)\n',
+                 'print >>f, x\n', 'print\n', 'x = print if y else z\n'):
+      _, grammars = self._ParseWithGrammars(code)
+      self.assertEqual([pytree_utils.GetPythonGrammar(print_statement=False)],
+                       grammars)
+
 
 class InsertNodesBeforeAfterTest(unittest.TestCase):
 
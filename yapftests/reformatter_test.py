@@ -13,12 +13,14 @@
 # limitations under the License.
 """Tests for yapf.reformatter."""
 
+import heapq
 import sys
 import textwrap
 import unittest
 
 from yapf.yapflib import blank_line_calculator
 from yapf.yapflib import comment_splicer
+from yapf.yapflib import format_decision_state
 from yapf.yapflib import py3compat
 from yapf.yapflib import pytree_unwrapper
 from yapf.yapflib import pytree_utils
@@ -28,6 +30,21 @@ from yapf.yapflib import split_penalty
 from yapf.yapflib import style
 from yapf.yapflib import subtype_assigner
 
+# Lines too long to fit, for the tests of the search for their formatting.
+LONG_LINES_CODE = textwrap.dedent("""\
+    def f():
+        result = some_module.some_function_name(argument_one, argument_two, keyword_argument=[1, 2, 3, 4], another_keyword={'x': 1})
+        return {'first_key': first_value, 'second_key': second_value, 'third': 3}
+    """)
+
+# Long expressions that split in several places.
+LONG_EXPRESSIONS_CODE = textwrap.dedent("""\
+    x = outer_function(first_function(alpha, beta, gamma), second_function(delta, epsilon), third(zeta, eta, theta, iota))
+    y = 'a long string with words' + some_variable_name + 'another string' + other_name[index]
+    if (some_condition_that_is_long and another_condition_that_is_long) or not yet_another_condition:
+        pass
+    """)
+
 
 class SingleLineReformatterTest(unittest.TestCase):
 
@@ -521,6 +538,22 @@ xxxxxxxxxxx, yyyyyyyyyyyy, vvvvvvvvv)
     uwlines = _ParseAndUnwrap(unformatted_code)
     self.assertEqual(expected_formatted_code, reformatter.Reformat(uwlines))
 
+  def testSplitBeforeUnbreakableRun(self):
+    unformatted_code = textwrap.dedent("""\
+        def f():
+          if True:
+            result = some_function(first_argument, module.submodule.another_module.attribute_with_a_long_name, last)
+        """)
+    expected_formatted_code = textwrap.dedent("""\
+        def f():
+          if True:
+            result = some_function(
+                first_argument,
+                module.submodule.another_module.attribute_with_a_long_name, last)
+        """)
+    uwlines = _ParseAndUnwrap(unformatted_code)
+    self.assertEqual(expected_formatted_code, reformatter.Reformat(uwlines))
+
   def testSimpleMultilineWithComments(self):
     code = textwrap.dedent("""\
         if (  # This is the first comment
@@ -1332,6 +1365,222 @@ class TestsForPython3Code(unittest.TestCase):
     self.assertEqual(expected_formatted_code, reformatter.Reformat(uwlines))
 
 
+class ParallelSearchTest(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    style.SetGlobalStyle(style.CreatePEP8Style())
+
+  def testSameAsSerial(self):
+    unformatted_code = LONG_LINES_CODE + 'short = call(a, b)\n'
+    expected_formatted_code = reformatter.Reformat(
+        _ParseAndUnwrap(unformatted_code))
+    mapped = []
+
+    class _Pool(object):
+
+      def map(self, func, iterable):
+        tasks = list(iterable)
+        mapped.extend(tasks)
+        return [func(task) for task in tasks]
+
+    self.assertEqual(expected_formatted_code,
+                     reformatter.Reformat(_ParseAndUnwrap(unformatted_code),
+                                          pool=_Pool()))
+    # Of the lines that don't fit, only the one with many tokens is searched in
+    # the pool.
+    self.assertEqual(1, len(mapped))
+
+
+class PenaltyLowerBoundTest(unittest.TestCase):
+
+  UNFORMATTED_CODE = textwrap.dedent("""\
+      def f():
+        if True:
+          result = some_function(first_argument, module.submodule.another_module.attribute_with_a_long_name, last)
+      """) + LONG_EXPRESSIONS_CODE
+
+  def setUp(self):
+    style.SetGlobalStyle(style.CreatePEP8Style())
+    self.penalty_lower_bound = reformatter._PenaltyLowerBound
+    self.heapq = reformatter.heapq
+
+  def tearDown(self):
+    reformatter._PenaltyLowerBound = self.penalty_lower_bound
+    reformatter.heapq = self.heapq
+
+  def _InitialStates(self):
+    return [format_decision_state.FormatDecisionState(
+        uwline, style.Get('INDENT_WIDTH') * uwline.depth)
+            for uwline in _ParseAndUnwrap(self.UNFORMATTED_CODE)]
+
+  def _PoppedStates(self, state):
+    """Return how many items _FindSolution() pops off its queue."""
+    popped = []
+
+    class _CountingHeapq(object):
+      heappush = staticmethod(heapq.heappush)
+
+      @staticmethod
+      def heappop(p_queue):
+        popped.append(p_queue[0])
+        return heapq.heappop(p_queue)
+
+    reformatter.heapq = _CountingHeapq
+    reformatter._FindSolution(state)
+    reformatter.heapq = self.heapq
+    return len(popped)
+
+  def testBoundIsNotAboveRemainingPenalty(self):
+    bounds = []
+    for state in self._InitialStates():
+      lower_bound = reformatter._PenaltyLowerBound(state.next_token)
+      nodes = _SolutionNodes(state)
+      for node in nodes:
+        bounds.append(lower_bound(node.state))
+        self.assertLessEqual(bounds[-1], nodes[-1].penalty - node.penalty)
+    self.assertTrue(any(bounds))
+
+  def testBoundPopsFewerStates(self):
+    states = self._InitialStates()
+    popped = sum(self._PoppedStates(state) for state in states)
+    reformatter._PenaltyLowerBound = lambda first_token: lambda state: 0
+    popped_without_bound = sum(self._PoppedStates(state) for state in states)
+    self.assertLess(popped, popped_without_bound)
+
+
+class UpperBoundTest(unittest.TestCase):
+
+  UNFORMATTED_CODE = LONG_LINES_CODE + LONG_EXPRESSIONS_CODE
+
+  def setUp(self):
+    style.SetGlobalStyle(style.CreatePEP8Style())
+    self.greedy_penalty = reformatter._GreedyPenalty
+
+  def tearDown(self):
+    reformatter._GreedyPenalty = self.greedy_penalty
+
+  def testSameAsWithoutBound(self):
+    expected_formatted_code = reformatter.Reformat(
+        _ParseAndUnwrap(self.UNFORMATTED_CODE))
+    reformatter._GreedyPenalty = lambda initial_state: None
+    self.assertEqual(expected_formatted_code,
+                     reformatter.Reformat(_ParseAndUnwrap(self.UNFORMATTED_CODE)))
+
+  def testBoundIsNotBelowBestPenalty(self):
+    for uwline in _ParseAndUnwrap(self.UNFORMATTED_CODE):
+      state = format_decision_state.FormatDecisionState(
+          uwline, style.Get('INDENT_WIDTH') * uwline.depth)
+      self.assertLessEqual(_SolutionNodes(state)[-1].penalty,
+                           reformatter._GreedyPenalty(state))
+
+
+class MergedStatesTest(unittest.TestCase):
+
+  UNFORMATTED_CODE = textwrap.dedent("""\
+      x = gg(hhh(obj.meth(gg(f(kv, 's'), gg(ccc), obj.meth(x1, kv, bb)),
+          hhh(hhh(kv, [1, 2], [1, 2], 's'), 's', hhh(ccc, 's', 's', ccc))),
+          hhh(call(f('s', bb, kv), ccc, x1, obj.meth(x1, bb)),
+          call(obj.meth(kv, bb), obj.meth(ccc, dddd), hhh('s', x1, x1)),
+          gg(f([1, 2]))), obj.meth(obj.meth(call(a, [1, 2], dddd, a),
+          call(a, x1, 's'))), f(call(obj.meth(ccc, bb, ccc, 's'), [1, 2],
+          hhh(x1, bb, ccc), f(a, [1, 2], dddd)))))
+      """)
+
+  def setUp(self):
+    style.SetGlobalStyle(style.CreatePEP8Style())
+    self.state_eq = format_decision_state.FormatDecisionState.__eq__
+
+  def tearDown(self):
+    format_decision_state.FormatDecisionState.__eq__ = self.state_eq
+
+  def testSameAsWithoutMerging(self):
+    # Past 10000 queued states, the search treats states that differ only in
+    # their paren stacks as the same, as it does for this line. Merging equal
+    # states before then mustn't change when that happens.
+    expected_formatted_code = reformatter.Reformat(
+        _ParseAndUnwrap(self.UNFORMATTED_CODE))
+
+    state_eq = self.state_eq
+
+    def StateEq(state, other):
+      if state.ignore_stack_for_comparison or other.ignore_stack_for_comparison:
+        return state_eq(state, other)
+      return state is other
+
+    format_decision_state.FormatDecisionState.__eq__ = StateEq
+    self.assertEqual(
+        expected_formatted_code,
+        reformatter.Reformat(_ParseAndUnwrap(self.UNFORMATTED_CODE)))
+
+
+class BeamSearchTest(unittest.TestCase):
+
+  UNFORMATTED_CODE = LONG_LINES_CODE
+
+  def tearDown(self):
+    style.SetGlobalStyle(style.CreatePEP8Style())
+
+  def _BeamStyle(self, beam_width):
+    beam_style = style.CreatePEP8Style()
+    beam_style['SEARCH_STRATEGY'] = 'beam'
+    beam_style['BEAM_WIDTH'] = beam_width
+    return beam_style
+
+  def testSameAsDijkstra(self):
+    style.SetGlobalStyle(style.CreatePEP8Style())
+    expected_formatted_code = reformatter.Reformat(
+        _ParseAndUnwrap(self.UNFORMATTED_CODE))
+    style.SetGlobalStyle(self._BeamStyle(20))
+    self.assertEqual(expected_formatted_code,
+                     reformatter.Reformat(_ParseAndUnwrap(self.UNFORMATTED_CODE)))
+
+  def testEmptyBeamFallsBack(self):
+    # No state survives a beam of width 0, so the whole solution space is
+    # searched instead of leaving the line half formatted.
+    style.SetGlobalStyle(style.CreatePEP8Style())
+    expected_formatted_code = reformatter.Reformat(
+        _ParseAndUnwrap(self.UNFORMATTED_CODE))
+    style.SetGlobalStyle(self._BeamStyle(0))
+    self.assertEqual(expected_formatted_code,
+                     reformatter.Reformat(_ParseAndUnwrap(self.UNFORMATTED_CODE)))
+
+  def _Penalties(self):
+    penalties = []
+    for uwline in _ParseAndUnwrap(self.UNFORMATTED_CODE):
+      state = format_decision_state.FormatDecisionState(
+          uwline, style.Get('INDENT_WIDTH') * uwline.depth)
+      penalties.append(_SolutionNodes(state)[-1].penalty)
+    return penalties
+
+  def testNarrowBeam(self):
+    # A narrow beam may miss the best formatting, but never beats it.
+    style.SetGlobalStyle(style.CreatePEP8Style())
+    best_penalties = self._Penalties()
+    style.SetGlobalStyle(self._BeamStyle(1))
+    for beam_penalty, best_penalty in zip(self._Penalties(), best_penalties):
+      self.assertGreaterEqual(beam_penalty, best_penalty)
+    formatted_code = reformatter.Reformat(
+        _ParseAndUnwrap(self.UNFORMATTED_CODE))
+    compile(formatted_code, '<string>', 'exec')
+
+
+def _SolutionNodes(initial_state):
+  """Returns the nodes along the formatting that the search finds.
+
+  Arguments:
+    initial_state: the state to start the search from.
+
+  Returns:
+    List of nodes, from the one of the initial state to the one with all of
+    the tokens placed.
+  """
+  nodes = [reformatter._StateNode(initial_state, False, None)]
+  for newline in reformatter._FindSolution(initial_state):
+    nodes.append(reformatter._NextStateNode(nodes[-1], newline))
+  return nodes
+
+
 def _ParseAndUnwrap(code, dumptree=False):
   """Produces unwrapped lines from the given code.
 
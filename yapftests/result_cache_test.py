@@ -0,0 +1,302 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for yapf.result_cache."""
+
+import os
+import shutil
+import tempfile
+import textwrap
+import time
+import unittest
+
+from yapf.yapflib import result_cache
+from yapf.yapflib import style
+from yapf.yapflib import yapf_api
+
+
+class ResultCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+    self.cache = result_cache.ResultCache(self.cache_dir, '1.0')
+
+  def tearDown(self):
+    shutil.rmtree(self.cache_dir)
+
+  def testMiss(self):
+    key = self.cache.Key(u'x = 1\n', style.CreatePEP8Style(), None)
+    self.assertIsNone(self.cache.Get(key, u'x = 1\n'))
+
+  def testFormattedEntry(self):
+    key = self.cache.Key(u'x=1\n', style.CreatePEP8Style(), None)
+    self.cache.Put(key, u'x=1\n', u'x = 1\n')
+    self.assertEqual(u'x = 1\n', self.cache.Get(key, u'x=1\n'))
+
+  def testCleanEntry(self):
+    key = self.cache.Key(u'x = 1\n', style.CreatePEP8Style(), None)
+    self.cache.Put(key, u'x = 1\n', u'x = 1\n')
+    self.assertEqual(u'x = 1\n', self.cache.Get(key, u'x = 1\n'))
+
+  def testKeyDependsOnSettings(self):
+    source = u'x = 1\n'
+    pep8_key = self.cache.Key(source, style.CreatePEP8Style(), None)
+    self.assertNotEqual(pep8_key,
+                        self.cache.Key(source, style.CreateGoogleStyle(), None))
+    self.assertNotEqual(pep8_key,
+                        self.cache.Key(source, style.CreatePEP8Style(),
+                                       [(1, 1)]))
+    other_version = result_cache.ResultCache(self.cache_dir, '2.0')
+    self.assertNotEqual(pep8_key,
+                        other_version.Key(source, style.CreatePEP8Style(),
+                                          None))
+
+  def testPruneEvictsLeastRecentlyUsed(self):
+    pep8_style = style.CreatePEP8Style()
+    keys = []
+    for i in range(3):
+      source = u'x = {0}\n'.format(i)
+      key = self.cache.Key(source, pep8_style, None)
+      self.cache.Put(key, source, u'y = {0}\n'.format(i))
+      # Make sure that the entries are ordered by their modification times.
+      then = time.time() - 100 + i
+      os.utime(self.cache._EntryPath(key), (then, then))
+      keys.append(key)
+
+    # Touch the oldest entry so that the second one is evicted.
+    self.assertEqual(u'y = 0\n', self.cache.Get(keys[0], u'x = 0\n'))
+
+    entry_size = os.path.getsize(self.cache._EntryPath(keys[0]))
+    self.cache.max_size = 5 * entry_size // 2
+    self.cache.Prune()
+
+    self.assertEqual(u'y = 0\n', self.cache.Get(keys[0], u'x = 0\n'))
+    self.assertIsNone(self.cache.Get(keys[1], u'x = 1\n'))
+    self.assertEqual(u'y = 2\n', self.cache.Get(keys[2], u'x = 2\n'))
+
+  def testPruneWalksOnlyPastRecordedSize(self):
+    pep8_style = style.CreatePEP8Style()
+    keys = [self.cache.Key(u'x = {0}\n'.format(i), pep8_style, None)
+            for i in range(3)]
+    self.cache.Put(keys[0], u'x = 0\n', u'y = 0\n')
+    entry_size = os.path.getsize(self.cache._EntryPath(keys[0]))
+    self.cache.max_size = 2 * entry_size
+    self.cache.Prune()
+
+    # A file the cache didn't write isn't seen until the cache is walked.
+    stray_file = os.path.join(self.cache_dir, 'ff', 'stray')
+    os.mkdir(os.path.dirname(stray_file))
+    with open(stray_file, 'wb') as fd:
+      fd.write(b'F' * 2 * entry_size)
+    os.utime(stray_file, (0, 0))
+    self.cache.Prune()
+    self.assertTrue(os.path.exists(stray_file))
+
+    self.cache.Put(keys[1], u'x = 1\n', u'y = 1\n')
+    self.cache.Prune()
+    self.assertTrue(os.path.exists(stray_file))
+
+    # The entries written take the cache past its limit.
+    self.cache.Put(keys[2], u'x = 2\n', u'y = 2\n')
+    self.cache.Prune()
+    self.assertFalse(os.path.exists(stray_file))
+
+  def testForcedPrune(self):
+    key = self.cache.Key(u'x = 1\n', style.CreatePEP8Style(), None)
+    self.cache.Put(key, u'x = 1\n', u'y = 1\n')
+    entry_size = os.path.getsize(self.cache._EntryPath(key))
+    self.cache.max_size = 2 * entry_size
+    self.cache.Prune()
+
+    stray_file = os.path.join(self.cache_dir, 'ff', 'stray')
+    os.mkdir(os.path.dirname(stray_file))
+    with open(stray_file, 'wb') as fd:
+      fd.write(b'F' * 2 * entry_size)
+    os.utime(stray_file, (0, 0))
+    self.cache.Prune(force=True)
+    self.assertFalse(os.path.exists(stray_file))
+    self.assertEqual(u'y = 1\n', self.cache.Get(key, u'x = 1\n'))
+
+  def testFormatCodeUsesCache(self):
+    unformatted_code = textwrap.dedent(u"""\
+        def f(a,b):
+          return a+b
+        """)
+    expected_formatted_code = textwrap.dedent(u"""\
+        def f(a, b):
+            return a + b
+        """)
+    self.assertEqual(expected_formatted_code,
+                     yapf_api.FormatCode(unformatted_code, style_config='pep8',
+                                         cache=self.cache))
+
+    # A poisoned entry shows that the second call is answered by the cache.
+    key = self.cache.Key(unformatted_code, style.CreatePEP8Style(), None)
+    self.cache.Put(key, unformatted_code, u'cached\n')
+    self.assertEqual(u'cached\n',
+                     yapf_api.FormatCode(unformatted_code, style_config='pep8',
+                                         cache=self.cache))
+
+  def testStatementsEntry(self):
+    pep8_style = style.CreatePEP8Style()
+    key = self.cache.StatementsKey(u'a.py', pep8_style)
+    self.assertEqual({}, self.cache.GetStatements(key))
+    statement_key = self.cache.StatementKey(u'', u'x=1\n', False)
+    self.cache.PutStatements(key, {statement_key: u'x = 1'})
+    self.assertEqual({statement_key: u'x = 1'}, self.cache.GetStatements(key))
+
+    self.assertNotEqual(key, self.cache.StatementsKey(u'b.py', pep8_style))
+    self.assertNotEqual(key, self.cache.StatementsKey(
+        u'a.py', style.CreateGoogleStyle()))
+    self.assertNotEqual(statement_key,
+                        self.cache.StatementKey(u'y = 2\n', u'x=1\n', False))
+    self.assertNotEqual(statement_key,
+                        self.cache.StatementKey(u'', u'x=1\n', True))
+
+  def testFormatCodeReusesUnchangedStatements(self):
+    unformatted_code = textwrap.dedent(u"""\
+        import os
+        def f(a,b):
+          return a+b
+        def g(a,b):
+          return a-b
+        """)
+    yapf_api.FormatCode(unformatted_code, filename=u'a.py',
+                        style_config='pep8', cache=self.cache)
+
+    # Poison the entry of 'f', which doesn't change, but not that of 'g'.
+    pep8_style = style.CreatePEP8Style()
+    statements_key = self.cache.StatementsKey(u'a.py', pep8_style)
+    statements = self.cache.GetStatements(statements_key)
+    f_key = self.cache.StatementKey(u'import os\n',
+                                    u'def f(a,b):\n  return a+b\n', False)
+    self.assertIn(f_key, statements)
+    statements[f_key] = u'\n\n\ncached'
+    self.cache.PutStatements(statements_key, statements)
+
+    expected_formatted_code = textwrap.dedent(u"""\
+        import os
+
+
+        cached
+
+
+        def g(a, b):
+            return a * b
+        """)
+    self.assertEqual(expected_formatted_code,
+                     yapf_api.FormatCode(unformatted_code.replace('-', '*'),
+                                         filename=u'a.py', style_config='pep8',
+                                         cache=self.cache))
+
+  def testStatementsAfterEditSameAsUncached(self):
+    unformatted_code = textwrap.dedent(u"""\
+        x = foo( a,b ,c)
+        # a
+            # b
+        y = 1
+        def f():
+            return 1
+            # c
+        # d
+        z = 2
+          # e
+
+        # f
+        class A( object ):
+            pass
+        """)
+    edits = [(u'y = 1', u'y = 2'), (u'# d\n', u''), (u'z = 2', u'z = [1,2]'),
+             (u'    # b\n', u''), (u'class A', u'# g\nclass A')]
+    source = unformatted_code
+    yapf_api.FormatCode(source, filename=u'a.py', style_config='pep8',
+                        cache=self.cache)
+    for old, new in edits:
+      source = source.replace(old, new)
+      self.assertEqual(yapf_api.FormatCode(source, style_config='pep8'),
+                       yapf_api.FormatCode(source, filename=u'a.py',
+                                           style_config='pep8',
+                                           cache=self.cache))
+
+  def testUnwrappedLinesEntry(self):
+    key = self.cache.UnwrappedLinesKey(u'x = 1\n', None)
+    self.assertIsNone(self.cache.GetUnwrappedLines(key))
+    self.cache.PutUnwrappedLines(key, b'lines')
+    self.assertEqual(b'lines', self.cache.GetUnwrappedLines(key))
+
+    self.assertNotEqual(key, self.cache.UnwrappedLinesKey(u'x = 2\n', None))
+    self.assertNotEqual(key, self.cache.UnwrappedLinesKey(u'x = 1\n', True))
+
+  def testOtherStyleReusesUnwrappedLines(self):
+    unformatted_code = u'def f(a,b):\n  return a+b\n'
+    other_code = u'def f(a,b):\n  return a-b\n'
+    wide_style = style.CreatePEP8Style()
+    wide_style['INDENT_WIDTH'] = 8
+    for code in (unformatted_code, other_code):
+      yapf_api.FormatCodeWithStyles(code, ['pep8', wide_style],
+                                    cache=self.cache)
+
+    # Poison the entry, to show that the source isn't parsed again.
+    key = self.cache.UnwrappedLinesKey(unformatted_code, None)
+    self.assertIsNotNone(self.cache.GetUnwrappedLines(key))
+    self.cache.PutUnwrappedLines(key, self.cache.GetUnwrappedLines(
+        self.cache.UnwrappedLinesKey(other_code, None)))
+
+    self.assertEqual(u'def f(a, b):\n  return a - b\n',
+                     yapf_api.FormatCode(unformatted_code,
+                                         style_config='google',
+                                         cache=self.cache))
+    self.assertEqual(u'def f(a,b):\n  return a - b\n',
+                     yapf_api.FormatCode(unformatted_code,
+                                         style_config='google',
+                                         lines=[(2, 2)], cache=self.cache))
+
+  def testPartialFormattingKeepsUnwrappedLines(self):
+    # Only the statement on the last line is parsed.
+    unformatted_code = u'print "a"\n\n\ny = f(a,b)\n'
+    yapf_api.FormatCode(unformatted_code, style_config='pep8',
+                        lines=[(4, 4)], cache=self.cache)
+    self.assertIsNone(self.cache.GetUnwrappedLines(
+        self.cache.UnwrappedLinesKey(unformatted_code, None)))
+
+    # Whether 'print' is a statement on the last line depends on the first, so
+    # the whole source is parsed.
+    unformatted_code = u'print "a"\n\n\ny = f(a,b)  # print\n'
+    yapf_api.FormatCode(unformatted_code, style_config='pep8',
+                        lines=[(4, 4)], cache=self.cache)
+    self.assertIsNotNone(self.cache.GetUnwrappedLines(
+        self.cache.UnwrappedLinesKey(unformatted_code, None)))
+
+  def testFormattingDoesNotKeepUnwrappedLines(self):
+    unformatted_code = u'def f(a,b):\n  return a+b\n'
+    yapf_api.FormatCode(unformatted_code, style_config='pep8',
+                        cache=self.cache)
+    yapf_api.FormatCode(unformatted_code, filename=u'a.py',
+                        style_config='google', cache=self.cache)
+    yapf_api.CheckCode(unformatted_code, style_config='google',
+                       lines=[(1, 2)], cache=self.cache)
+    self.assertIsNone(self.cache.GetUnwrappedLines(
+        self.cache.UnwrappedLinesKey(unformatted_code, None)))
+
+  def testUnwritableCacheIsIgnored(self):
+    cache = result_cache.ResultCache(os.path.join(self.cache_dir, 'file'),
+                                     '1.0')
+    with open(os.path.join(self.cache_dir, 'file'), 'w') as fd:
+      fd.write('not a directory')
+    self.assertEqual(u'x = 1\n',
+                     yapf_api.FormatCode(u'x=1\n', style_config='pep8',
+                                         cache=cache))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,132 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests that YAPF imports only what a run needs, within a time budget."""
+
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+
+# The most time 'import yapf' may take, as a multiple of the time the modules
+# that the interpreter imports at startup take. It takes about 3 times as long;
+# importing the parser and the reformatter at the top level again would make it
+# about 8 times as long. The times of both come from the same machine, so the
+# budget doesn't depend on how fast it is.
+IMPORT_BUDGET = 5
+
+# How many times each is timed. The least of the times is the one used, which
+# leaves out the delays of a loaded machine.
+IMPORT_BUDGET_RUNS = 5
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'requires -X importtime')
+class StartupTest(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.test_tmpdir = tempfile.mkdtemp()
+    cls.cache_dir = os.path.join(cls.test_tmpdir, 'cache')
+    # Compiling the modules would take longer than importing them. Keep the
+    # byte code out of the tree, but let the interpreter write it.
+    cls.pycache_dir = os.path.join(cls.test_tmpdir, 'pycache')
+    cls.formatted_file = os.path.join(cls.test_tmpdir, 'formatted.py')
+    with io.open(cls.formatted_file, mode='w', newline='') as fd:
+      fd.write(u'x = 1\n')
+    cls.unformatted_file = os.path.join(cls.test_tmpdir, 'unformatted.py')
+    with io.open(cls.unformatted_file, mode='w', newline='') as fd:
+      fd.write(u'x=1\n')
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls.test_tmpdir)
+
+  def _ImportTimes(self, code, self_times=False):
+    """Run code in a new interpreter, returning the import time per module.
+
+    Arguments:
+      code: (str) The code to run.
+      self_times: (bool) Return the time each module takes without the modules
+        it imports, rather than with them.
+
+    Returns:
+      A dict from the name of each module imported to its time, in
+      microseconds.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR, XDG_CACHE_HOME=self.cache_dir,
+               PYTHONPYCACHEPREFIX=self.pycache_dir)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    p = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', code],
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE,
+                         env=env)
+    _, stderrdata = p.communicate()
+    times = {}
+    for line in stderrdata.decode('utf-8').splitlines():
+      if not line.startswith('import time:') or 'cumulative' in line:
+        continue
+      self_time, cumulative, name = line[len('import time:'):].split('|')
+      times[name.strip()] = int(self_time if self_times else cumulative)
+    return times
+
+  def _RunMain(self, *args):
+    return self._ImportTimes('import yapf; yapf.main({0!r})'.format(
+        ['yapf'] + list(args)))
+
+  def _TotalImportTime(self, code):
+    """Return the least total import time of several runs of code."""
+    return min(
+        sum(self._ImportTimes(code, self_times=True).values())
+        for _ in range(IMPORT_BUDGET_RUNS))
+
+  def testImportBudget(self):
+    self._ImportTimes('import yapf')  # Compile the modules.
+    startup_time = self._TotalImportTime('pass')
+    self.assertLess(self._TotalImportTime('import yapf'),
+                    IMPORT_BUDGET * startup_time)
+
+  def testImportDoesNotLoadHeavyModules(self):
+    times = self._ImportTimes('import yapf')
+    self.assertIn('yapf', times)
+    for module in ('argparse', 'difflib', 'multiprocessing', 'lib2to3.pygram',
+                   'yapf.yapflib.daemon', 'yapf.yapflib.git_diff'):
+      self.assertNotIn(module, times)
+
+  def testCacheHitDoesNotLoadGrammar(self):
+    self._RunMain('--check', self.formatted_file)
+    times = self._RunMain('--check', self.formatted_file)
+    self.assertIn('yapf.yapflib.result_cache', times)
+    self.assertNotIn('lib2to3.pygram', times)
+
+  def testCachedGrammarDoesNotLoadPygram(self):
+    # The files differ, so that the second isn't answered by the result cache.
+    self._RunMain('--check', self.formatted_file)
+    times = self._RunMain('--check', self.unformatted_file)
+    self.assertIn('yapf.yapflib.grammar_cache', times)
+    self.assertNotIn('lib2to3.pygram', times)
+
+  def testDifflibOnlyForDiff(self):
+    times = self._RunMain('--no-cache', '--check', self.unformatted_file)
+    self.assertIn('yapf.yapflib.reformatter', times)
+    self.assertNotIn('difflib', times)
+    times = self._RunMain('--no-cache', '--diff', self.unformatted_file)
+    self.assertIn('difflib', times)
+
+
+if __name__ == '__main__':
+  unittest.main()
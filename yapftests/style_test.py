@@ -38,6 +38,19 @@ class UtilsTest(unittest.TestCase):
     self.assertEqual(style._BoolConverter('false'), False)
     self.assertEqual(style._BoolConverter('0'), False)
 
+  def test_SearchStrategyConverter(self):
+    self.assertEqual(style._SearchStrategyConverter('beam'), 'beam')
+    self.assertEqual(style._SearchStrategyConverter(' Dijkstra'), 'dijkstra')
+    with self.assertRaises(style.StyleConfigError):
+      style._SearchStrategyConverter('greedy')
+
+  def test_PositiveIntConverter(self):
+    self.assertEqual(style._PositiveIntConverter('8'), 8)
+    with self.assertRaises(style.StyleConfigError):
+      style._PositiveIntConverter('0')
+    with self.assertRaises(style.StyleConfigError):
+      style._PositiveIntConverter('-3')
+
 
 def _LooksLikeGoogleStyle(cfg):
   return (cfg['INDENT_WIDTH'] == 2 and
@@ -141,6 +154,32 @@ class StyleFromFileTest(unittest.TestCase):
       self.assertTrue(_LooksLikeGoogleStyle(cfg))
       self.assertEqual(cfg['I18N_FUNCTION_CALL'], ['N_', 'V_', 'T_'])
 
+  def test_SearchStrategyOptionValue(self):
+    cfg = textwrap.dedent('''\
+        [style]
+        search_strategy = beam
+        beam_width = 8
+        ''')
+    with _TempFileContents(self.test_tmpdir, cfg) as f:
+      cfg = style.CreateStyleFromConfig(f.name)
+      self.assertTrue(_LooksLikePEP8Style(cfg))
+      self.assertEqual(cfg['SEARCH_STRATEGY'], 'beam')
+      self.assertEqual(cfg['BEAM_WIDTH'], 8)
+
+  def test_ErrorBeamWidth(self):
+    cfg = textwrap.dedent('''\
+        [style]
+        search_strategy = beam
+        beam_width = 0
+        ''')
+    with _TempFileContents(self.test_tmpdir, cfg) as f:
+      with self.assertRaises(style.StyleConfigError):
+        style.CreateStyleFromConfig(f.name)
+
+  def test_StyleDict(self):
+    google_style = style.CreateGoogleStyle()
+    self.assertIs(style.CreateStyleFromConfig(google_style), google_style)
+
   def test_ErrorNoStyleFile(self):
     with self.assertRaisesRegexp(style.StyleConfigError,
                                  'is not a valid style or file path'):
@@ -0,0 +1,138 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for yapf.yapf_api_async."""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+  import asyncio
+  import concurrent.futures
+  from yapf.yapflib import yapf_api_async
+except (ImportError, SyntaxError):
+  # The module needs Python 3.6 or later.
+  yapf_api_async = None
+
+
+@unittest.skipIf(yapf_api_async is None, 'requires Python 3.6 or later')
+class YapfApiAsyncTest(unittest.TestCase):
+
+  def setUp(self):
+    self.test_tmpdir = tempfile.mkdtemp()
+    self.loop = asyncio.new_event_loop()
+    # Threads share the global style, so only one worker may format at once.
+    self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+  def tearDown(self):
+    self.executor.shutdown()
+    yapf_api_async.Shutdown()
+    self.loop.close()
+    shutil.rmtree(self.test_tmpdir)
+
+  def _WriteFile(self, name, contents):
+    filename = os.path.join(self.test_tmpdir, name)
+    with io.open(filename, mode='w', newline='') as fd:
+      fd.write(contents)
+    return filename
+
+  def _ReadFile(self, filename):
+    with io.open(filename, mode='r', newline='') as fd:
+      return fd.read()
+
+  def _Collect(self, async_iterator):
+    results = []
+    while True:
+      try:
+        results.append(self.loop.run_until_complete(
+            async_iterator.__anext__()))
+      except StopAsyncIteration:
+        return results
+
+  def testFormatFile(self):
+    filename = self._WriteFile('foo.py', u'def f():\n    return 1\n')
+    self.assertEqual(u'def f():\n  return 1\n',
+                     self.loop.run_until_complete(
+                         yapf_api_async.FormatFile(filename,
+                                                   style_config='google',
+                                                   executor=self.executor)))
+
+  def testFormatFileInDefaultExecutor(self):
+    filename = self._WriteFile('foo.py', u'x=1\n')
+    self.assertEqual(u'x = 1\n',
+                     self.loop.run_until_complete(
+                         yapf_api_async.FormatFile(filename)))
+
+  def testShutdownDefaultExecutor(self):
+    filename = self._WriteFile('foo.py', u'x=1\n')
+    for _ in range(2):
+      self.assertEqual(u'x = 1\n',
+                       self.loop.run_until_complete(
+                           yapf_api_async.FormatFile(filename)))
+      self.assertIsNotNone(yapf_api_async._default_executor)
+      # A call after the shutdown starts a new pool.
+      yapf_api_async.Shutdown()
+      self.assertIsNone(yapf_api_async._default_executor)
+    yapf_api_async.Shutdown()
+
+  def testFormatMissingFile(self):
+    self.assertIsNone(self.loop.run_until_complete(
+        yapf_api_async.FormatFile(os.path.join(self.test_tmpdir, 'none.py'),
+                                  executor=self.executor)))
+
+  def testFormatFileInPlace(self):
+    filename = self._WriteFile('foo.py', u'x=1\n')
+    self.loop.run_until_complete(
+        yapf_api_async.FormatFile(filename, in_place=True,
+                                  executor=self.executor))
+    self.assertEqual(u'x = 1\n', self._ReadFile(filename))
+
+  def testInPlaceAndDiffAreExclusive(self):
+    with self.assertRaises(ValueError):
+      self.loop.run_until_complete(
+          yapf_api_async.FormatFile('foo.py', in_place=True, print_diff=True))
+
+  def testFormatFilesKeepsOrder(self):
+    filenames = [self._WriteFile('f{0}.py'.format(i), u'x={0}\n'.format(i))
+                 for i in range(5)]
+    self.assertEqual([u'x = {0}\n'.format(i) for i in range(5)],
+                     self.loop.run_until_complete(
+                         yapf_api_async.FormatFiles(filenames,
+                                                    executor=self.executor,
+                                                    max_concurrency=2)))
+
+  def testFormatFilesAsCompleted(self):
+    filenames = [self._WriteFile('f{0}.py'.format(i), u'x={0}\n'.format(i))
+                 for i in range(5)]
+    results = self._Collect(
+        yapf_api_async.FormatFilesAsCompleted(filenames, print_diff=True,
+                                              executor=self.executor,
+                                              max_concurrency=2))
+    self.assertEqual(sorted(filenames), sorted(f for f, _ in results))
+    for filename, code_diff in results:
+      self.assertIn(u'--- {0}'.format(filename), code_diff)
+
+  def testFormatFilesAsCompletedRaisesErrors(self):
+    filenames = [self._WriteFile('bad.py', u'def f(:\n'),
+                 self._WriteFile('good.py', u'x = 1\n')]
+    with self.assertRaises(Exception):
+      self._Collect(
+          yapf_api_async.FormatFilesAsCompleted(filenames,
+                                                executor=self.executor))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -16,6 +16,7 @@
 
 import io
 import os
+import random
 import shutil
 import subprocess
 import sys
@@ -23,6 +24,7 @@ import tempfile
 import textwrap
 import unittest
 
+from yapf.yapflib import py3compat
 from yapf.yapflib import style
 from yapf.yapflib import yapf_api
 
@@ -44,15 +46,375 @@ class YapfTest(unittest.TestCase):
     self._Check(unformatted_code, unformatted_code)
 
 
+class CheckCodeTest(unittest.TestCase):
+
+  def testFormattedCode(self):
+    code = textwrap.dedent(u"""\
+        import os
+
+
+        # A comment attached to the function.
+        def f(a, b):
+            return a + b
+        """)
+    self.assertTrue(yapf_api.CheckCode(code, style_config='pep8'))
+
+  def testUnformattedCode(self):
+    self.assertFalse(yapf_api.CheckCode(u'x = 1\ny=2\n', style_config='pep8'))
+    # The blank lines before the comment are only wrong once the function that
+    # follows it is seen.
+    self.assertFalse(yapf_api.CheckCode(
+        u'import os\n# comment\ndef f():\n    pass\n', style_config='pep8'))
+
+  def testTrailingWhitespace(self):
+    self.assertFalse(yapf_api.CheckCode(u'x = 1\n\n', style_config='pep8'))
+
+  def testLines(self):
+    code = u'x = 1\ny=2\n'
+    self.assertTrue(yapf_api.CheckCode(code, style_config='pep8',
+                                       lines=[(1, 1)]))
+    self.assertFalse(yapf_api.CheckCode(code, style_config='pep8',
+                                        lines=[(2, 2)]))
+
+
+class FormatterTest(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.test_tmpdir = tempfile.mkdtemp()
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls.test_tmpdir)
+
+  def testFormatCode(self):
+    formatter = yapf_api.Formatter('google')
+    self.assertEqual(u'def f():\n  return 1\n',
+                     formatter.FormatCode(u'def f():\n    return 1\n'))
+    self.assertEqual(u'x = 1\n', formatter.FormatCode(u'x=1\n'))
+
+  def testStyleIsResolvedOnce(self):
+    style_file = os.path.join(self.test_tmpdir, 'style.cfg')
+    with open(style_file, 'w') as fd:
+      fd.write('[style]\nbased_on_style = google\n')
+    formatter = yapf_api.Formatter(style_file)
+    os.remove(style_file)
+    self.assertEqual(u'def f():\n  return 1\n',
+                     formatter.FormatCode(u'def f():\n    return 1\n'))
+
+  def testFormatCodeWithDiff(self):
+    formatter = yapf_api.Formatter('pep8')
+    self.assertEqual('', formatter.FormatCode(u'x = 1\n', print_diff=True))
+    self.assertIn(u'+x = 1',
+                  formatter.FormatCode(u'x=1\n', filename='foo.py',
+                                       print_diff=True))
+
+  def testFormatFile(self):
+    filename = os.path.join(self.test_tmpdir, 'foo.py')
+    with io.open(filename, mode='w', newline='') as fd:
+      fd.write(u'x=1\n')
+    self.assertEqual(u'x = 1\n', yapf_api.Formatter().FormatFile(filename))
+    self.assertIsNone(
+        yapf_api.Formatter().FormatFile(os.path.join(self.test_tmpdir,
+                                                     'missing.py')))
+
+  def testFormatMany(self):
+    formatter = yapf_api.Formatter('pep8')
+    self.assertEqual([u'x = 1\n', u'', u'y = [1, 2]\n'],
+                     list(formatter.FormatMany([u'x=1\n', u'\n',
+                                                u'y=[1,2]\n'])))
+
+
+class FormatCodeWithStylesTest(unittest.TestCase):
+
+  CODE = textwrap.dedent(u"""\
+      # A comment.
+      def f(a,b):
+        if a: return [a,
+                      b]
+        return some_function(a, b, another_argument, yet_another_argument_here)
+      """)
+
+  def testSameAsFormatCode(self):
+    style_configs = ['pep8', 'google', style.CreatePEP8Style()]
+    expected = [yapf_api.FormatCode(self.CODE, style_config=style_config)
+                for style_config in style_configs]
+    self.assertEqual(expected,
+                     yapf_api.FormatCodeWithStyles(self.CODE, style_configs))
+    self.assertEqual(
+        [yapf_api.FormatCode(self.CODE, style_config=style_config,
+                             lines=[(2, 2)])
+         for style_config in style_configs],
+        yapf_api.FormatCodeWithStyles(self.CODE, style_configs,
+                                      lines=[(2, 2)]))
+
+  def testDiffsNameTheStyle(self):
+    diffs = yapf_api.FormatCodeWithStyles(u'x=1\n', ['pep8', 'google'],
+                                          filename='foo.py', print_diff=True)
+    self.assertTrue(diffs[0].startswith(u'--- foo.py (pep8)'))
+    self.assertTrue(diffs[1].startswith(u'--- foo.py (google)'))
+    self.assertEqual([u'', u''],
+                     yapf_api.FormatCodeWithStyles(u'x = 1\n',
+                                                   ['pep8', 'google'],
+                                                   print_diff=True))
+
+
+class FormatLinesTest(unittest.TestCase):
+
+  def _Check(self, unformatted_code, lines, expected_formatted_code):
+    formatted_code = yapf_api.FormatCode(unformatted_code, style_config='pep8',
+                                         lines=lines)
+    self.assertEqual(expected_formatted_code, formatted_code)
+
+  def testOnlyEnclosingStatementsAreParsed(self):
+    # The code after the statement isn't valid, but isn't parsed either.
+    unformatted_code = textwrap.dedent(u"""\
+        import os
+        @decorator
+        def f(a,b):
+            if a:
+                return a+b
+            else:
+                return a-b
+        x = = 1
+        """)
+    expected_formatted_code = textwrap.dedent(u"""\
+        import os
+        @decorator
+        def f(a,b):
+            if a:
+                return a+b
+            else:
+                return a - b
+        x = = 1
+        """)
+    self._Check(unformatted_code, [(7, 7)], expected_formatted_code)
+
+  def testCommentBeforeStatement(self):
+    unformatted_code = textwrap.dedent(u"""\
+        def f():
+            return 1
+        # A comment.
+        def g( ):
+            return 2
+        y=3
+        """)
+    expected_formatted_code = textwrap.dedent(u"""\
+        def f():
+            return 1
+        # A comment.
+        def g():
+            return 2
+
+
+        y = 3
+        """)
+    self._Check(unformatted_code, [(3, 6)], expected_formatted_code)
+
+  def testCommentsAfterStatement(self):
+    unformatted_code = u'x = foo( a,b ,c)\n# a\n    # b\ny = 1\n'
+    self._Check(unformatted_code, [(1, 1)],
+                u'x = foo(a, b, c)\n# a\n    # b\ny = 1\n')
+
+  def testIndentedCommentAfterBlock(self):
+    # The comment stays in the block, as it does when the whole file is
+    # formatted.
+    unformatted_code = textwrap.dedent(u"""\
+        def f():
+            pass
+            #   A comment.
+        x=1
+        """)
+    self._Check(unformatted_code, [(3, 4)], yapf_api.FormatCode(
+        unformatted_code, style_config='pep8'))
+
+  def testSeveralRanges(self):
+    self._Check(u'a=1\nb=2\nc=3\n', [(1, 1), (3, 3)], u'a = 1\nb=2\nc = 3\n')
+
+  def testLinesPastTheEnd(self):
+    self._Check(u'x=1\n', [(7, 7)], u'x=1\n')
+    self._Check(u'x=1\ny=2\n', [(2, 7)], u'x=1\ny = 2\n')
+    self._Check(u'', [(1, 1)], u'')
+
+  def testPrintStatementElsewhere(self):
+    # Whether the print below is a statement depends on the first line.
+    self._Check(u'print "x"\nprint(1,2)\n', [(2, 2)],
+                u'print "x"\nprint(1, 2)\n')
+
+
+class FormatCodeInChunksTest(unittest.TestCase):
+
+  def setUp(self):
+    # Put every statement in a chunk of its own.
+    self.chunk_lines = yapf_api._CHUNK_LINES
+    yapf_api._CHUNK_LINES = 1
+
+  def tearDown(self):
+    yapf_api._CHUNK_LINES = self.chunk_lines
+
+  def _Check(self, unformatted_code):
+    chunks = list(yapf_api.FormatCodeInChunks(unformatted_code,
+                                              style_config='pep8'))
+    self.assertEqual(yapf_api.FormatCode(unformatted_code, style_config='pep8'),
+                     ''.join(chunks))
+    return chunks
+
+  def testSameAsFormatCode(self):
+    unformatted_code = textwrap.dedent(u"""\
+        '''Docstring.'''
+        import os
+        x = [1,
+             2]
+        # A comment about f.
+        @decorator
+        def f(a,b):
+            if a:
+                return a+b
+            else:
+                return a-b
+        class A( object ):
+            pass
+        try:
+            pass
+        except ValueError:
+            pass
+        """)
+    self.assertLess(1, len(self._Check(unformatted_code)))
+
+  def testCommentsBetweenStatements(self):
+    unformatted_code = textwrap.dedent(u"""\
+        x = foo( a,b ,c)
+        # a
+            # b
+        y = 1
+        def f():
+            return 1
+            # c
+        # d
+        z = 2
+          # e
+
+        # f
+        """)
+    self.assertEqual(u'x = foo(a, b, c)', self._Check(unformatted_code)[0])
+    # Chunks of a few lines end in other places.
+    for chunk_lines in (2, 3, 5):
+      yapf_api._CHUNK_LINES = chunk_lines
+      self._Check(unformatted_code)
+
+  def testDisabledLines(self):
+    self._Check(u'x=1\n# yapf: disable\ny=2\n# yapf: enable\nz=3\n')
+
+  def testEmpty(self):
+    self.assertEqual([], self._Check(u'\n\n'))
+
+
+class IncrementalFormatterTest(unittest.TestCase):
+
+  def setUp(self):
+    self.reformat_after = yapf_api._ReformatAfter
+    self.formatted_statements = []
+
+    def _ReformatAfter(context, unformatted_source, print_statement):
+      self.formatted_statements.append(unformatted_source)
+      return self.reformat_after(context, unformatted_source, print_statement)
+
+    yapf_api._ReformatAfter = _ReformatAfter
+
+  def tearDown(self):
+    yapf_api._ReformatAfter = self.reformat_after
+
+  def _Edit(self, formatter, old, new):
+    start = formatter.source.index(old)
+    formatter.Edit(start, start + len(old), new)
+    self.assertEqual(yapf_api.FormatCode(formatter.source, style_config='pep8'),
+                     formatter.FormatCode())
+
+  def testOnlyEditedStatementsAreFormatted(self):
+    formatter = yapf_api.IncrementalFormatter(textwrap.dedent(u"""\
+        import os
+        def f(a,b):
+            return a+b
+        x=1
+        class A(object):
+            pass
+        """), style_config='pep8')
+    self.assertEqual(yapf_api.FormatCode(formatter.source, style_config='pep8'),
+                     formatter.FormatCode())
+    self.assertEqual([], self.formatted_statements)
+
+    self._Edit(formatter, u'a+b', u'a-b')
+    # The statement after the edited one is formatted too, since the blank
+    # lines before it depend on it.
+    self.assertEqual([u'def f(a,b):\n    return a-b\n', u'x=1\n'],
+                     self.formatted_statements)
+
+  def testEditsJoiningStatements(self):
+    formatter = yapf_api.IncrementalFormatter(
+        u'if x:\n    pass\ny=2\nz=3\n', style_config='pep8')
+    formatter.FormatCode()
+    self._Edit(formatter, u'y=2\n', u'else:\n    y=2\n')
+    self._Edit(formatter, u'z=3', u'    z=3')
+    self._Edit(formatter, u'if x:', u'while x:')
+    self._Edit(formatter, u'while x:', u'def f():\n  pass\nwhile x:')
+    self._Edit(formatter, u'def f():', u'@decorator\ndef f():')
+
+  def testRandomEdits(self):
+    with io.open(os.path.join(ROOT_DIR, 'yapf', 'yapflib', 'line_joiner.py'),
+                 encoding='utf-8') as fd:
+      formatter = yapf_api.IncrementalFormatter(fd.read(), style_config='pep8')
+    formatter.FormatCode()
+    insertions = [u'# A comment.\n', u'    # An indented comment.\n', u'\n',
+                  u'x=1\n', u'  # Another comment.\n# And one more.\n']
+    rand = random.Random(17)
+    for _ in py3compat.range(60):
+      lines = formatter.source.splitlines(True)
+      i = rand.randrange(len(lines))
+      start = sum(len(line) for line in lines[:i])
+      if rand.random() < 0.7:
+        old, new = u'', rand.choice(insertions)
+      else:
+        old, new = lines[i], u''
+      formatter.Edit(start, start + len(old), new)
+      try:
+        expected_formatted_code = yapf_api.FormatCode(formatter.source,
+                                                      style_config='pep8')
+      except Exception:  # pylint: disable=broad-except
+        # Undo edits that break the code.
+        formatter.Edit(start, start + len(new), old)
+        continue
+      self.assertEqual(expected_formatted_code, formatter.FormatCode())
+
+  def testInvalidCodeInBetween(self):
+    formatter = yapf_api.IncrementalFormatter(u'x = [1,\n2]\n',
+                                              style_config='pep8')
+    formatter.FormatCode()
+    formatter.Edit(5, 5, u'(')
+    formatter.Edit(5, 6, u'')
+    self.assertEqual(u'x = [1, 2]\n', formatter.FormatCode())
+
+  def testEditOutOfRange(self):
+    formatter = yapf_api.IncrementalFormatter(u'x = 1\n')
+    self.assertRaises(ValueError, formatter.Edit, 3, 7, u'')
+    self.assertRaises(ValueError, formatter.Edit, 3, 2, u'')
+
+
 class CommandLineTest(unittest.TestCase):
   """Test how calling yapf from the command line acts."""
 
   @classmethod
   def setUpClass(cls):
     cls.test_tmpdir = tempfile.mkdtemp()
+    # Keep the caches of the yapf processes out of the user's cache directory.
+    cls.cache_home = os.environ.get('XDG_CACHE_HOME')
+    os.environ['XDG_CACHE_HOME'] = os.path.join(cls.test_tmpdir, 'cache')
 
   @classmethod
   def tearDownClass(cls):
+    if cls.cache_home is None:
+      del os.environ['XDG_CACHE_HOME']
+    else:
+      os.environ['XDG_CACHE_HOME'] = cls.cache_home
     shutil.rmtree(cls.test_tmpdir)
 
   def testUnicodeEncodingPipedToFile(self):
@@ -92,6 +454,242 @@ class CommandLineTest(unittest.TestCase):
 
     self.assertEqual(reformatted_code, expected_formatted_code)
 
+  def testInPlaceReformattingInParallel(self):
+    unformatted_code = textwrap.dedent(u"""\
+        def foo():
+          x = 37
+        """)
+    expected_formatted_code = textwrap.dedent(u"""\
+        def foo():
+            x = 37
+        """)
+
+    filenames = []
+    for i in range(4):
+      filename = os.path.join(self.test_tmpdir, 'parallel{0}.py'.format(i))
+      with io.open(filename, mode='w', newline='') as fd:
+        fd.write(unformatted_code)
+      filenames.append(filename)
+
+    subprocess.check_call(YAPF_BINARY + ['--in-place', '--jobs', '2'] +
+                          filenames)
+
+    for filename in filenames:
+      with io.open(filename, mode='r', newline='') as fd:
+        self.assertEqual(fd.read(), expected_formatted_code)
+      os.remove(filename)
+
+  def testGrammarIsPickledInCacheDirectory(self):
+    filename = os.path.join(self.test_tmpdir, 'grammar.py')
+    with io.open(filename, mode='w', newline='') as fd:
+      fd.write(u'x=1\n')
+    cache_dir = os.path.join(self.test_tmpdir, 'grammar-cache')
+    subprocess.check_call(YAPF_BINARY + ['--cache-dir', cache_dir, filename],
+                          stdout=subprocess.PIPE)
+    self.assertTrue([name for name in os.listdir(cache_dir)
+                     if name.startswith('Grammar')])
+
+    cache_home = os.path.join(self.test_tmpdir, 'no-cache')
+    env = dict(os.environ, XDG_CACHE_HOME=cache_home)
+    subprocess.check_call(YAPF_BINARY + ['--no-cache', filename],
+                          stdout=subprocess.PIPE, env=env)
+    self.assertFalse(os.path.exists(cache_home))
+    os.remove(filename)
+
+  def testSingleFileInParallel(self):
+    unformatted_code = (
+        u'result = some_module.some_function_name(argument_one, argument_two, '
+        u'keyword_argument=[1, 2, 3, 4], another_keyword={"x": 1})\n')
+    expected_formatted_code = yapf_api.FormatCode(unformatted_code,
+                                                  style_config='pep8')
+    filename = os.path.join(self.test_tmpdir, 'single.py')
+    with io.open(filename, mode='w', newline='') as fd:
+      fd.write(unformatted_code)
+
+    subprocess.check_call(YAPF_BINARY + ['--in-place', '--no-cache',
+                                         '--style=pep8', '--jobs', '2',
+                                         filename])
+
+    with io.open(filename, mode='r', newline='') as fd:
+      self.assertEqual(fd.read(), expected_formatted_code)
+    os.remove(filename)
+
+  def _WriteFiles(self, contents):
+    filenames = []
+    for i, code in enumerate(contents):
+      filename = os.path.join(self.test_tmpdir, 'check{0}.py'.format(i))
+      with io.open(filename, mode='w', newline='') as fd:
+        fd.write(code)
+      filenames.append(filename)
+    return filenames
+
+  def testCheck(self):
+    filenames = self._WriteFiles([u'x = 1\n', u'x=1\n', u'y = 2\n',
+                                  u'y=2\n'])
+    for jobs in ('1', '2'):
+      p = subprocess.Popen(YAPF_BINARY + ['--check', '--no-cache', '--jobs',
+                                          jobs] + filenames,
+                           stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE)
+      output, _ = p.communicate()
+      self.assertEqual(p.returncode, 1)
+      self.assertEqual(output.decode('utf-8').splitlines(),
+                       [filenames[1], filenames[3]])
+
+    # Nothing is changed.
+    with io.open(filenames[1], mode='r', newline='') as fd:
+      self.assertEqual(fd.read(), u'x=1\n')
+    for filename in filenames:
+      os.remove(filename)
+
+  def testCheckWithSeveralStyles(self):
+    filenames = self._WriteFiles([u'def f():\n    pass\n',
+                                  u'def f():\n  pass\n'])
+    p = subprocess.Popen(YAPF_BINARY + ['--check', '--no-cache', '--style',
+                                        'pep8', '--style', 'google'] +
+                         filenames,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    output, _ = p.communicate()
+    self.assertEqual(p.returncode, 1)
+    self.assertEqual(output.decode('utf-8').splitlines(),
+                     [filenames[0] + ' (google)', filenames[1] + ' (pep8)'])
+    for filename in filenames:
+      os.remove(filename)
+
+  def testCheckFailFast(self):
+    filenames = self._WriteFiles([u'x=1\n', u'y=2\n'])
+    p = subprocess.Popen(YAPF_BINARY + ['--check', '--fail-fast',
+                                        '--no-cache'] + filenames,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    output, _ = p.communicate()
+    self.assertEqual(p.returncode, 1)
+    self.assertEqual(output.decode('utf-8').splitlines(), [filenames[0]])
+    for filename in filenames:
+      os.remove(filename)
+
+  def testCheckFormattedFiles(self):
+    filenames = self._WriteFiles([u'x = 1\n', u'y = 2\n'])
+    p = subprocess.Popen(YAPF_BINARY + ['--check', '--no-cache'] + filenames,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    output, _ = p.communicate()
+    self.assertEqual(p.returncode, 0)
+    self.assertEqual(output, b'')
+    for filename in filenames:
+      os.remove(filename)
+
+  def testDiffBase(self):
+    repo = tempfile.mkdtemp(dir=self.test_tmpdir)
+    filename = os.path.join(repo, 'foo.py')
+    with io.open(filename, mode='w', newline='') as fd:
+      fd.write(u'x=1\ny=2\n')
+    try:
+      subprocess.check_call(['git', 'init', '-q'], cwd=repo)
+      subprocess.check_call(['git', 'add', 'foo.py'], cwd=repo)
+      subprocess.check_call(['git', '-c', 'user.name=yapf', '-c',
+                             'user.email=yapf@example.com', 'commit', '-q',
+                             '-m', 'initial'], cwd=repo)
+    except OSError:
+      self.skipTest('requires git')
+    with io.open(filename, mode='w', newline='') as fd:
+      fd.write(u'x=1\ny=3\nz=4\n')
+
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    subprocess.check_call(YAPF_BINARY + ['--diff-base', 'HEAD', '--in-place',
+                                         '--no-cache'], cwd=repo, env=env)
+    with io.open(filename, mode='r', newline='') as fd:
+      self.assertEqual(fd.read(), u'x=1\ny = 3\nz = 4\n')
+
+    # The files outside of the current directory are found too.
+    subdirectory = os.path.join(repo, 'sub')
+    os.mkdir(subdirectory)
+    with io.open(filename, mode='w', newline='') as fd:
+      fd.write(u'x=1\ny=3\nz=4\n')
+    subprocess.check_call(YAPF_BINARY + ['--diff-base', 'HEAD', '--in-place',
+                                         '--no-cache', '..'],
+                          cwd=subdirectory, env=env)
+    with io.open(filename, mode='r', newline='') as fd:
+      self.assertEqual(fd.read(), u'x=1\ny = 3\nz = 4\n')
+
+  def testFilesFromStdinAndArgumentFile(self):
+    filenames = self._WriteFiles([u'x=1\n', u'y=2\n'])
+    p = subprocess.Popen(YAPF_BINARY + ['--files-from', '-', '--no-cache'],
+                         stdout=subprocess.PIPE,
+                         stdin=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    output, _ = p.communicate('\n'.join(filenames).encode('utf-8'))
+    self.assertEqual(output.decode('utf-8'), u'x = 1\ny = 2\n')
+
+    argfile = os.path.join(self.test_tmpdir, 'args')
+    with io.open(argfile, mode='w') as fd:
+      fd.write(u'\n'.join(['--no-cache'] + filenames[1:]))
+    p = subprocess.Popen(YAPF_BINARY + ['@' + argfile],
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    output, _ = p.communicate()
+    self.assertEqual(output.decode('utf-8'), u'y = 2\n')
+
+    os.remove(argfile)
+    for filename in filenames:
+      os.remove(filename)
+
+  def testExclude(self):
+    filenames = self._WriteFiles([u'x=1\n', u'y=2\n'])
+    p = subprocess.Popen(YAPF_BINARY + ['--no-cache', '--exclude',
+                                        os.path.basename(filenames[0])] +
+                         filenames,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    output, _ = p.communicate()
+    self.assertEqual(output.decode('utf-8'), u'y = 2\n')
+    for filename in filenames:
+      os.remove(filename)
+
+  def testParallelOutputIsInInputOrder(self):
+    filenames = []
+    expected_output = []
+    for i in range(6):
+      filename = os.path.join(self.test_tmpdir, 'ordered{0}.py'.format(i))
+      with io.open(filename, mode='w', newline='') as fd:
+        fd.write(u'x{0}  =  {0}\n'.format(i))
+      filenames.append(filename)
+      expected_output.append(u'x{0} = {0}\n'.format(i))
+
+    p = subprocess.Popen(YAPF_BINARY + ['--jobs', '3'] + filenames,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT)
+    reformatted_code, stderrdata = p.communicate()
+    self.assertIsNone(stderrdata)
+    self.assertEqual(reformatted_code.decode('utf-8'),
+                     u''.join(expected_output))
+
+    for filename in filenames:
+      os.remove(filename)
+
+  def testReportsErrorsPerFile(self):
+    good_file = os.path.join(self.test_tmpdir, 'good.py')
+    bad_file = os.path.join(self.test_tmpdir, 'bad.py')
+    with io.open(good_file, mode='w', newline='') as fd:
+      fd.write(u'x  =  1\n')
+    with io.open(bad_file, mode='w', newline='') as fd:
+      fd.write(u'def f(:\n')
+
+    # Formatting the files one at a time and in parallel handles errors alike.
+    for jobs in ('1', '2'):
+      p = subprocess.Popen(YAPF_BINARY + ['--no-cache', '--jobs', jobs,
+                                          bad_file, good_file],
+                           stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE)
+      reformatted_code, stderrdata = p.communicate()
+      self.assertEqual(p.returncode, 1)
+      self.assertEqual(reformatted_code.decode('utf-8'), u'x = 1\n')
+      self.assertIn(bad_file, stderrdata.decode('utf-8'))
+
+    os.remove(good_file)
+    os.remove(bad_file)
+
   def testReadFromStdin(self):
     unformatted_code = textwrap.dedent(u"""\
         def foo():
@@ -111,6 +709,45 @@ class CommandLineTest(unittest.TestCase):
     self.assertIsNone(stderrdata)
     self.assertEqual(reformatted_code.decode('utf-8'), expected_formatted_code)
 
+  def testReadWindowsLineEndingsFromStdin(self):
+    p = subprocess.Popen(YAPF_BINARY,
+                         stdout=subprocess.PIPE,
+                         stdin=subprocess.PIPE,
+                         stderr=subprocess.STDOUT)
+    reformatted_code, stderrdata = p.communicate(b'x  =  1\r\ny=2')
+    self.assertIsNone(stderrdata)
+    self.assertEqual(reformatted_code.decode('utf-8'), u'x = 1\ny = 2\n')
+
+  def testStdinBatchWithLengthFraming(self):
+    documents = [b'x  =  1\n', b'def f(:\n', b'def g( a ):\n  return a\n']
+    p = subprocess.Popen(YAPF_BINARY + ['--stdin-batch=length'],
+                         stdout=subprocess.PIPE,
+                         stdin=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    output, _ = p.communicate(b''.join(
+        str(len(document)).encode('ascii') + b'\n' + document
+        for document in documents))
+    self.assertEqual(p.returncode, 1)
+
+    stream = py3compat.BytesIO(output)
+    self.assertEqual(stream.readline(), b'6\n')
+    self.assertEqual(stream.read(6), b'x = 1\n')
+    header = stream.readline()
+    self.assertTrue(header.startswith(b'E'))
+    self.assertIn(b'<stdin:1>', stream.read(int(header[1:])))
+    self.assertEqual(stream.readline(), b'23\n')
+    self.assertEqual(stream.read(), b'def g(a):\n    return a\n')
+
+  def testStdinBatchWithNulFraming(self):
+    p = subprocess.Popen(YAPF_BINARY + ['--stdin-batch=nul'],
+                         stdout=subprocess.PIPE,
+                         stdin=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    output, stderrdata = p.communicate(b'x  =  1\n\0def f(:\n\0y=2')
+    self.assertEqual(p.returncode, 1)
+    self.assertEqual(output, b'x = 1\n\0def f(:\n\0y = 2\n\0')
+    self.assertIn(b'<stdin:1>', stderrdata)
+
   def testSetGoogleStyle(self):
     unformatted_code = textwrap.dedent(u"""\
         def foo(): # trail